@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2016 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Micro-benchmark of the iperf output parser.
+
+Compares the single-pass compiled grammar used by
+:func:`topology_lib_iperf.parser.parse_iperf_server` against the previous
+line by line implementation on a synthetic log::
+
+    python benchmarks/bench_parser.py --lines 1000000
+"""
+
+from __future__ import unicode_literals, absolute_import
+from __future__ import print_function, division
+
+from re import search
+from argparse import ArgumentParser
+
+try:
+    from time import process_time as timer
+except ImportError:
+    from timeit import default_timer as timer
+
+from topology_lib_iperf.parser import parse_iperf_server
+
+
+HEADER = """\
+------------------------------------------------------------
+Server listening on TCP port 5100
+TCP window size: 85.3 KByte (default)
+------------------------------------------------------------
+[  4] local 127.0.0.1 port 5100 connected with 127.0.0.1 port 38040
+[ ID] Interval       Transfer     Bandwidth
+"""
+
+
+def synthetic_log(lines):
+    """
+    Build a synthetic iperf server log with the given number of intervals.
+    """
+    intervals = [
+        '[  4] {:4.1f}-{:4.1f} sec  1.84 GBytes  15.8 Gbits/sec\n'.format(
+            second, second + 1.0
+        )
+        for second in range(lines)
+    ]
+    return HEADER + ''.join(intervals)
+
+
+def legacy_parse_iperf_server(raw_output):
+    """
+    Line by line parser as implemented before the compiled grammar.
+    """
+    result = {}
+
+    base_info_re = r'\[\s*[0-9]+\] local (?P<server>.*) port ' \
+        r'(?P<server_port>\d+) connected with (?P<client>.*) port ' \
+        r'(?P<client_port>.*)'
+
+    base_result = search(base_info_re, raw_output)
+    assert base_result
+    result.update(base_result.groupdict())
+
+    traffic_re = (
+        r'sec  (?P<transfer>[.\d]+ .*?)  (?P<bandwidth>[.\d]+ .+)'
+    )
+
+    cont = 0
+    result['traffic'] = {}
+    for raw_line in raw_output.splitlines():
+        traffic_reg_result = search(traffic_re, raw_line)
+        if traffic_reg_result:
+            result['traffic'][str(cont)] = traffic_reg_result.groupdict()
+            cont += 1
+
+    return result
+
+
+def measure(func, raw, repeat):
+    """
+    Return the best processor time of ``repeat`` calls of ``func(raw)``, not
+    to count the time other processes take the processor.
+    """
+    best = None
+    for _ in range(repeat):
+        start = timer()
+        func(raw)
+        elapsed = timer() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--lines', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    raw = synthetic_log(args.lines)
+    assert legacy_parse_iperf_server(raw) == parse_iperf_server(raw)
+
+    legacy = measure(legacy_parse_iperf_server, raw, args.repeat)
+    grammar = measure(parse_iperf_server, raw, args.repeat)
+
+    print('lines:    {}'.format(args.lines))
+    print('legacy:   {:.3f} s'.format(legacy))
+    print('grammar:  {:.3f} s'.format(grammar))
+    print('speedup:  {:.2f}x'.format(legacy / grammar))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,367 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2016 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Benchmark suite of the parsers and of the library overhead.
+
+Parses synthetic iperf and iperf3 logs of increasing size and stream count,
+measuring lines per second and peak memory, then drives the library against
+a stub engine node with a simulated latency, measuring the time each call
+spends besides waiting for the node::
+
+    python benchmarks/bench_suite.py --output results.json
+    python benchmarks/bench_suite.py --compare results.json
+
+Peak memory is measured with tracemalloc, which requires Python 3.4 or
+later.
+"""
+
+from __future__ import unicode_literals, absolute_import
+from __future__ import print_function, division
+
+from io import open
+from json import dumps, load
+from time import sleep
+from platform import platform, python_version
+from timeit import default_timer
+from argparse import ArgumentParser
+
+from topology_lib_iperf import library
+from topology_lib_iperf.parser import (
+    parse_iperf_server, parse_iperf_client,
+    parse_iperf3_server, parse_iperf3_client
+)
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+SERVER_HEADER = """\
+------------------------------------------------------------
+Server listening on TCP port 5001
+TCP window size: 85.3 KByte (default)
+------------------------------------------------------------
+"""
+
+CLIENT_HEADER = """\
+------------------------------------------------------------
+Client connecting to 10.0.0.2, TCP port 5001
+TCP window size: 85.0 KByte (default)
+------------------------------------------------------------
+"""
+
+CONNECTION = (
+    '[{stream:3d}] local {local} port {local_port} connected with '
+    '{remote} port {remote_port}\n'
+)
+
+INTERVAL = '[{stream:>3}] {start:4.1f}-{end:4.1f} sec  1.84 GBytes  ' \
+    '15.8 Gbits/sec\n'
+
+
+def iperf_log(local, intervals, streams):
+    """
+    Build a synthetic iperf log.
+
+    :param str local: ``'server'`` or ``'client'``.
+    :param int intervals: Number of one second intervals.
+    :param int streams: Number of parallel streams. With more than one, each
+     interval has an aggregate ``[SUM]`` line.
+    :rtype: str
+    """
+    ids = range(3, 3 + streams)
+    addresses = ('10.0.0.2', '10.0.0.1')
+    if local == 'client':
+        addresses = addresses[::-1]
+
+    lines = [SERVER_HEADER if local == 'server' else CLIENT_HEADER]
+    for stream in ids:
+        ports = (5001, 40000 + stream)
+        if local == 'client':
+            ports = ports[::-1]
+        lines.append(CONNECTION.format(
+            stream=stream, local=addresses[0], local_port=ports[0],
+            remote=addresses[1], remote_port=ports[1]
+        ))
+
+    for second in range(intervals + 1):
+        # The last round is the summary of the whole run
+        start, end = (0, intervals) if second == intervals else (
+            second, second + 1
+        )
+        for stream in ids:
+            lines.append(INTERVAL.format(stream=stream, start=start, end=end))
+        if streams > 1:
+            lines.append(INTERVAL.format(stream='SUM', start=start, end=end))
+
+    return ''.join(lines)
+
+
+def iperf3_log(local, intervals, streams):
+    """
+    Build a synthetic iperf3 JSON log, indented like iperf3 does.
+
+    See :func:`iperf_log`.
+    """
+    sockets = range(5, 5 + streams)
+    hosts = [('10.0.0.2', 5201), ('10.0.0.1', 40000)]
+    if local == 'client':
+        hosts = hosts[::-1]
+
+    def interval(start, end):
+        streams = [
+            {
+                'socket': socket, 'start': start, 'end': end,
+                'seconds': end - start, 'bytes': 1975684956,
+                'bits_per_second': 15.8e9, 'omitted': False,
+            }
+            for socket in sockets
+        ]
+        return {'streams': streams, 'sum': dict(streams[0], socket=None)}
+
+    data = {
+        'start': {
+            'connected': [
+                {
+                    'socket': socket,
+                    'local_host': hosts[0][0],
+                    'local_port': hosts[0][1] + socket,
+                    'remote_host': hosts[1][0],
+                    'remote_port': hosts[1][1] + socket,
+                }
+                for socket in sockets
+            ],
+        },
+        'intervals': [
+            interval(second, second + 1) for second in range(intervals)
+        ],
+        'end': {
+            'sum_sent': interval(0, intervals)['sum'],
+            'sum_received': interval(0, intervals)['sum'],
+        },
+    }
+    return dumps(data, indent=1)
+
+
+PARSERS = {
+    'iperf': (iperf_log, parse_iperf_server, parse_iperf_client),
+    'iperf3': (iperf3_log, parse_iperf3_server, parse_iperf3_client),
+}
+
+
+def best_time(func, argument, repeat):
+    """
+    Get the best wall time of ``repeat`` calls of ``func(argument)``.
+    """
+    best = None
+    for _ in range(repeat):
+        start = default_timer()
+        func(argument)
+        elapsed = default_timer() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def peak_memory(func, argument):
+    """
+    Get the peak memory allocated by ``func(argument)`` in bytes, or
+    ``None`` without tracemalloc.
+    """
+    if tracemalloc is None:
+        return None
+
+    tracemalloc.start()
+    try:
+        func(argument)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_parsers(sizes, streams, repeat):
+    """
+    Measure every parser on logs of every size and stream count.
+
+    :rtype: dict
+    :return: Measures by ``'backend/side/intervals/streams'`` name.
+    """
+    results = {}
+    for backend, (generate, parse_server, parse_client) in sorted(
+            PARSERS.items()):
+        for local, parse in (('server', parse_server),
+                             ('client', parse_client)):
+            for size in sizes:
+                for count in streams:
+                    raw = generate(local, size, count)
+                    lines = raw.count('\n') + 1
+                    seconds = best_time(parse, raw, repeat)
+
+                    name = '{}/{}/{}/{}'.format(backend, local, size, count)
+                    results[name] = {
+                        'lines': lines,
+                        'bytes': len(raw),
+                        'seconds': seconds,
+                        'lines_per_second': lines / seconds,
+                        'peak_memory': peak_memory(parse, raw),
+                    }
+    return results
+
+
+class StubEnode(object):
+    """
+    Engine node stub answering after a fixed latency.
+
+    :param float latency: Seconds each call takes.
+    :param str output: Log returned by ``cat``.
+    """
+
+    identifier = 'stub'
+
+    def __init__(self, latency, output):
+        self.latency = latency
+        self.output = output
+        self.calls = 0
+
+    def __call__(self, command, shell=None):
+        self.calls += 1
+        if self.latency:
+            sleep(self.latency)
+        if command.startswith('iperf'):
+            return '[1] 1234'
+        if 'cat ' in command:
+            return self.output
+        return ''
+
+
+def bench_library(latency, iterations, intervals):
+    """
+    Measure a server and client session against a :class:`StubEnode`.
+
+    :rtype: dict
+    :return: Measures by ``'batch'`` and ``'sequential'`` stop mode.
+    """
+    output = iperf_log('client', intervals, 1)
+
+    results = {}
+    for mode, batch in (('sequential', False), ('batch', True)):
+        enode = StubEnode(latency, output)
+
+        start = default_timer()
+        for _ in range(iterations):
+            library.server_start(enode, port=5001, instance_id=1)
+            library.client_start(enode, '10.0.0.2', 5001, instance_id=1)
+            library.client_stop(enode, batch=batch)
+            library.server_stop(enode, batch=batch)
+        elapsed = default_timer() - start
+
+        results[mode] = {
+            'session_seconds': elapsed / iterations,
+            'enode_calls': enode.calls / iterations,
+            'overhead_seconds': (elapsed - enode.calls * latency) / iterations,
+        }
+    return results
+
+
+def compare(previous, current):
+    """
+    Print the ratio of the current measures to the previous ones.
+    """
+    print('\n{:<32} {:>12} {:>12} {:>8}'.format(
+        'parser', 'before l/s', 'after l/s', 'ratio'
+    ))
+    for name, measure in sorted(current['parsers'].items()):
+        before = previous['parsers'].get(name)
+        if before is None:
+            continue
+        print('{:<32} {:>12.0f} {:>12.0f} {:>7.2f}x'.format(
+            name, before['lines_per_second'], measure['lines_per_second'],
+            measure['lines_per_second'] / before['lines_per_second']
+        ))
+
+    print('\n{:<32} {:>12} {:>12} {:>8}'.format(
+        'library', 'before s', 'after s', 'ratio'
+    ))
+    for name, measure in sorted(current['library'].items()):
+        before = previous['library'].get(name)
+        if before is None:
+            continue
+        print('{:<32} {:>12.6f} {:>12.6f} {:>7.2f}x'.format(
+            name, before['overhead_seconds'], measure['overhead_seconds'],
+            measure['overhead_seconds'] / before['overhead_seconds']
+        ))
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        '--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+        help='intervals of the synthetic logs'
+    )
+    parser.add_argument(
+        '--streams', type=int, nargs='+', default=[1, 4],
+        help='parallel streams of the synthetic logs'
+    )
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument(
+        '--latency', type=float, default=0.001,
+        help='seconds each stub engine node call takes'
+    )
+    parser.add_argument('--iterations', type=int, default=100)
+    parser.add_argument('--output', help='file to save the results to')
+    parser.add_argument('--compare', help='results file to compare to')
+    args = parser.parse_args()
+
+    results = {
+        'python': python_version(),
+        'platform': platform(),
+        'parsers': bench_parsers(args.sizes, args.streams, args.repeat),
+        'library': bench_library(args.latency, args.iterations, 10),
+    }
+
+    print('{:<32} {:>10} {:>12} {:>12}'.format(
+        'parser', 'lines', 'lines/s', 'peak KiB'
+    ))
+    for name, measure in sorted(results['parsers'].items()):
+        peak = measure['peak_memory']
+        print('{:<32} {:>10} {:>12.0f} {:>12}'.format(
+            name, measure['lines'], measure['lines_per_second'],
+            '-' if peak is None else peak // 1024
+        ))
+
+    print('\n{:<12} {:>12} {:>12} {:>12}'.format(
+        'library', 'session s', 'enode calls', 'overhead s'
+    ))
+    for name, measure in sorted(results['library'].items()):
+        print('{:<12} {:>12.6f} {:>12.0f} {:>12.6f}'.format(
+            name, measure['session_seconds'], measure['enode_calls'],
+            measure['overhead_seconds']
+        ))
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as fd:
+            compare(load(fd), results)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as fd:
+            fd.write(dumps(results, indent=4, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main()
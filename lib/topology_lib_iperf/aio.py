@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2016 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+asyncio counterparts of the library functions.
+
+Each function takes the same arguments as its
+:mod:`topology_lib_iperf.library` counterpart and returns an asyncio future
+of its result, so it can be awaited from a coroutine without blocking the
+event loop:
+
+::
+
+    server = yield from aio.server_start(hs1, ready_timeout=5)
+    yield from aio.client_start(hs2, '10.0.0.1', server['port'])
+
+The blocking engine node calls run in a thread pool bounded by
+:data:`MAX_WORKERS`, shared by all sessions. Engine node shells are not
+thread safe, so the calls for a given node are queued and run one after the
+other, while waiting ones hold no thread. The library functions run as is,
+so the instances share the :class:`topology_lib_iperf.library.IperfState`
+of the node with the blocking API.
+
+Requires Python 3.4 or later.
+"""
+
+from __future__ import unicode_literals, absolute_import
+from __future__ import print_function, division
+
+from functools import partial
+from weakref import WeakKeyDictionary
+
+from . import library
+
+try:
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    asyncio = None
+
+
+MAX_WORKERS = 16
+"""
+Maximum number of threads running blocking engine node calls at once.
+"""
+
+_executor = None
+
+_queues = WeakKeyDictionary()
+"""
+Future of the end of the last call queued for each engine node, done once
+the call is cancelled before it runs or its thread returns.
+"""
+
+
+def _get_executor():
+    global _executor
+
+    if _executor is None:
+        _executor = ThreadPoolExecutor(MAX_WORKERS)
+    return _executor
+
+
+def _transfer(source, target):
+    if target.cancelled():
+        return
+    if source.cancelled():
+        target.cancel()
+    elif source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
+
+
+def _submit(function, enode, *args, **kwargs):
+    """
+    Queue a call of a library function for an engine node.
+
+    Must be called from the thread running the event loop.
+
+    :return: An asyncio future of the function result.
+    """
+    assert asyncio is not None, 'asyncio is not available'
+
+    loop = asyncio.get_event_loop()
+    future = asyncio.Future(loop=loop)
+    finished = asyncio.Future(loop=loop)
+    previous = _queues.get(enode)
+
+    # Cancelling the future does not stop a running thread, so the next
+    # call waits for the thread and not for the future
+    def dequeue(_=None):
+        finished.set_result(None)
+        if _queues.get(enode) is finished:
+            del _queues[enode]
+
+    def run(_=None):
+        if future.cancelled():
+            dequeue()
+            return
+        call = loop.run_in_executor(
+            _get_executor(), partial(function, enode, *args, **kwargs)
+        )
+        call.add_done_callback(partial(_transfer, target=future))
+        call.add_done_callback(dequeue)
+
+    _queues[enode] = finished
+
+    if previous is None or previous.done():
+        run()
+    else:
+        previous.add_done_callback(run)
+
+    return future
+
+
+def server_start(enode, *args, **kwargs):
+    """
+    Start iperf server.
+
+    See :func:`topology_lib_iperf.library.server_start`.
+    """
+    return _submit(library.server_start, enode, *args, **kwargs)
+
+
+def server_stop(enode, *args, **kwargs):
+    """
+    Stop iperf server.
+
+    See :func:`topology_lib_iperf.library.server_stop`.
+    """
+    return _submit(library.server_stop, enode, *args, **kwargs)
+
+
+def server_wait(enode, *args, **kwargs):
+    """
+    Wait for an iperf server to listen.
+
+    See :func:`topology_lib_iperf.library.server_wait`.
+    """
+    return _submit(library.server_wait, enode, *args, **kwargs)
+
+
+def client_start(enode, *args, **kwargs):
+    """
+    Use iperf client.
+
+    See :func:`topology_lib_iperf.library.client_start`.
+    """
+    return _submit(library.client_start, enode, *args, **kwargs)
+
+
+def client_stop(enode, *args, **kwargs):
+    """
+    Stop iperf client.
+
+    See :func:`topology_lib_iperf.library.client_stop`.
+    """
+    return _submit(library.client_stop, enode, *args, **kwargs)
+
+
+__all__ = [
+    'MAX_WORKERS',
+    'server_start',
+    'server_stop',
+    'server_wait',
+    'client_start',
+    'client_stop'
+]
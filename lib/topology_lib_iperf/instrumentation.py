@@ -0,0 +1,352 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2016 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Timing instrumentation of the library calls.
+
+The library functions measure the wall time of each phase of their work and
+report it to the registered hooks as an event dictionary:
+
+::
+
+    {
+        'node': 'hs1',
+        'call': 'client_stop',
+        'phase': 'fetch',
+        'seconds': 0.0213,
+        'bytes': 48211
+    }
+
+Where ``node`` is the engine node identifier, ``call`` the library function
+and ``phase`` one of :data:`PHASES`. ``bytes`` is the size of the output
+fetched or parsed, or ``None``. Nothing is measured while no hook is
+registered.
+
+The parse functions of :mod:`topology_lib_iperf.parser` and
+:meth:`topology_lib_iperf.parser.IperfParser.feed` report their ``parse``
+phase too, with a ``None`` node as they do not know it. A phase
+measured within the same phase, like a parse function called by the
+library, is only reported by the outer measure, so it is not counted twice.
+
+:class:`Metrics` is a hook that keeps a :class:`Histogram` of each node, call
+and phase in memory:
+
+::
+
+    with Metrics() as metrics:
+        run_traffic_matrix(matrix)
+
+    metrics.summary()
+    metrics.slowest_nodes('enode')
+"""
+
+from __future__ import unicode_literals, absolute_import
+from __future__ import print_function, division
+
+from bisect import bisect_left
+from timeit import default_timer
+from threading import local
+
+
+PHASES = ('build', 'enode', 'pid', 'fetch', 'parse')
+"""
+Measured phases: command build, engine node call, PID parse, log fetch and
+output parse.
+"""
+
+BUCKETS = tuple(1e-6 * 2 ** exponent for exponent in range(28))
+"""
+Upper bounds in seconds of the :class:`Histogram` buckets, doubling from a
+microsecond to about two minutes.
+"""
+
+_hooks = []
+
+# Phases being measured by the current thread
+_measuring = local()
+
+
+def add_hook(hook):
+    """
+    Register a callable to receive the events of every measured phase.
+
+    :param hook: Callable taking the event dictionary.
+    """
+    _hooks.append(hook)
+
+
+def remove_hook(hook):
+    """
+    Unregister a hook added with :func:`add_hook`.
+    """
+    _hooks.remove(hook)
+
+
+class _Measure(object):
+    """
+    Context manager timing a phase and reporting it to the hooks.
+
+    The ``bytes`` attribute can be set within the block.
+    """
+
+    __slots__ = ('enode', 'call', 'phase', 'bytes', 'start')
+
+    def __init__(self, enode, call, phase):
+        self.enode = enode
+        self.call = call
+        self.phase = phase
+        self.bytes = None
+
+    def __enter__(self):
+        _measuring.phases = _measuring_phases() | {self.phase}
+        self.start = default_timer()
+        return self
+
+    def __exit__(self, *exc_info):
+        _measuring.phases = _measuring_phases() - {self.phase}
+        event = {
+            'node': getattr(self.enode, 'identifier', None),
+            'call': self.call,
+            'phase': self.phase,
+            'seconds': default_timer() - self.start,
+            'bytes': self.bytes,
+        }
+        for hook in list(_hooks):
+            hook(event)
+
+
+class _NoMeasure(object):
+    """
+    Context manager used while no hook is registered.
+    """
+
+    bytes = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_no_measure = _NoMeasure()
+
+
+def _measuring_phases():
+    return getattr(_measuring, 'phases', frozenset())
+
+
+def measure(enode, call, phase):
+    """
+    Measure a phase of a library call.
+
+    ::
+
+        with measure(enode, 'client_stop', 'fetch') as phase:
+            output = enode(cat, shell=shell)
+            phase.bytes = len(output)
+
+    :param enode: Engine node the call is for, or ``None``.
+    :param str call: Name of the library function.
+    :param str phase: One of :data:`PHASES`.
+    """
+    if not _hooks or phase in _measuring_phases():
+        return _no_measure
+    return _Measure(enode, call, phase)
+
+
+class Histogram(object):
+    """
+    Histogram of durations with fixed exponential buckets.
+
+    :param tuple bounds: Sorted upper bounds of the buckets in seconds. Longer
+     durations are counted in an extra last bucket.
+    """
+
+    def __init__(self, bounds=BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.bytes = 0
+
+    def add(self, seconds, size=None):
+        """
+        Count a duration.
+
+        :param float seconds: Duration.
+        :param int size: Bytes transferred or parsed, if any.
+        """
+        self.counts[bisect_left(self.bounds, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if self.max is None or seconds > self.max:
+            self.max = seconds
+        if size:
+            self.bytes += size
+
+    def merge(self, other):
+        """
+        Add the counts of another histogram with the same bounds.
+        """
+        assert self.bounds == other.bounds
+        if not other.count:
+            return
+
+        self.counts = [
+            mine + theirs for mine, theirs in zip(self.counts, other.counts)
+        ]
+        self.count += other.count
+        self.total += other.total
+        self.bytes += other.bytes
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def percentile(self, percent):
+        """
+        Estimate a percentile as the upper bound of the bucket holding it,
+        capped to the maximum duration.
+
+        :param float percent: Percentile, from 0 to 100.
+        :rtype: float
+        """
+        if not self.count:
+            return None
+
+        rank = percent / 100 * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if count and seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def as_dict(self):
+        """
+        :rtype: dict
+        :return: Count, total, mean, minimum, maximum, median and 99th
+         percentile durations, and bytes.
+        """
+        return {
+            'count': self.count,
+            'total': self.total,
+            'mean': self.total / self.count if self.count else None,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.percentile(50),
+            'p99': self.percentile(99),
+            'bytes': self.bytes,
+        }
+
+
+class Metrics(object):
+    """
+    Hook keeping a :class:`Histogram` of each node, call and phase.
+
+    Used as a context manager, it is registered with :func:`add_hook` on
+    enter and removed on exit.
+    """
+
+    def __init__(self, bounds=BUCKETS):
+        self.bounds = bounds
+        self.histograms = {}
+
+    def __call__(self, event):
+        key = (event['node'], event['call'], event['phase'])
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(self.bounds)
+        histogram.add(event['seconds'], event['bytes'])
+
+    def __enter__(self):
+        add_hook(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        remove_hook(self)
+
+    def histogram(self, node=None, call=None, phase=None):
+        """
+        Merge the histograms matching the given node, call and phase. Fields
+        left as ``None`` match anything.
+
+        :rtype: Histogram
+        """
+        merged = Histogram(self.bounds)
+        for key, histogram in self.histograms.items():
+            if all(
+                wanted is None or wanted == value
+                for wanted, value in zip((node, call, phase), key)
+            ):
+                merged.merge(histogram)
+        return merged
+
+    def summary(self, by=('call', 'phase')):
+        """
+        Summarize the durations grouped by some of the event fields.
+
+        :param tuple by: Fields among ``'node'``, ``'call'`` and ``'phase'``.
+        :rtype: dict
+        :return: :meth:`Histogram.as_dict` of each group, by tuple of the
+         field values.
+        """
+        fields = ('node', 'call', 'phase')
+        indexes = [fields.index(field) for field in by]
+
+        groups = {}
+        for key, histogram in self.histograms.items():
+            group = tuple(key[index] for index in indexes)
+            if group not in groups:
+                groups[group] = Histogram(self.bounds)
+            groups[group].merge(histogram)
+
+        return {
+            group: histogram.as_dict() for group, histogram in groups.items()
+        }
+
+    def slowest_nodes(self, phase=None, count=5):
+        """
+        Get the nodes that spent the most time in a phase.
+
+        :param str phase: Phase to rank by, or ``None`` for all of them.
+        :param int count: Number of nodes to return.
+        :rtype: list
+        :return: ``(node, seconds)`` tuples, slowest first.
+        """
+        totals = {}
+        for (node, _, key_phase), histogram in self.histograms.items():
+            if phase is None or key_phase == phase:
+                totals[node] = totals.get(node, 0.0) + histogram.total
+
+        return sorted(
+            totals.items(), key=lambda item: item[1], reverse=True
+        )[:count]
+
+
+__all__ = [
+    'PHASES',
+    'BUCKETS',
+    'add_hook',
+    'remove_hook',
+    'measure',
+    'Histogram',
+    'Metrics'
+]
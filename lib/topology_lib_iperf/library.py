@@ -22,85 +22,604 @@ topology_lib_iperf communication library implementation.
 from __future__ import unicode_literals, absolute_import
 from __future__ import print_function, division
 
+from re import search
+from posixpath import basename, join
+from time import sleep
+from timeit import default_timer
+
 from topology.libraries.utils import stateprovider
 
-from .parser import parse_pid, parse_iperf_server, parse_iperf_client
+from .instrumentation import measure
+from .parser import (
+    BATCH_MARKER, GzipDecoder, IperfParser, collect_records, parse_batch,
+    parse_pid, to_bps,
+    parse_iperf_server, parse_iperf_client,
+    parse_iperf3_server, parse_iperf3_client
+)
+from .process import (
+    STOP_TIMEOUT, alive_command, parse_alive, terminate_command
+)
+from .tuning import tuning_arguments
+
+
+BACKENDS = {
+    'iperf': (parse_iperf_server, parse_iperf_client),
+    'iperf3': (parse_iperf3_server, parse_iperf3_client),
+}
+"""
+Supported iperf binaries and their server and client output parsers.
+"""
+
+SERVER_LOG = '/tmp/iperf_server-{}.log'
+"""
+Log file of each iperf server instance.
+"""
+
+CLIENT_LOG = '/tmp/iperf_client-{}.log'
+"""
+Log file of each iperf client instance.
+"""
+
+COMPRESSOR_SETTLE = 5
+"""
+Maximum seconds to wait for the compressor of a log to finish writing it once
+its instance is killed.
+"""
+
+BASE_PORT = 5001
+"""
+First port handed out by :meth:`IperfState.allocate_port`, the iperf default.
+"""
+
+READY_BACKOFF = (0.01, 0.5)
+"""
+Initial and maximum seconds between readiness checks of :func:`server_wait`.
+The delay doubles after every check.
+"""
+
+REPORT_LINE_RE = \
+    r'^(\[ *([0-9]+|SUM)\] |Server listening on |Client connecting to )'
+"""
+Extended regular expression matching the lines iperf writes for a stream and
+the connection headers, the only ones read by
+:func:`topology_lib_iperf.parser.iter_iperf_server`.
+"""
+
+LAST_INTERVALS_AWK = (
+    '$0 == "BATCH_MARKER" { pass = 1; split("", end_of); split("", report); '
+    'next } '
+    '!/REPORT_LINE/ { next } '
+    '{ id = $0; sub(/\\].*/, "", id); sub(/^\\[ */, "", id); interval = 0 } '
+    '/ connected with / { delete end_of[id] } '
+    '/ Server Report:/ { report[id] = 1 } '
+    '/ sec / && !/ datagrams / && !/ Server Report:/ { '
+    'span = $0; sub(/^[^\\]]*\\] */, "", span); sub(/ *sec .*/, "", span); '
+    'split(span, bounds, "-"); '
+    'if (id in report) delete report[id]; '
+    'else if (!(id in end_of) || bounds[1] + 0 >= end_of[id] + 0) '
+    '{ end_of[id] = bounds[2]; interval = 1 } } '
+    '!pass { if (interval) total[id]++; next } '
+    'interval && ++seen[id] <= total[id] - last { next } '
+    '{ print }'
+).replace('REPORT_LINE', REPORT_LINE_RE).replace('BATCH_MARKER', BATCH_MARKER)
+"""
+awk program keeping the stream lines of an iperf log, but only the last
+``last`` intervals of each stream. Intervals are told from summaries like
+the parser does, by their start going back. The log is read twice from the
+standard input, separated by :data:`BATCH_MARKER`, first to count the
+intervals of each stream.
+"""
+
+
+def _log_path(template, instance_id, log_dir, compress):
+    """
+    Get the log file of an instance.
+    """
+    log = template.format(instance_id)
+    if log_dir is not None:
+        log = join(log_dir, basename(log))
+    return log + '.gz' if compress else log
+
+
+def _capture(command, log, compress):
+    """
+    Get the command running an instance in background with its output
+    redirected to its log.
+
+    Compressed logs are written by gzip reading the instance output from a
+    FIFO. It runs in a subshell so the only PID printed is the instance's,
+    and it removes the FIFO once done.
+    """
+    if not compress:
+        return '{} 2>&1 > {} &'.format(command, log)
+
+    return (
+        'rm -f {fifo}; mkfifo {fifo} && '
+        '( {{ gzip -c < {fifo} > {log}; rm -f {fifo}; }} & ); '
+        '{command} > {fifo} 2>&1 &'
+    ).format(command=command, log=log, fifo=log + '.fifo')
+
+
+def _log_command(log, compress, reduce, last):
+    """
+    Get the command fetching a log, reduced on the node if asked to.
+
+    A compressed log is first given time to be completed by its compressor,
+    then either decompressed on the node to be reduced, or fetched as is
+    encoded in base64.
+    """
+    read = '{} {}'.format('gzip -dc' if compress else 'cat', log)
+
+    if last is not None:
+        # The parser tells a summary from an interval by its start going
+        # back, so the last interval of each stream must be kept
+        assert last > 0, 'At least the last interval must be kept'
+        command = "{{ {read}; echo {marker}; {read}; }} | " \
+            "awk -v last={last} '{program}'".format(
+                read=read, marker=BATCH_MARKER, last=int(last),
+                program=LAST_INTERVALS_AWK
+            )
+    elif reduce:
+        command = "{} | grep -E '{}'".format(read, REPORT_LINE_RE)
+    elif compress:
+        command = 'base64 {}'.format(log)
+    else:
+        return read
+
+    if not compress:
+        return command
+
+    return (
+        'i=0; while [ -e {fifo} ] && [ $i -lt {tries} ]; '
+        'do sleep 0.1; i=$((i + 1)); done; {command}'
+    ).format(
+        fifo=log + '.fifo', tries=COMPRESSOR_SETTLE * 10, command=command
+    )
+
+
+def _instance_log(logs, template, instance_id):
+    """
+    Get the log file of an instance and whether it is compressed.
+    """
+    return logs.get(instance_id, (template.format(instance_id), False))
+
+
+def _batch(*commands):
+    """
+    Join shell commands in a single invocation, with their outputs delimited
+    so :func:`topology_lib_iperf.parser.parse_batch` can split them.
+    """
+    return '; echo {}; '.format(BATCH_MARKER).join(commands)
 
 
 class IperfState(object):
     """
     State object for the iperf server & client.
+
+    Besides the running instances of the node, it allocates their instance
+    IDs and server ports, and keeps the pool of servers handed out by
+    :func:`server_acquire`.
     """
 
     def __init__(self):
         self.server_pids = {}
         self.client_pids = {}
+        self.server_backends = {}
+        self.client_backends = {}
+        self.server_tails = {}
+        self.client_tails = {}
+        self.server_ports = {}
+        self.server_pool = {}
+        self.server_launches = {}
+        self.server_logs = {}
+        self.client_logs = {}
+
+    @staticmethod
+    def allocate_instance(pids):
+        """
+        Get the lowest instance ID not running.
+
+        :param dict pids: ``server_pids`` or ``client_pids``.
+        :rtype: int
+        """
+        instance_id = 1
+        while instance_id in pids:
+            instance_id += 1
+        return instance_id
+
+    def allocate_port(self, base=BASE_PORT):
+        """
+        Get the lowest port from ``base`` not used by a server of the node.
+
+        :param int base: First port to consider.
+        :rtype: int
+        """
+        used = set(self.server_ports.values())
+        port = base
+        while port in used:
+            port += 1
+        return port
+
+
+def _launch(enode, call, command, shell):
+    """
+    Run the command backgrounding an iperf instance and get its PID.
+    """
+    with measure(enode, call, 'enode'):
+        output = enode(command, shell=shell)
+    with measure(enode, call, 'pid'):
+        return parse_pid(output)
+
+
+def _fetch(enode, call, command, shell):
+    """
+    Run a command fetching the output of an instance.
+    """
+    with measure(enode, call, 'fetch') as phase:
+        output = enode(command, shell=shell)
+        phase.bytes = len(output)
+    return output
+
+
+def _parse(enode, call, parse, output):
+    """
+    Parse the output of an instance.
+    """
+    with measure(enode, call, 'parse') as phase:
+        phase.bytes = len(output)
+        return parse(output)
+
+
+def _poll(enode, tails, instance_id, pid, log, local, numeric, shell):
+    """
+    Fetch and parse the bytes appended to an instance log since last poll.
+
+    The size of the log is read once and only the bytes up to it are
+    fetched, so the new offset is exact even if iperf writes in between.
+    The bytes are followed by an empty line and a marker, as shells strip
+    the trailing newlines of their output, which would join the last line
+    fetched to the next one. The bytes of a compressed log are fetched
+    encoded in base64 and decompressed as a stream. gzip writes in blocks,
+    so they lag behind the instance output.
+
+    The same invocation checks whether the instance is still running, and
+    records it under the ``alive`` key of its tail.
+    """
+    log, compress = log
+
+    tail = tails.get(instance_id)
+    if tail is None:
+        tail = tails[instance_id] = {
+            'offset': 0,
+            'parser': IperfParser(local, numeric=numeric),
+            'decoder': GzipDecoder() if compress else None,
+        }
+    offset = tail['offset']
+
+    call = '{}_poll'.format(local)
+    size, data, alive = parse_batch(_fetch(enode, call, _batch(
+        'size=$(wc -c < {log}); echo $size'.format(log=log),
+        'tail -c +{start} {log} | head -c $((size - {offset})){encode}; '
+        'echo'.format(
+            start=offset + 1, log=log, offset=offset,
+            encode=' | base64' if compress else ''
+        ),
+        alive_command([pid])
+    ), shell))[-3:]
+
+    # Drop the line end of the empty line echoed after the bytes
+    if data.endswith('\r\n'):
+        data = data[:-2]
+    elif data.endswith('\n'):
+        data = data[:-1]
+
+    size = search(r'(\d+)\s*$', size)
+    assert size, 'Unable to read the size of {}'.format(log)
+    tail['offset'] = max(offset, int(size.group(1)))
+    tail['alive'] = pid in parse_alive(alive)
+
+    if tail['decoder'] is not None:
+        data = tail['decoder'].feed(data)
+
+    return _parse(enode, call, tail['parser'].feed, data)
 
 
 @stateprovider(IperfState)
 def server_start(
     enode,
     state,
-    port,
+    port=None,
     interval=1,
     udp=False,
-    instance_id=1,
-    shell=None
+    instance_id=None,
+    shell=None,
+    backend='iperf',
+    ready_timeout=None,
+    log_dir=None,
+    compress=False,
+    tuning=None
 ):
     """
     Start iperf server.
 
     :param enode: Engine node to communicate with.
     :type enode: topology.platforms.base.BaseNode
-    :param int port: iperf port to be open.
+    :param int port: iperf port to be open. If ``None``, the lowest port
+     from :data:`BASE_PORT` not used by another server of the node.
     :param int interval: interval for iperf server to check.
     :param bool udp: If it is UDP or TCP. Default is False for TCP.
-    :param int instance_id: Number of iperf server instance.
+    :param int instance_id: Number of iperf server instance. If ``None``,
+     the lowest one not running.
     :param str shell: Shell name to execute commands.
      If ``None``, use the Engine Node default shell.
+    :param str backend: iperf binary to use, one of :data:`BACKENDS`.
+     ``'iperf3'`` writes its output as JSON and detects UDP tests on its own.
+    :param float ready_timeout: If set, wait up to this many seconds for the
+     server to listen with :func:`server_wait` before returning, so clients
+     can be started right away.
+    :param str log_dir: Directory of the log on the node. If ``None``, the
+     one of :data:`SERVER_LOG`.
+    :param bool compress: Compress the log with gzip on the node, for long
+     runs on nodes with little storage. It is also fetched compressed.
+    :param dict tuning: Tuning options of the server, like ``window`` or
+     ``bind``, as described in :data:`topology_lib_iperf.tuning.OPTIONS`.
+     iperf3 servers only accept ``bind`` and ``ipv6``.
+    :rtype: dict
+    :return: The port and instance ID of the server, and with
+     ``ready_timeout`` the seconds it took to listen:
+
+     ::
+
+        {
+            'port': 5001,
+            'instance_id': 1,
+            'startup': 0.023
+        }
     """
-    assert port
+    assert backend in BACKENDS
 
-    cmd = [
-        'iperf -s -p {port} -i {interval}'.format(**locals())
-    ]
+    if instance_id is None:
+        instance_id = state.allocate_instance(state.server_pids)
+    if port is None:
+        port = state.allocate_port()
+
+    assert instance_id not in state.server_pids, \
+        'iperf server instance {} is already running'.format(instance_id)
+    assert port not in state.server_ports.values(), \
+        'Port {} is already used by another iperf server'.format(port)
+
+    with measure(enode, 'server_start', 'build'):
+        cmd = [
+            '{backend} -s -p {port} -i {interval}'.format(**locals())
+        ]
 
-    if udp is True:
-        cmd.append('-u')
+        if backend == 'iperf3':
+            cmd.append('-J')
+        elif udp is True:
+            cmd.append('-u')
 
-    cmd.append('2>&1 > /tmp/iperf_server-{}.log &'.format(instance_id))
+        if tuning:
+            cmd.extend(tuning_arguments(tuning, 'server', backend, udp))
 
-    state.server_pids[instance_id] = parse_pid(
-        enode(' '.join(cmd), shell=shell)
+        log = _log_path(SERVER_LOG, instance_id, log_dir, compress)
+        cmd = _capture(' '.join(cmd), log, compress)
+
+    state.server_launches[instance_id] = default_timer()
+    state.server_pids[instance_id] = _launch(
+        enode, 'server_start', cmd, shell
     )
+    state.server_backends[instance_id] = backend
+    state.server_ports[instance_id] = port
+    state.server_logs[instance_id] = (log, compress)
+    state.server_tails.pop(instance_id, None)
+
+    server = {'port': port, 'instance_id': instance_id}
+    if ready_timeout is not None:
+        server['startup'] = server_wait(
+            enode, instance_id=instance_id, timeout=ready_timeout,
+            shell=shell
+        )
+    return server
 
 
 @stateprovider(IperfState)
-def server_stop(enode, state, instance_id=1, shell=None):
+def server_wait(enode, state, instance_id=1, timeout=5, shell=None):
     """
-    Stop iperf server.
+    Wait for an iperf server to listen.
+
+    The server log is checked for the ``Server listening`` banner and, as
+    iperf3 prints nothing before a test ends in JSON mode, the node sockets
+    for the server port. Checks back off from :data:`READY_BACKOFF`.
 
     :param enode: Engine node to communicate with.
     :type enode: topology.platforms.base.BaseNode
     :param int instance_id: Number of iperf server instance.
+    :param float timeout: Maximum seconds to wait.
     :param str shell: Shell name to execute commands.
      If ``None``, use the Engine Node default shell.
-    :return: A dictionary as returned by
-     :func:`topology_lib_iperf.parser.parse_iperf_server`.
+    :rtype: float
+    :return: Seconds from the launch of the server until it was found
+     listening.
+    :raises RuntimeError: If the server exits or does not listen in time.
     """
+    assert instance_id in state.server_pids
 
-    enode('kill -9 {pid}'.format(
+    log, compress = _instance_log(
+        state.server_logs, SERVER_LOG, instance_id
+    )
+    check = (
+        "{{ {read} {log} 2>/dev/null | grep -q 'Server listening' || "
+        "ss -ltnu 2>/dev/null | grep -q ':{port} '; }} && echo ready || "
+        "{{ kill -0 {pid} 2>/dev/null || echo exited; }}"
+    ).format(
+        read='gzip -dc' if compress else 'cat', log=log,
+        port=state.server_ports[instance_id],
         pid=state.server_pids[instance_id]
-    ), shell=shell)
-    del state.server_pids[instance_id]
+    )
 
-    return parse_iperf_server(
-        enode(
-            'cat /tmp/iperf_server-{}.log'.format(instance_id),
-            shell=shell
-        )
+    start = default_timer()
+    delay, max_delay = READY_BACKOFF
+
+    while True:
+        with measure(enode, 'server_wait', 'enode'):
+            output = enode(check, shell=shell)
+
+        # Match whole lines, not the job messages the shell may print
+        status = set(line.strip() for line in output.splitlines())
+        if 'ready' in status:
+            return default_timer() - state.server_launches.get(
+                instance_id, start
+            )
+
+        if 'exited' in status:
+            raise RuntimeError(
+                'iperf server instance {} exited: {}'.format(
+                    instance_id, _fetch(
+                        enode, 'server_wait',
+                        '{} {}'.format('gzip -dc' if compress else 'cat', log),
+                        shell
+                    )
+                )
+            )
+
+        if default_timer() - start >= timeout:
+            raise RuntimeError(
+                'iperf server instance {} not listening after {} '
+                'seconds'.format(instance_id, timeout)
+            )
+
+        sleep(delay)
+        delay = min(delay * 2, max_delay)
+
+
+def _check_reduce(backend, reduce, last):
+    """
+    Check that the log of an instance of a backend can be reduced as asked.
+    """
+    assert backend == 'iperf' or (not reduce and last is None), \
+        '{} JSON output cannot be reduced'.format(backend)
+
+
+def _forget_server(state, instance_id, reduce, last):
+    """
+    Remove a server from the state.
+
+    :return: Its PID, and its output parser and log as taken by
+     :func:`_stop`.
+    """
+    backend = state.server_backends.get(instance_id, 'iperf')
+    _check_reduce(backend, reduce, last)
+
+    pid = state.server_pids.pop(instance_id)
+    log, compress = _instance_log(
+        state.server_logs, SERVER_LOG, instance_id
     )
 
+    state.server_backends.pop(instance_id, None)
+    state.server_tails.pop(instance_id, None)
+    state.server_ports.pop(instance_id, None)
+    state.server_pool.pop(instance_id, None)
+    state.server_launches.pop(instance_id, None)
+    state.server_logs.pop(instance_id, None)
+
+    return pid, (BACKENDS[backend][0], log, compress)
+
+
+def _forget_client(state, instance_id, reduce, last):
+    """
+    Remove a client from the state.
+
+    See :func:`_forget_server`.
+    """
+    backend = state.client_backends.get(instance_id, 'iperf')
+    _check_reduce(backend, reduce, last)
+
+    pid = state.client_pids.pop(instance_id)
+    log, compress = _instance_log(
+        state.client_logs, CLIENT_LOG, instance_id
+    )
+
+    state.client_backends.pop(instance_id, None)
+    state.client_tails.pop(instance_id, None)
+    state.client_logs.pop(instance_id, None)
+
+    return pid, (BACKENDS[backend][1], log, compress)
+
+
+def _stop(enode, call, pids, logs, batch, reduce, last, timeout, shell):
+    """
+    Terminate processes, then fetch and parse their logs.
+
+    :param list pids: PIDs to terminate.
+    :param list logs: ``(parse, log, compress)`` of each log.
+    :return: The list of parsed logs.
+    """
+    terminate = terminate_command(pids, timeout)
+    fetches = [
+        _log_command(log, compress, reduce, last)
+        for _, log, compress in logs
+    ]
+
+    if batch:
+        outputs = parse_batch(
+            _fetch(enode, call, _batch(terminate, *fetches), shell)
+        )[-len(fetches):]
+    else:
+        with measure(enode, call, 'enode'):
+            enode(terminate, shell=shell)
+        outputs = [_fetch(enode, call, fetch, shell) for fetch in fetches]
+
+    results = []
+    for (parse, _, compress), output in zip(logs, outputs):
+        if compress and not reduce and last is None:
+            output = GzipDecoder().feed(output)
+        results.append(_parse(enode, call, parse, output))
+    return results
+
+
+@stateprovider(IperfState)
+def server_stop(
+        enode,
+        state,
+        instance_id=1,
+        shell=None,
+        batch=False,
+        reduce=False,
+        last=None,
+        timeout=STOP_TIMEOUT
+):
+    """
+    Stop iperf server.
+
+    The server is interrupted with ``SIGINT`` and only killed if it is still
+    running after ``timeout``.
+
+    :param enode: Engine node to communicate with.
+    :type enode: topology.platforms.base.BaseNode
+    :param int instance_id: Number of iperf server instance.
+    :param str shell: Shell name to execute commands.
+     If ``None``, use the Engine Node default shell.
+    :param bool batch: Stop the server and fetch its log in a single shell
+     invocation, saving a round-trip to the node.
+    :param bool reduce: Only fetch the stream lines of the log, the ones the
+     parser reads, filtering the rest out on the node. Not supported by
+     iperf3, whose JSON output cannot be reduced.
+    :param int last: Only fetch the last ``last`` intervals of each stream,
+     at least one, reducing the log on the node with awk. Connections and
+     summaries are always fetched. Implies ``reduce``, so it is not
+     supported by iperf3 either.
+    :param float timeout: Seconds to wait for the server to exit before
+     killing it. With ``0`` it is killed right away.
+    :return: A dictionary as returned by
+     :func:`topology_lib_iperf.parser.parse_iperf_server`, or by
+     :func:`topology_lib_iperf.parser.parse_iperf3_server` for iperf3.
+    """
+    pid, log = _forget_server(state, instance_id, reduce, last)
+    return _stop(
+        enode, 'server_stop', [pid], [log], batch, reduce, last, timeout,
+        shell
+    )[0]
+
 
 @stateprovider(IperfState)
 def client_start(
@@ -112,8 +631,16 @@ def client_start(
         time=10,
         udp=False,
         bandwidth=None,
-        instance_id=1,
-        shell=None
+        instance_id=None,
+        shell=None,
+        parallel=None,
+        backend='iperf',
+        log_dir=None,
+        compress=False,
+        dualtest=False,
+        tradeoff=False,
+        listen_port=None,
+        tuning=None
 ):
     """
     Use iperf client.
@@ -130,68 +657,664 @@ def client_start(
     :param str bandwidth: Bandwidth for iperf to use in bits/sec.
      When set automatically switches to UDP regardless of udp value.
      Default is None for 1Mbit/sec or ``'1M'`` on either UDP or TCP.
-    :param int instance_id: Number of iperf client instance.
+    :param int instance_id: Number of iperf client instance. If ``None``,
+     the lowest one not running.
     :param str shell: Shell name to execute commands.
      If ``None``, use the Engine Node default shell.
+    :param int parallel: Number of parallel client streams to run. The
+     result of :func:`client_stop` then holds the aggregate and each stream
+     traffic.
+    :param str backend: iperf binary to use, one of :data:`BACKENDS`.
+     ``'iperf3'`` writes its output as JSON.
+    :param str log_dir: Directory of the log on the node. If ``None``, the
+     one of :data:`CLIENT_LOG`.
+    :param bool compress: Compress the log with gzip on the node. See
+     :func:`server_start`.
+    :param bool dualtest: Run the test in both directions at once (``-d``).
+     The server connects back to the client, and the result of
+     :func:`client_stop` holds the server to client traffic under the
+     ``reverse`` key. Only supported by iperf.
+    :param bool tradeoff: Run the test in both directions one after the
+     other (``-r``), with the same result as ``dualtest``. Only supported by
+     iperf.
+    :param int listen_port: Port the client listens on for the reverse
+     traffic (``-L``). Default is ``port``.
+    :param dict tuning: Tuning options of the client, like ``window``,
+     ``length`` or ``nodelay``, as described in
+     :data:`topology_lib_iperf.tuning.OPTIONS`. With ``num``, the client
+     stops after sending that many bytes and ``time`` is ignored.
+    :rtype: int
+    :return: The instance ID of the client.
     """
 
     assert server
     assert port
+    assert backend in BACKENDS
+    assert not (dualtest and tradeoff), 'Choose either dualtest or tradeoff'
+    assert backend == 'iperf' or not (dualtest or tradeoff), \
+        'Dual and tradeoff tests are only supported by iperf'
 
-    cmd = [
-        'iperf -c {server} -p {port} -i {interval} -t {time}'.format(
-            **locals()
-        )
-    ]
+    if instance_id is None:
+        instance_id = state.allocate_instance(state.client_pids)
+
+    assert instance_id not in state.client_pids, \
+        'iperf client instance {} is already running'.format(instance_id)
+
+    with measure(enode, 'client_start', 'build'):
+        cmd = [
+            '{backend} -c {server} -p {port} -i {interval}'.format(
+                **locals()
+            )
+        ]
+
+        if not (tuning and tuning.get('num') is not None):
+            cmd.append('-t {}'.format(time))
+
+        if udp is True:
+            cmd.append('-u')
+
+        if bandwidth is not None:
+            cmd.append('-b {}'.format(bandwidth))
 
-    if udp is True:
-        cmd.append('-u')
+        if parallel is not None:
+            cmd.append('-P {}'.format(parallel))
 
-    if bandwidth is not None:
-        cmd.append('-b {}'.format(bandwidth))
+        if dualtest:
+            cmd.append('-d')
+        elif tradeoff:
+            cmd.append('-r')
 
-    cmd.append('2>&1 > /tmp/iperf_client-{}.log &'.format(instance_id))
+        if listen_port is not None:
+            cmd.append('-L {}'.format(listen_port))
 
-    state.client_pids[instance_id] = parse_pid(
-        enode(' '.join(cmd), shell=shell)
+        if tuning:
+            cmd.extend(tuning_arguments(
+                tuning, 'client', backend,
+                udp or (backend == 'iperf' and bandwidth is not None)
+            ))
+
+        if backend == 'iperf3':
+            cmd.append('-J')
+
+        log = _log_path(CLIENT_LOG, instance_id, log_dir, compress)
+        cmd = _capture(' '.join(cmd), log, compress)
+
+    state.client_pids[instance_id] = _launch(
+        enode, 'client_start', cmd, shell
     )
+    state.client_backends[instance_id] = backend
+    state.client_logs[instance_id] = (log, compress)
+    state.client_tails.pop(instance_id, None)
+
+    return instance_id
 
 
 @stateprovider(IperfState)
-def client_stop(enode, state, instance_id=1, shell=None):
+def client_stop(
+        enode,
+        state,
+        instance_id=1,
+        shell=None,
+        batch=False,
+        reduce=False,
+        last=None,
+        timeout=STOP_TIMEOUT
+):
     """
     Stop iperf client.
 
+    A client still running is interrupted with ``SIGINT``, so it prints the
+    summary of the traffic so far, and only killed if it is still running
+    after ``timeout``.
+
     :param enode: Engine node to communicate with.
     :type enode: topology.platforms.base.BaseNode
     :param int instance_id: Number of iperf client instance.
     :param str shell: Shell name to execute commands.
      If ``None``, use the Engine Node default shell.
+    :param bool batch: Stop the client and fetch its log in a single shell
+     invocation, saving a round-trip to the node.
+    :param bool reduce: Only fetch the stream lines of the log. See
+     :func:`server_stop`.
+    :param int last: Only fetch the last ``last`` intervals of each stream.
+     See :func:`server_stop`.
+    :param float timeout: Seconds to wait for the client to exit before
+     killing it. With ``0`` it is killed right away.
     :return: A dictionary as returned by
-     :func:`topology_lib_iperf.parser.parse_iperf_client`.
+     :func:`topology_lib_iperf.parser.parse_iperf_client`, or by
+     :func:`topology_lib_iperf.parser.parse_iperf3_client` for iperf3.
     """
+    pid, log = _forget_client(state, instance_id, reduce, last)
+    return _stop(
+        enode, 'client_stop', [pid], [log], batch, reduce, last, timeout,
+        shell
+    )[0]
+
 
-    pid_check = enode(
-        'ps -a | grep {pid}'.format(pid=state.client_pids[instance_id]),
-        shell=shell
+@stateprovider(IperfState)
+def instances_running(enode, state, shell=None):
+    """
+    Check which iperf instances of the node are still running.
+
+    All the instances are checked with ``kill -0`` in a single shell
+    invocation.
+
+    :param enode: Engine node to communicate with.
+    :type enode: topology.platforms.base.BaseNode
+    :param str shell: Shell name to execute commands.
+     If ``None``, use the Engine Node default shell.
+    :rtype: dict
+    :return: Whether each server and client instance is running:
+
+     ::
+
+        {
+            'servers': {1: True},
+            'clients': {1: False, 2: True}
+        }
+    """
+    pids = list(state.server_pids.values()) + list(state.client_pids.values())
+    alive = set()
+    if pids:
+        with measure(enode, 'instances_running', 'enode'):
+            output = enode(alive_command(pids), shell=shell)
+        alive = parse_alive(output)
+
+    return {
+        'servers': {
+            instance_id: pid in alive
+            for instance_id, pid in state.server_pids.items()
+        },
+        'clients': {
+            instance_id: pid in alive
+            for instance_id, pid in state.client_pids.items()
+        },
+    }
+
+
+@stateprovider(IperfState)
+def stop_all(
+        enode,
+        state,
+        reduce=False,
+        last=None,
+        timeout=STOP_TIMEOUT,
+        shell=None
+):
+    """
+    Stop all the iperf instances of the node in a single shell invocation.
+
+    Clients and servers are interrupted together, and the ones still running
+    after ``timeout`` are killed. Then all the logs are fetched in the same
+    invocation.
+
+    :param enode: Engine node to communicate with.
+    :type enode: topology.platforms.base.BaseNode
+    :param bool reduce: Only fetch the stream lines of the logs. See
+     :func:`server_stop`.
+    :param int last: Only fetch the last ``last`` intervals of each stream.
+     See :func:`server_stop`.
+    :param float timeout: Seconds to wait for the instances to exit before
+     killing them.
+    :param str shell: Shell name to execute commands.
+     If ``None``, use the Engine Node default shell.
+    :rtype: dict
+    :return: The result of each instance, as returned by
+     :func:`server_stop` and :func:`client_stop`:
+
+     ::
+
+        {
+            'servers': {1: {...}},
+            'clients': {1: {...}, 2: {...}}
+        }
+    """
+    servers = sorted(state.server_pids)
+    clients = sorted(state.client_pids)
+    if not servers and not clients:
+        return {'servers': {}, 'clients': {}}
+
+    # Check every instance before any is removed from the state
+    for backends, instance_ids in (
+            (state.server_backends, servers),
+            (state.client_backends, clients)):
+        for instance_id in instance_ids:
+            _check_reduce(
+                backends.get(instance_id, 'iperf'), reduce, last
+            )
+
+    pids = []
+    logs = []
+    for instance_id in servers:
+        pid, log = _forget_server(state, instance_id, reduce, last)
+        pids.append(pid)
+        logs.append(log)
+    for instance_id in clients:
+        pid, log = _forget_client(state, instance_id, reduce, last)
+        pids.append(pid)
+        logs.append(log)
+
+    results = _stop(
+        enode, 'stop_all', pids, logs, True, reduce, last, timeout, shell
     )
-    if 'Done' not in str(pid_check):
-        enode('kill -9 {pid}'.format(pid=state.client_pids[instance_id]),
-              shell=shell)
 
-    del state.client_pids[instance_id]
+    return {
+        'servers': dict(zip(servers, results[:len(servers)])),
+        'clients': dict(zip(clients, results[len(servers):])),
+    }
 
-    return parse_iperf_client(
-        enode(
-            'cat /tmp/iperf_client-{}.log'.format(instance_id),
-            shell=shell
+
+@stateprovider(IperfState)
+def server_poll(enode, state, instance_id=1, numeric=False, shell=None):
+    """
+    Parse the output of a running iperf server written since last poll.
+
+    The byte offset of the log already read is kept for each instance, so
+    each call only transfers and parses the new output. Lines still being
+    written are kept until they are complete. Only iperf instances can be
+    polled, as iperf3 writes its JSON output when a test ends.
+
+    :param enode: Engine node to communicate with.
+    :type enode: topology.platforms.base.BaseNode
+    :param int instance_id: Number of iperf server instance.
+    :param bool numeric: Parse traffic records as numbers. Only the value
+     given on the first poll of an instance is used.
+    :param str shell: Shell name to execute commands.
+     If ``None``, use the Engine Node default shell.
+    :rtype: list
+    :return: The new ``(kind, stream, record)`` tuples, as yielded by
+     :func:`topology_lib_iperf.parser.iter_iperf_server`.
+    """
+    assert instance_id in state.server_pids
+
+    assert state.server_backends.get(instance_id) == 'iperf', \
+        'iperf3 instances cannot be polled, they write their JSON output ' \
+        'only when a test ends'
+
+    return _poll(
+        enode, state.server_tails, instance_id,
+        state.server_pids[instance_id],
+        _instance_log(state.server_logs, SERVER_LOG, instance_id), 'server',
+        numeric, shell
+    )
+
+
+@stateprovider(IperfState)
+def client_poll(enode, state, instance_id=1, numeric=False, shell=None):
+    """
+    Parse the output of a running iperf client written since last poll.
+
+    See :func:`server_poll`, iperf3 clients cannot be polled either.
+
+    :param enode: Engine node to communicate with.
+    :type enode: topology.platforms.base.BaseNode
+    :param int instance_id: Number of iperf client instance.
+    :param bool numeric: Parse traffic records as numbers. Only the value
+     given on the first poll of an instance is used.
+    :param str shell: Shell name to execute commands.
+     If ``None``, use the Engine Node default shell.
+    :rtype: list
+    :return: The new ``(kind, stream, record)`` tuples, as yielded by
+     :func:`topology_lib_iperf.parser.iter_iperf_client`.
+    """
+    assert instance_id in state.client_pids
+
+    assert state.client_backends.get(instance_id) == 'iperf', \
+        'iperf3 instances cannot be polled, they write their JSON output ' \
+        'only when a test ends'
+
+    return _poll(
+        enode, state.client_tails, instance_id,
+        state.client_pids[instance_id],
+        _instance_log(state.client_logs, CLIENT_LOG, instance_id), 'client',
+        numeric, shell
+    )
+
+
+@stateprovider(IperfState)
+def server_acquire(
+        enode,
+        state,
+        interval=1,
+        udp=False,
+        backend='iperf',
+        shell=None
+):
+    """
+    Get a running iperf server from the pool of the node.
+
+    An idle pooled server with the same settings is reused, skipping its
+    output so far. Otherwise a new one is started with :func:`server_start`
+    on a free port and added to the pool. Give it back with
+    :func:`server_release` once its client is done, and stop the pool with
+    :func:`server_pool_stop`.
+
+    :param enode: Engine node to communicate with.
+    :type enode: topology.platforms.base.BaseNode
+    :param int interval: interval for iperf server to check.
+    :param bool udp: If it is UDP or TCP. Default is False for TCP.
+    :param str backend: iperf binary to use, one of :data:`BACKENDS`.
+    :param str shell: Shell name to execute commands.
+     If ``None``, use the Engine Node default shell.
+    :rtype: dict
+    :return: The server, as returned by :func:`server_start`, and whether
+     it was reused:
+
+     ::
+
+        {
+            'port': 5001,
+            'instance_id': 1,
+            'reused': True
+        }
+    """
+    settings = (interval, udp, backend)
+
+    for instance_id, pooled in sorted(state.server_pool.items()):
+        if pooled['busy'] or pooled['settings'] != settings:
+            continue
+
+        if backend == 'iperf':
+            server_poll(
+                enode, instance_id=instance_id, numeric=True, shell=shell
+            )
+
+        pooled['busy'] = True
+        return {
+            'port': state.server_ports[instance_id],
+            'instance_id': instance_id,
+            'reused': True,
+        }
+
+    server = server_start(
+        enode, interval=interval, udp=udp, backend=backend, shell=shell
+    )
+    state.server_pool[server['instance_id']] = {
+        'settings': settings,
+        'busy': True,
+    }
+    server['reused'] = False
+    return server
+
+
+@stateprovider(IperfState)
+def server_release(enode, state, instance_id, compact=False, shell=None):
+    """
+    Give back a server got with :func:`server_acquire` to the pool.
+
+    :param enode: Engine node to communicate with.
+    :type enode: topology.platforms.base.BaseNode
+    :param int instance_id: Number of iperf server instance.
+    :param bool compact: Return an
+     :class:`topology_lib_iperf.parser.IperfResult`.
+    :param str shell: Shell name to execute commands.
+     If ``None``, use the Engine Node default shell.
+    :return: The numeric result of the traffic received since the server was
+     acquired, as returned by
+     :func:`topology_lib_iperf.parser.parse_iperf_server`, or ``None`` if no
+     client connected or for iperf3, which writes its output only when it
+     stops.
+    """
+    pooled = state.server_pool[instance_id]
+    assert pooled['busy'], \
+        'iperf server instance {} is not acquired'.format(instance_id)
+    pooled['busy'] = False
+
+    if state.server_backends[instance_id] != 'iperf':
+        return None
+
+    records = server_poll(
+        enode, instance_id=instance_id, numeric=True, shell=shell
+    )
+    if not any(kind == 'connection' for kind, _, _ in records):
+        return None
+
+    return collect_records(records, compact=compact)
+
+
+@stateprovider(IperfState)
+def server_pool_stop(enode, state, batch=False, shell=None):
+    """
+    Stop all the servers of the pool of the node.
+
+    :param enode: Engine node to communicate with.
+    :type enode: topology.platforms.base.BaseNode
+    :param bool batch: Stop each server with a single shell invocation. See
+     :func:`server_stop`.
+    :param str shell: Shell name to execute commands.
+     If ``None``, use the Engine Node default shell.
+    :rtype: dict
+    :return: The result returned by :func:`server_stop` for each instance ID.
+    """
+    return {
+        instance_id: server_stop(
+            enode, instance_id=instance_id, batch=batch, shell=shell
         )
+        for instance_id in sorted(state.server_pool)
+    }
+
+
+def _check_interval(record, min_bandwidth, max_loss, max_jitter):
+    """
+    Check a traffic record against the watchdog limits.
+
+    :return: ``None`` if the interval is fine, ``'bandwidth'`` if it is below
+     the minimum bandwidth, or the reason to abort right away.
+    """
+    if max_loss is not None and record.get('loss') is not None:
+        loss = record['loss']
+        if not isinstance(loss, float):
+            loss = float(loss.rstrip('%'))
+        if loss > max_loss:
+            return 'loss {}% over {}%'.format(loss, max_loss)
+
+    if max_jitter is not None and record.get('jitter') is not None:
+        jitter = record['jitter']
+        if not isinstance(jitter, float):
+            jitter = float(jitter.split()[0])
+        if jitter > max_jitter:
+            return 'jitter {} ms over {} ms'.format(jitter, max_jitter)
+
+    if min_bandwidth is not None:
+        bps = record.get('bps')
+        if bps is None:
+            bps = to_bps(*record['bandwidth'].split()[:2])
+        if bps < min_bandwidth:
+            return 'bandwidth'
+
+    return None
+
+
+def _watch(
+        poll, alive, stop, min_bandwidth, intervals, max_loss, max_jitter,
+        poll_interval, timeout):
+    """
+    Poll an instance until it finishes or breaks a limit, then stop it.
+
+    :param alive: Callable telling whether the instance was running at the
+     last poll.
+
+    See :func:`client_watch`.
+    """
+    start = default_timer()
+    reason = None
+    finished = False
+
+    # Consecutive intervals below the minimum bandwidth for each stream.
+    # Once the aggregate of parallel streams shows up only it is checked.
+    below = {}
+    aggregate = False
+
+    exited = False
+    while reason is None and not finished:
+        for kind, stream, record in poll():
+            if kind == 'summary':
+                finished = True
+                continue
+
+            if kind != 'traffic':
+                continue
+
+            if stream == 'SUM' and not aggregate:
+                aggregate = True
+                below.clear()
+            elif aggregate and stream != 'SUM':
+                continue
+
+            failed = _check_interval(
+                record, min_bandwidth, max_loss, max_jitter
+            )
+            if failed is None:
+                below[stream] = 0
+                continue
+
+            if failed != 'bandwidth':
+                reason = failed
+                break
+
+            below[stream] = below.get(stream, 0) + 1
+            if below[stream] >= intervals:
+                reason = 'bandwidth below {} bps for {} intervals'.format(
+                    min_bandwidth, intervals
+                )
+                break
+
+        if reason is not None or finished:
+            break
+
+        if exited:
+            reason = 'exited without a summary'
+            break
+
+        if not alive():
+            # Poll once more, as the instance may have written its summary
+            # after its log was read
+            exited = True
+            continue
+
+        if timeout is not None and default_timer() - start >= timeout:
+            reason = 'timeout after {} seconds'.format(timeout)
+            break
+
+        sleep(poll_interval)
+
+    return {
+        'aborted': reason is not None,
+        'reason': reason,
+        'elapsed': default_timer() - start,
+        'result': stop(),
+    }
+
+
+@stateprovider(IperfState)
+def client_watch(
+        enode,
+        state,
+        min_bandwidth=None,
+        intervals=3,
+        max_loss=None,
+        max_jitter=None,
+        poll_interval=1,
+        timeout=None,
+        instance_id=1,
+        shell=None
+):
+    """
+    Watch a running iperf client and stop it early if traffic is broken.
+
+    The client log is polled with :func:`client_poll` while the client runs.
+    The client is stopped as soon as its bandwidth stays below
+    ``min_bandwidth`` for ``intervals`` consecutive intervals, or an
+    interval goes over ``max_loss`` or ``max_jitter``. Otherwise it is
+    stopped once iperf prints its summary. An instance that exits without
+    printing it, like a client failing to connect, is reported as aborted.
+    With parallel streams only the aggregate is checked once iperf prints
+    it.
+
+    :param enode: Engine node to communicate with.
+    :type enode: topology.platforms.base.BaseNode
+    :param float min_bandwidth: Minimum bandwidth in bits per second.
+    :param int intervals: Number of consecutive intervals below
+     ``min_bandwidth`` that abort the run.
+    :param float max_loss: Maximum UDP loss percentage of an interval.
+    :param float max_jitter: Maximum UDP jitter of an interval in
+     milliseconds.
+    :param float poll_interval: Seconds between polls of the log.
+    :param float timeout: Seconds after which the run is aborted, or ``None``
+     to wait for the summary or the exit of the instance.
+    :param int instance_id: Number of iperf client instance.
+    :param str shell: Shell name to execute commands.
+     If ``None``, use the Engine Node default shell.
+    :rtype: dict
+    :return: The outcome of the run, with the (partial) result returned by
+     :func:`client_stop`:
+
+     ::
+
+        {
+            'aborted': True,
+            'reason': 'bandwidth below 1000000000.0 bps for 3 intervals',
+            'elapsed': 3.02,
+            'result': {...}
+        }
+    """
+    return _watch(
+        lambda: client_poll(
+            enode, instance_id=instance_id, numeric=True, shell=shell
+        ),
+        lambda: state.client_tails[instance_id]['alive'],
+        lambda: client_stop(enode, instance_id=instance_id, shell=shell),
+        min_bandwidth, intervals, max_loss, max_jitter, poll_interval, timeout
+    )
+
+
+@stateprovider(IperfState)
+def server_watch(
+        enode,
+        state,
+        min_bandwidth=None,
+        intervals=3,
+        max_loss=None,
+        max_jitter=None,
+        poll_interval=1,
+        timeout=None,
+        instance_id=1,
+        shell=None
+):
+    """
+    Watch a running iperf server and stop it early if traffic is broken.
+
+    UDP loss and jitter are only reported by the server, so this is the side
+    to watch to enforce ``max_loss`` and ``max_jitter``. See
+    :func:`client_watch` for the parameters.
+
+    :rtype: dict
+    :return: The outcome of the run, as returned by :func:`client_watch`,
+     with the result returned by :func:`server_stop`.
+    """
+    return _watch(
+        lambda: server_poll(
+            enode, instance_id=instance_id, numeric=True, shell=shell
+        ),
+        lambda: state.server_tails[instance_id]['alive'],
+        lambda: server_stop(enode, instance_id=instance_id, shell=shell),
+        min_bandwidth, intervals, max_loss, max_jitter, poll_interval, timeout
     )
 
 
 __all__ = [
     'server_start',
     'server_stop',
+    'server_wait',
     'client_start',
-    'client_stop'
+    'client_stop',
+    'instances_running',
+    'stop_all',
+    'server_poll',
+    'client_poll',
+    'server_acquire',
+    'server_release',
+    'server_pool_stop',
+    'server_watch',
+    'client_watch'
 ]
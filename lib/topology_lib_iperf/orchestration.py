@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2016 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Concurrent orchestration of iperf traffic between many nodes.
+
+The library functions drive a single engine node. This module runs them for
+a whole traffic matrix using a thread pool. Engine node shells are not
+thread safe, so all the calls for a given node run in order in the same
+task, and the tasks of different nodes run concurrently.
+"""
+
+from __future__ import unicode_literals, absolute_import
+from __future__ import print_function, division
+
+from time import sleep
+from timeit import default_timer
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
+from .library import server_start, server_stop, client_start, client_stop
+
+
+PHASES = (
+    'servers_start', 'clients_start', 'wait', 'clients_stop', 'servers_stop'
+)
+"""
+Phases of :func:`run_traffic_matrix`, in the order they run.
+"""
+
+
+def _run_calls(calls):
+    return [call() for call in calls]
+
+
+def _run_phase(pool, calls):
+    """
+    Run the calls of every node concurrently.
+
+    :param pool: Thread pool to run the calls in.
+    :param OrderedDict calls: List of ``(key, callable)`` for each node.
+    :return: Dictionary with the result of each call by key, and the
+     elapsed time in seconds.
+    """
+    start = default_timer()
+
+    nodes = list(calls.values())
+    results = pool.map(
+        _run_calls, [[call for _, call in node] for node in nodes]
+    )
+
+    by_key = {}
+    for node, node_results in zip(nodes, results):
+        for (key, _), result in zip(node, node_results):
+            by_key[key] = result
+
+    return by_key, default_timer() - start
+
+
+def _call(function, *args, **kwargs):
+    return lambda: function(*args, **kwargs)
+
+
+def _stop_quietly(stop, enode, instance_id, shell):
+    """
+    Stop an instance started by a failed matrix.
+
+    Errors are ignored, as the node may be the one that failed.
+    """
+    try:
+        stop(enode, instance_id=instance_id, batch=True, shell=shell)
+    except Exception:
+        pass
+
+
+def run_traffic_matrix(
+        matrix,
+        time=10,
+        interval=1,
+        udp=False,
+        bandwidth=None,
+        parallel=None,
+        backend='iperf',
+        settle=1,
+        max_workers=None,
+        batch=True,
+        ready_timeout=None,
+        shell=None
+):
+    """
+    Run iperf traffic for a whole traffic matrix concurrently.
+
+    All servers are started, then all clients. After waiting for the clients
+    to finish, all clients and then all servers are stopped. Each phase runs
+    concurrently for all nodes. If a phase fails, or is interrupted, the
+    instances started so far are stopped before the error is raised.
+
+    ::
+
+        result = run_traffic_matrix({
+            (hs1, '10.0.0.1', 5001): [hs2, hs3],
+            (hs4, '10.0.0.4', 5001): [hs5],
+        }, time=30)
+
+        result['clients'][(hs1, 5001, hs2)]['traffic']
+        result['timings']['clients_start']
+
+    Instances get the lowest instance ids free on each node, so the nodes
+    may run other instances, which are left untouched.
+
+    :param dict matrix: Clients of each server. Keys are tuples of the server
+     engine node, the address clients use to reach it, and the iperf port.
+     Values are lists of client engine nodes.
+    :param int time: Time the clients run in seconds.
+    :param int interval: Reporting interval in seconds.
+    :param bool udp: If it is UDP or TCP traffic.
+    :param str bandwidth: Client bandwidth, see
+     :func:`topology_lib_iperf.library.client_start`.
+    :param int parallel: Parallel streams of each client.
+    :param str backend: iperf binary to use, see
+     :data:`topology_lib_iperf.library.BACKENDS`.
+    :param float settle: Extra seconds to wait after ``time`` for the clients
+     to finish.
+    :param int max_workers: Maximum number of nodes driven at once. Default
+     is one thread per node.
+    :param bool batch: Stop instances with a single shell invocation each,
+     see :func:`topology_lib_iperf.library.client_stop`.
+    :param float ready_timeout: Wait up to this many seconds for each server
+     to listen before starting the clients, see
+     :func:`topology_lib_iperf.library.server_wait`. The seconds each server
+     took are then under the ``startup`` key of the result.
+    :param str shell: Shell name to execute commands.
+     If ``None``, use the Engine Node default shell.
+    :rtype: dict
+    :return: The parsed results and the time each phase took:
+
+     ::
+
+        {
+            'servers': {
+                (server, port): {...},
+            },
+            'clients': {
+                (server, port, client): {...},
+            },
+            'timings': {
+                'servers_start': 0.41,
+                'clients_start': 0.38,
+                'wait': 31.0,
+                'clients_stop': 0.52,
+                'servers_stop': 0.47
+            }
+        }
+
+     Server and client results are as returned by
+     :func:`topology_lib_iperf.library.server_stop` and
+     :func:`topology_lib_iperf.library.client_stop`.
+    """
+    servers_started = OrderedDict()
+    clients_started = OrderedDict()
+
+    def start_server(server, key, port):
+        started = server_start(
+            server, port, interval=interval, udp=udp, backend=backend,
+            ready_timeout=ready_timeout, shell=shell
+        )
+        servers_started[key] = (server, started['instance_id'])
+        return started
+
+    def start_client(client, key, address, port):
+        instance_id = client_start(
+            client, address, port, interval=interval, time=time, udp=udp,
+            bandwidth=bandwidth, parallel=parallel, backend=backend,
+            shell=shell
+        )
+        clients_started[key] = (client, instance_id)
+        return instance_id
+
+    def stop(started, function, key):
+        node, instance_id = started.pop(key)
+        return function(
+            node, instance_id=instance_id, batch=batch, shell=shell
+        )
+
+    start_servers = OrderedDict()
+    stop_servers = OrderedDict()
+    start_clients = OrderedDict()
+    stop_clients = OrderedDict()
+
+    for (server, address, port), clients in matrix.items():
+        key = (server, port)
+
+        start_servers.setdefault(server, []).append((key, _call(
+            start_server, server, key, port
+        )))
+        stop_servers.setdefault(server, []).append((key, _call(
+            stop, servers_started, server_stop, key
+        )))
+
+        for client in clients:
+            key = (server, port, client)
+
+            start_clients.setdefault(client, []).append((key, _call(
+                start_client, client, key, address, port
+            )))
+            stop_clients.setdefault(client, []).append((key, _call(
+                stop, clients_started, client_stop, key
+            )))
+
+    nodes = set(start_servers) | set(start_clients)
+    pool = ThreadPool(max_workers or max(len(nodes), 1))
+    timings = {}
+
+    try:
+        started, timings['servers_start'] = _run_phase(pool, start_servers)
+        _, timings['clients_start'] = _run_phase(pool, start_clients)
+
+        start = default_timer()
+        sleep(time + settle)
+        timings['wait'] = default_timer() - start
+
+        clients, timings['clients_stop'] = _run_phase(pool, stop_clients)
+        servers, timings['servers_stop'] = _run_phase(pool, stop_servers)
+    finally:
+        # Do not leave the instances started so far running
+        cleanup = OrderedDict()
+        for function, instances in (
+                (client_stop, clients_started),
+                (server_stop, servers_started)):
+            for key, (node, instance_id) in instances.items():
+                cleanup.setdefault(node, []).append((key, _call(
+                    _stop_quietly, function, node, instance_id, shell
+                )))
+        if cleanup:
+            _run_phase(pool, cleanup)
+        pool.close()
+        pool.join()
+
+    result = {
+        'servers': servers,
+        'clients': clients,
+        'timings': timings,
+    }
+    if ready_timeout is not None:
+        result['startup'] = {
+            key: server['startup'] for key, server in started.items()
+        }
+    return result
+
+
+__all__ = [
+    'PHASES',
+    'run_traffic_matrix'
+]
@@ -22,13 +22,182 @@ Parse iperf commands with output to a Python dictionary.
 from __future__ import unicode_literals, absolute_import
 from __future__ import print_function, division
 
-from re import search
+from re import compile, escape, IGNORECASE, MULTILINE
+from array import array
+from itertools import chain
+from json import JSONDecoder
+from zlib import decompressobj, MAX_WBITS
+from base64 import b64decode
+from codecs import getincrementaldecoder
 from logging import getLogger
 
+from .instrumentation import measure
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+try:
+    string_types = (basestring,)  # noqa
+except NameError:
+    string_types = (str,)
+
+try:
+    array('q')
+    _INT_TYPECODE = 'q'
+except ValueError:
+    _INT_TYPECODE = 'l'
+
 
 log = getLogger(__name__)
 
 
+PID_RE = compile(r'\[\d*\]\s+(?P<pid>\d+)')
+"""
+Regular expression matching the job and PID printed by a shell when forking
+a background process.
+"""
+
+BATCH_MARKER = '__topology_lib_iperf_batch__'
+"""
+Line printed between the commands of a batched shell invocation.
+"""
+
+BATCH_RE = compile(
+    r'^{}\r?(?:\n|$)'.format(escape(BATCH_MARKER)), MULTILINE
+)
+
+IPERF_GRAMMAR = compile(
+    r'\[ *(?P<stream>\d+|SUM)\] +(?:'
+    # [  4]  0.0- 1.0 sec  1.84 GBytes  15.8 Gbits/sec
+    # [  3]  0.0- 1.0 sec   128 KBytes  1.05 Mbits/sec  0.011 ms  0/ 89 (0%)
+    r'(?P<traffic>'
+    r'(?P<start>[.\d]+)- *(?P<end>[.\d]+) sec +'
+    r'(?P<transfer>[.\d]+ \w+) +(?P<bandwidth>[.\d]+ \S+)'
+    r'(?: +(?P<jitter>[.\d]+ ms) +'
+    r'(?P<lost>\d+)/ *(?P<total>\d+) +\((?P<loss>[-+.\deE]+)%\))?'
+    r'[^\r\n]*)'
+    # [  3]  0.0-10.0 sec  1 datagrams received out-of-order
+    r'|(?P<out_of_order_line>[.\d]+- *[.\d]+ sec +'
+    r'(?P<out_of_order>\d+) datagrams received out-of-order)'
+    # [  4] local 127.0.0.1 port 5100 connected with 127.0.0.1 port 38040
+    r'|(?P<connection>local (?P<local>[^\r\n]*) port (?P<local_port>\d+) '
+    r'connected with (?P<remote>[^\r\n]*) port (?P<remote_port>[^\r\n]*))'
+    # [  3] Server Report:
+    r'|(?P<server_report>Server Report:)'
+    r')'
+)
+"""
+Grammar of the iperf server and client text output.
+
+It matches the lines of interest of a whole output (or any block of complete
+lines) in a single :meth:`finditer` pass. The kind of line matched is given
+by ``match.lastgroup``: one of ``traffic``, ``out_of_order_line``,
+``connection`` or ``server_report``.
+"""
+
+HEADER_RE = compile(
+    r'^(?:Server listening on \w+ port (?P<listen>\d+)'
+    r'|Client connecting to [^,\r\n]+, \w+ port (?P<connect>\d+))',
+    MULTILINE
+)
+"""
+Regular expression matching the headers iperf prints for the connections it
+accepts and the ones it makes.
+"""
+
+_HEADERS = ('Server listening on ', 'Client connecting to ')
+
+_GROUPS = IPERF_GRAMMAR.groupindex
+_TRAFFIC = _GROUPS['traffic']
+_TRAFFIC_GROUPS = tuple(
+    _GROUPS[name]
+    for name in ('stream', 'start', 'end', 'transfer', 'bandwidth', 'jitter')
+)
+_UDP_GROUPS = tuple(_GROUPS[name] for name in ('lost', 'total', 'loss'))
+
+UNIT_PREFIXES = {
+    '': (1, 1),
+    'K': (10 ** 3, 2 ** 10),
+    'M': (10 ** 6, 2 ** 20),
+    'G': (10 ** 9, 2 ** 30),
+    'T': (10 ** 12, 2 ** 40),
+}
+"""
+Unit prefixes and their ``(decimal, binary)`` multipliers.
+"""
+
+UNIT_RE = compile(
+    r'^(?P<prefix>[KMGT]?)(?P<binary>i?)(?P<kind>Bytes|bits|B|b|bit)'
+    r'(?P<rate>/sec|/s|ps)?$',
+    IGNORECASE
+)
+
+_unit_factors = {}
+
+
+def unit_factor(unit):
+    """
+    Get the number of bits represented by one unit of an iperf quantity.
+
+    iperf uses binary multipliers for bytes (``KBytes`` is 1024 bytes) and
+    decimal multipliers for bits (``Kbits/sec`` is 1000 bits per second). An
+    explicit ``i`` (``KiB``) always selects the binary multiplier. Results are
+    cached, as iperf outputs use a handful of distinct units.
+
+    >>> unit_factor('KBytes')
+    8192
+    >>> unit_factor('Mbits/sec')
+    1000000
+
+    :param str unit: Unit as printed by iperf, like ``'GBytes'`` or
+     ``'Mbits/sec'``.
+    :rtype: int
+    :return: Bits per unit (or bits per second per unit for rates).
+    """
+    try:
+        return _unit_factors[unit]
+    except KeyError:
+        pass
+
+    match = UNIT_RE.match(unit)
+    if not match:
+        raise ValueError('Unknown iperf unit {!r}'.format(unit))
+
+    prefix, binary, kind = match.group('prefix', 'binary', 'kind')
+    is_bytes = kind in ('Bytes', 'B')
+    decimal_scale, binary_scale = UNIT_PREFIXES[prefix.upper()]
+
+    scale = binary_scale if (binary or is_bytes) else decimal_scale
+    factor = scale * 8 if is_bytes else scale
+
+    _unit_factors[unit] = factor
+    return factor
+
+
+def to_bytes(value, unit):
+    """
+    Convert an iperf quantity like ``1.84 GBytes`` to bytes.
+
+    :param value: Numeric value as float or string.
+    :param str unit: Unit of the value, as accepted by :func:`unit_factor`.
+    :rtype: int
+    """
+    return int(round(float(value) * unit_factor(unit) / 8))
+
+
+def to_bps(value, unit):
+    """
+    Convert an iperf rate like ``15.8 Gbits/sec`` to bits per second.
+
+    :param value: Numeric value as float or string.
+    :param str unit: Unit of the value, as accepted by :func:`unit_factor`.
+    :rtype: float
+    """
+    return float(value) * unit_factor(unit)
+
+
 def parse_pid(response):
     """
     Parse PID shell output using a regular expression.
@@ -37,9 +206,7 @@ def parse_pid(response):
     """
     assert response
 
-    pid_regex = r'\[\d*\]\s+(?P<pid>\d+)'
-
-    regex_result = search(pid_regex, response)
+    regex_result = PID_RE.search(response)
     if not regex_result:
         log.debug('Failed to parse pid from:\n{}'.format(response))
         raise Exception('PID regular expression didn\'t match.')
@@ -47,11 +214,789 @@ def parse_pid(response):
     return int(regex_result.groupdict()['pid'])
 
 
-def parse_iperf_server(raw_output):
+def parse_batch(response):
+    """
+    Split the output of a batched shell invocation.
+
+    Commands of a batch are separated by an ``echo`` of
+    :data:`BATCH_MARKER`, so the output of each command is between the
+    marker lines. Only full marker lines count as separators, so an echo of
+    the command line by the shell does not split the output.
+
+    >>> parse_batch('x\\n__topology_lib_iperf_batch__\\nlog\\n')
+    ['x\\n', 'log\\n']
+
+    :param str response: Output of the batched shell invocation.
+    :rtype: list
+    :return: Output of each command of the batch.
+    """
+    return BATCH_RE.split(response or '')
+
+
+def iter_blocks(chunks):
+    """
+    Regroup an iterable of text chunks into blocks of complete lines.
+
+    Each block ends at a line boundary and holds every complete line that
+    became available with the current chunk. Only the trailing incomplete
+    line of the last chunk is kept in memory, so arbitrarily large logs can be
+    consumed from a file object or a socket without loading them whole.
+
+    :param chunks: A string, or an iterable of strings (or bytes) of any size,
+     like a file object or a list of lines.
+    :return: A generator of strings.
+    """
+    if isinstance(chunks, bytes):
+        chunks = chunks.decode('utf-8', 'replace')
+
+    if isinstance(chunks, string_types):
+        if chunks:
+            yield chunks
+        return
+
+    pending = ''
+    for chunk in chunks:
+        if isinstance(chunk, bytes):
+            chunk = chunk.decode('utf-8', 'replace')
+
+        cut = chunk.rfind('\n') + 1
+        if not cut:
+            pending += chunk
+            continue
+
+        yield pending + chunk[:cut]
+        pending = chunk[cut:]
+
+    if pending:
+        yield pending
+
+
+class GzipDecoder(object):
+    """
+    Incremental decoder of a gzip compressed log into text.
+
+    Compressed logs are fetched through the text console of the node encoded
+    in base64, in byte ranges that are decompressed as they arrive. Each text
+    chunk fed must thus be a complete base64 encoding of the next bytes of
+    the log, while bytes chunks are taken as is. A truncated stream, like
+    the log of an instance still running, yields all the text it holds so
+    far.
+    """
+
+    def __init__(self):
+        self._inflate = decompressobj(16 + MAX_WBITS)
+        self._text = getincrementaldecoder('utf-8')('replace')
+
+    def feed(self, chunk):
+        """
+        Decode the next chunk of the log.
+
+        :param chunk: Base64 text or compressed bytes.
+        :rtype: str
+        :return: The text decompressed from the chunk.
+        """
+        if not isinstance(chunk, bytes):
+            chunk = b64decode(''.join(chunk.split()))
+        return self._text.decode(self._inflate.decompress(chunk))
+
+
+def iter_gunzip(chunks):
+    """
+    Decompress a gzip compressed log as a stream.
+
+    ::
+
+        for kind, stream, record in iter_iperf_server(iter_gunzip(fd)):
+            ...
+
+    :param chunks: Iterable of chunks as accepted by
+     :meth:`GzipDecoder.feed`.
+    :return: A generator of text chunks, as accepted by :func:`iter_blocks`.
+    """
+    decoder = GzipDecoder()
+    for chunk in chunks:
+        text = decoder.feed(chunk)
+        if text:
+            yield text
+
+
+def iter_lines(chunks):
+    """
+    Split an iterable of text chunks into lines.
+
+    :param chunks: A string, or an iterable of chunks as accepted by
+     :func:`iter_blocks`.
+    :return: A generator of lines without the line terminator.
+    """
+    for block in iter_blocks(chunks):
+        for line in block.splitlines():
+            yield line
+
+
+def _header_ports(block):
+    """
+    Get the ports of the listening and connecting headers of a block of
+    output, or ``None`` for the headers it lacks.
+
+    The headers are looked up as plain strings first, as scanning a whole
+    log with :data:`HEADER_RE` is slow.
+    """
+    ports = []
+    for header in _HEADERS:
+        index = block.find(header)
+        match = HEADER_RE.match(block, index) if index >= 0 else None
+        ports.append(
+            match.group('listen') or match.group('connect') if match else None
+        )
+    return ports
+
+
+def _connection_record(
+        local, remote, groups, listen_port, connect_port):
+    """
+    Build the record of a connection line.
+
+    :param tuple groups: The local address and port, and the remote address
+     and port matched.
+    :param str listen_port: Port of the listening header, if any.
+    :param str connect_port: Port of the connecting header, if any.
+    """
+    local_host, local_port, remote_host, remote_port = groups
+
+    if listen_port is None or connect_port is None:
+        return {
+            local: local_host,
+            local + '_port': local_port,
+            remote: remote_host,
+            remote + '_port': remote_port,
+        }
+
+    outgoing = (
+        remote_port.strip() == connect_port or local_port != listen_port
+    )
+    if outgoing == (local == 'client'):
+        return {
+            local: local_host,
+            local + '_port': local_port,
+            remote: remote_host,
+            remote + '_port': remote_port,
+            'direction': 'forward',
+        }
+
+    return {
+        remote: local_host,
+        remote + '_port': local_port,
+        local: remote_host,
+        local + '_port': remote_port,
+        'direction': 'reverse',
+    }
+
+
+def _size(raw_output):
+    """
+    Get the size of an output given whole, or ``None`` for chunks.
+    """
+    if isinstance(raw_output, (bytes,) + string_types):
+        return len(raw_output)
+    return None
+
+
+def _numeric_record(start, end, transfer, bandwidth):
+    """
+    Build a numeric traffic record from the display strings of a line.
+    """
+    return {
+        'start': float(start),
+        'end': float(end),
+        'bytes': to_bytes(*transfer.split(' ')),
+        'bps': to_bps(*bandwidth.split(' ')),
+    }
+
+
+class IperfParser(object):
+    """
+    Stateful parser of the iperf text output.
+
+    It keeps what is needed to parse the output of a running iperf across
+    calls: the trailing incomplete line and the last interval of each stream,
+    so output can be fed as it is fetched from a node, in pieces of any size.
+
+    In dual (``-d``) and tradeoff (``-r``) tests, iperf both accepts and
+    makes connections, and prints both headers. Connections are then told
+    apart by their ports: the ones made to the port of the ``Client
+    connecting`` header are outgoing, the others incoming. Connection
+    records get a ``direction`` key, ``'forward'`` for the client to server
+    traffic and ``'reverse'`` for the server to client one. Reverse
+    connection records name the peers by their role in the reverse traffic,
+    so the server is the receiving side.
+
+    :param str local: ``'server'`` or ``'client'``, the side that printed the
+     output.
+    :param bool numeric: Build numeric traffic records, see
+     :func:`iter_iperf_server`.
+    """
+
+    def __init__(self, local='server', numeric=False):
+        assert local in ('server', 'client')
+
+        self.local = local
+        self.remote = 'client' if local == 'server' else 'server'
+        self.numeric = numeric
+        self.pending = ''
+
+        # End of the last interval seen for each stream. iperf prints the
+        # summary of a stream as an interval that starts before it.
+        self.last_end = {}
+        # Streams that announced a server report in their next traffic line
+        self.reports = set()
+        # Ports of the connection headers, both set in dual and tradeoff
+        # tests
+        self.listen_port = None
+        self.connect_port = None
+
+    def feed(self, chunk):
+        """
+        Parse a piece of output.
+
+        :param str chunk: Output following the previous one fed.
+        :rtype: list
+        :return: The ``(kind, stream, record)`` tuples of the lines completed
+         by this chunk, as yielded by :func:`iter_iperf_server`.
+        """
+        if isinstance(chunk, bytes):
+            chunk = chunk.decode('utf-8', 'replace')
+
+        with measure(None, 'IperfParser.feed', 'parse') as phase:
+            phase.bytes = len(chunk)
+
+            cut = chunk.rfind('\n') + 1
+            if not cut:
+                self.pending += chunk
+                return []
+
+            block = self.pending + chunk[:cut]
+            self.pending = chunk[cut:]
+            return list(self.parse_block(block))
+
+    def close(self):
+        """
+        Parse the trailing incomplete line, if any.
+
+        :rtype: list
+        :return: The records of that line.
+        """
+        block, self.pending = self.pending, ''
+        return list(self.parse_block(block))
+
+    def parse_block(self, block):
+        """
+        Parse a block of complete lines.
+
+        :param str block: Output ending at a line boundary.
+        :return: A generator of ``(kind, stream, record)`` tuples.
+        """
+        local, remote, numeric = self.local, self.remote, self.numeric
+        last_end = self.last_end
+        reports = self.reports
+
+        if self.listen_port is None or self.connect_port is None:
+            listen, connect = _header_ports(block)
+            if listen is not None:
+                self.listen_port = listen
+            if connect is not None:
+                self.connect_port = connect
+
+        for match in IPERF_GRAMMAR.finditer(block):
+
+            # Groups are fetched by index in this loop, as it runs once per
+            # line of output
+            if match.lastindex == _TRAFFIC:
+                stream, start, end, transfer, bandwidth, jitter = \
+                    match.group(*_TRAFFIC_GROUPS)
+
+                kind = 'traffic'
+                previous = last_end.get(stream)
+                if reports and stream in reports:
+                    kind = 'server_report'
+                    reports.discard(stream)
+                elif (
+                    previous is not None and start != previous and
+                    float(start) < float(previous)
+                ):
+                    kind = 'summary'
+                else:
+                    last_end[stream] = end
+
+                if numeric:
+                    record = _numeric_record(start, end, transfer, bandwidth)
+                else:
+                    record = {'transfer': transfer, 'bandwidth': bandwidth}
+
+                if jitter is not None:
+                    lost, total, loss = match.group(*_UDP_GROUPS)
+                    if numeric:
+                        record.update({
+                            'jitter': float(jitter.split(' ')[0]),
+                            'lost': int(lost),
+                            'total': int(total),
+                            'loss': float(loss),
+                        })
+                    else:
+                        record.update({
+                            'jitter': jitter,
+                            'lost': lost,
+                            'total': total,
+                            'loss': '{}%'.format(loss),
+                        })
+
+                yield kind, stream, record
+                continue
+
+            kind = match.lastgroup
+            stream = match.group('stream')
+
+            if kind == 'out_of_order_line':
+                out_of_order = match.group('out_of_order')
+                yield 'out_of_order', stream, {
+                    'out_of_order': (
+                        int(out_of_order) if numeric else out_of_order
+                    )
+                }
+                continue
+
+            if kind == 'server_report':
+                reports.add(stream)
+                continue
+
+            # A new connection reusing the ID of a finished stream, like
+            # another client of the same server, starts its intervals again
+            last_end.pop(stream, None)
+
+            yield 'connection', stream, _connection_record(
+                local, remote,
+                match.group('local', 'local_port', 'remote', 'remote_port'),
+                self.listen_port, self.connect_port
+            )
+
+
+def _iter_iperf(chunks, local, numeric):
+    """
+    Incrementally parse iperf output printed by ``local``.
+
+    See :func:`iter_iperf_server` for the records yielded. The records of
+    each block are chained as they are, not to go through another generator
+    for each of them.
+    """
+    parser = IperfParser(local, numeric)
+    return chain.from_iterable(
+        parser.parse_block(block) for block in iter_blocks(chunks)
+    )
+
+
+class IperfTraffic(Mapping):
+    """
+    Read only view of the traffic intervals of an :class:`IperfResult`.
+
+    It behaves like the ``'traffic'`` dictionary returned by the parse
+    functions in numeric mode: keys are the interval indexes as strings
+    (``'0'``, ``'1'``, ...) and values are numeric traffic records, built on
+    access from the columns of the result.
+    """
+
+    __slots__ = ('_result',)
+
+    def __init__(self, result):
+        self._result = result
+
+    def __getitem__(self, key):
+        try:
+            index = int(key)
+        except (TypeError, ValueError):
+            raise KeyError(key)
+
+        if key != str(index) or not 0 <= index < len(self):
+            raise KeyError(key)
+
+        return self._result.interval(index)
+
+    def __iter__(self):
+        return (str(index) for index in range(len(self)))
+
+    def __len__(self):
+        return len(self._result.start)
+
+
+class IperfResult(Mapping):
+    """
+    Compact, array backed result of an iperf parse.
+
+    Traffic intervals are stored as parallel :class:`array.array` columns
+    instead of one dictionary per interval, so results of long runs take a
+    small fraction of the memory. The object is still a read only mapping
+    with the same keys as the dictionary returned by
+    :func:`parse_iperf_server` in numeric mode.
+
+    :var dict connection: Connection information, as in the ``'connection'``
+     records of :func:`iter_iperf_server`.
+    :var array start: Interval start in seconds.
+    :var array end: Interval end in seconds.
+    :var array bytes: Bytes transferred in the interval.
+    :var array bps: Bandwidth of the interval in bits per second.
+    :var array jitter: UDP jitter of the interval in milliseconds.
+    :var array lost: UDP datagrams lost in the interval.
+    :var array total: UDP datagrams sent in the interval.
+    :var array loss: UDP loss of the interval in percent.
+    :var tuple columns: Names of the columns in use. The UDP columns are only
+     used when the first interval appended has UDP fields.
+    :var dict summary: Summary record, or ``None``.
+    :var dict server_report: Server report record, or ``None``.
+    :var dict streams: Results of each stream by stream ID when the output
+     had several streams, or ``None``.
+    :var dict cpu_utilization: CPU utilization reported by iperf3, or
+     ``None``.
+    :var IperfResult reverse: Result of the reverse traffic of a dual or
+     tradeoff test, or ``None``.
+    """
+
+    __slots__ = (
+        'connection', 'start', 'end', 'bytes', 'bps',
+        'jitter', 'lost', 'total', 'loss',
+        'columns', 'summary', 'server_report', 'streams', 'cpu_utilization',
+        'reverse'
+    )
+
+    COLUMNS = (
+        ('start', 'd'),
+        ('end', 'd'),
+        ('bytes', _INT_TYPECODE),
+        ('bps', 'd'),
+    )
+
+    UDP_COLUMNS = (
+        ('jitter', 'd'),
+        ('lost', _INT_TYPECODE),
+        ('total', _INT_TYPECODE),
+        ('loss', 'd'),
+    )
+
+    def __init__(self, connection=None):
+        self.connection = dict(connection or {})
+        self.summary = None
+        self.server_report = None
+        self.streams = None
+        self.cpu_utilization = None
+        self.reverse = None
+        self.columns = tuple(name for name, _ in self.COLUMNS)
+        for name, typecode in self.COLUMNS + self.UDP_COLUMNS:
+            setattr(self, name, array(typecode))
+
+    @classmethod
+    def from_records(cls, records):
+        """
+        Build a result from the numeric records of :func:`iter_iperf_server`
+        or :func:`iter_iperf_client`.
+
+        :param records: Iterable of ``(kind, stream, record)`` tuples.
+        :rtype: IperfResult
+        """
+        return collect_records(records, compact=True)
+
+    def copy(self):
+        """
+        Get a shallow copy of this result, that shares its columns.
+
+        :rtype: IperfResult
+        """
+        other = type(self).__new__(type(self))
+        for name in self.__slots__:
+            setattr(other, name, getattr(self, name))
+        return other
+
+    def append(self, record):
+        """
+        Append a numeric traffic record.
+
+        :param dict record: Traffic record with ``start``, ``end``, ``bytes``
+         and ``bps`` keys, and optionally the UDP ``jitter``, ``lost``,
+         ``total`` and ``loss`` keys.
+        """
+        if not len(self.start) and 'jitter' in record:
+            self.columns += tuple(name for name, _ in self.UDP_COLUMNS)
+
+        for name in self.columns:
+            getattr(self, name).append(record.get(name, 0))
+
+    def interval(self, index):
+        """
+        Get a traffic interval as a numeric record.
+
+        :param int index: Interval index.
+        :rtype: dict
+        """
+        return {name: getattr(self, name)[index] for name in self.columns}
+
+    def _extra(self):
+        return [
+            key for key in (
+                'summary', 'server_report', 'streams', 'cpu_utilization',
+                'reverse'
+            )
+            if getattr(self, key) is not None
+        ]
+
+    def __getitem__(self, key):
+        if key == 'traffic':
+            return IperfTraffic(self)
+        if key in self._extra():
+            return getattr(self, key)
+        return self.connection[key]
+
+    def __iter__(self):
+        for key in self.connection:
+            yield key
+        yield 'traffic'
+        for key in self._extra():
+            yield key
+
+    def __len__(self):
+        return len(self.connection) + 1 + len(self._extra())
+
+    def __repr__(self):
+        return '<{} {} intervals={}>'.format(
+            type(self).__name__, self.connection, len(self.start)
+        )
+
+
+def collect_records(records, compact=False):
+    """
+    Build the result returned by the parse functions from a stream of
+    records, like the ones returned by :meth:`IperfParser.feed`.
+
+    Records are grouped by stream ID. When there is more than one stream, the
+    result holds the aggregate (``[SUM]``) traffic, or the first stream's when
+    iperf printed no aggregate, and every stream under the ``streams`` key.
+
+    The records of streams with a reverse connection, in dual and tradeoff
+    tests, are collected apart in a result under the ``reverse`` key.
+
+    :param records: Iterable of ``(kind, stream, record)`` tuples.
+    :param bool compact: Build an :class:`IperfResult` instead of a
+     dictionary. Records must be numeric.
+    :return: The result, as described in :func:`parse_iperf_server`.
+    """
+    return _collect(records, compact, [])
+
+
+def _collect(records, compact, reverse):
+    """
+    Collect records as :func:`collect_records` does.
+
+    :param list reverse: List to collect the reverse records in, or ``None``
+     to collect every record in the result.
+    """
+    streams = {}
+    order = []
+    last = {}
+    connection = None
+
+    # Traffic records of each stream, numbered once all are collected
+    traffics = {}
+
+    current_id = current = append = None
+    reverse_streams = set()
+
+    for kind, stream, record in records:
+        if (reverse is not None and kind == 'connection' and
+                'direction' in record):
+            if record['direction'] == 'reverse':
+                reverse_streams.add(stream)
+            else:
+                reverse_streams.discard(stream)
+
+        if reverse_streams and stream in reverse_streams:
+            reverse.append((kind, stream, record))
+            continue
+
+        if stream != current_id:
+            current_id = stream
+            current = streams.get(stream)
+            if current is None:
+                current = IperfResult() if compact else {'traffic': {}}
+                streams[stream] = current
+                order.append(stream)
+                traffics[stream] = []
+            append = current.append if compact else traffics[stream].append
+
+        if kind == 'traffic':
+            append(record)
+        elif kind == 'connection':
+            if connection is None:
+                connection = record
+            (current.connection if compact else current).update(record)
+        elif kind == 'out_of_order':
+            if stream in last:
+                last[stream].update(record)
+        else:
+            last[stream] = record
+            if compact:
+                setattr(current, kind, record)
+            else:
+                current[kind] = record
+
+    if not compact:
+        for stream, traffic in traffics.items():
+            streams[stream]['traffic'] = dict(
+                zip(map(str, range(len(traffic))), traffic)
+            )
+
+    return _assemble(streams, order, connection, reverse, compact)
+
+
+def _assemble(streams, order, connection, reverse, compact):
+    """
+    Build the result from the collected streams, as described in
+    :func:`collect_records`.
+
+    :param dict streams: Result of each stream by ID.
+    :param list order: Stream IDs in order of appearance.
+    :param dict connection: First connection record.
+    :param list reverse: Records of the reverse streams.
+    """
+    assert connection
+
+    if len(order) == 1:
+        aggregate = streams[order[0]]
+    else:
+        aggregate = streams.pop('SUM', None)
+        if aggregate is None:
+            aggregate = streams[order[0]]
+            aggregate = aggregate.copy() if compact else dict(aggregate)
+
+        if compact:
+            aggregate.connection = dict(connection)
+            aggregate.streams = streams
+        else:
+            aggregate.update(connection)
+            aggregate['streams'] = streams
+
+    if reverse:
+        reverse = _collect(reverse, compact, None)
+        if compact:
+            aggregate.reverse = reverse
+        else:
+            aggregate['reverse'] = reverse
+
+    return aggregate
+
+
+def iter_iperf_server(chunks, numeric=False):
+    """
+    Incrementally parse the iperf server output.
+
+    Records are yielded as soon as the line holding them is complete, so the
+    output can be processed while it is still being read.
+
+    :param chunks: Server output as a string or as an iterable of chunks, as
+     accepted by :func:`iter_blocks`.
+    :param bool numeric: Yield traffic records with numeric, unit normalized
+     values instead of the strings displayed by iperf.
+    :return: A generator of ``(kind, stream, record)`` tuples, where
+     ``stream`` is the iperf stream ID of the line as a string (like ``'4'``,
+     or ``'SUM'`` for the aggregate of parallel streams) and ``kind`` is one
+     of:
+
+     ``'connection'``
+      ::
+
+         {
+             'server': '127.0.0.1',
+             'server_port': '5100',
+             'client': '127.0.0.1',
+             'client_port': '37545'
+         }
+
+     ``'traffic'``
+      ::
+
+         {
+             'transfer': '2.72 GBytes',
+             'bandwidth': '23.4 Gbits/sec'
+         }
+
+      Or, when ``numeric`` is set, interval bounds in seconds, bytes
+      transferred and bits per second:
+
+      ::
+
+         {
+             'start': 0.0,
+             'end': 1.0,
+             'bytes': 2920577761,
+             'bps': 23400000000.0
+         }
+
+      UDP server intervals also have the jitter, the lost and total
+      datagrams and the loss percentage:
+
+      ::
+
+         {
+             'transfer': '128 KBytes',
+             'bandwidth': '1.05 Mbits/sec',
+             'jitter': '0.011 ms',
+             'lost': '0',
+             'total': '89',
+             'loss': '0%'
+         }
+
+      Those are ``float`` milliseconds, ``int``, ``int`` and ``float``
+      percent when ``numeric`` is set.
+
+     ``'summary'``
+      A traffic record for the whole run of a stream, printed by iperf when
+      it finishes.
+
+     ``'server_report'``
+      A traffic record of the summary reported back by an UDP server to the
+      client.
+
+     ``'out_of_order'``
+      The number of UDP datagrams received out of order, that belongs to the
+      summary (or server report) right before it:
+
+      ::
+
+         {
+             'out_of_order': '1'
+         }
+    """
+    return _iter_iperf(chunks, 'server', numeric)
+
+
+def iter_iperf_client(chunks, numeric=False):
+    """
+    Incrementally parse the iperf client output.
+
+    :param chunks: Client output as a string or as an iterable of chunks, as
+     accepted by :func:`iter_blocks`.
+    :param bool numeric: Yield traffic records with numeric, unit normalized
+     values instead of the strings displayed by iperf.
+    :return: A generator of ``(kind, stream, record)`` tuples as described
+     in :func:`iter_iperf_server`.
+    """
+    return _iter_iperf(chunks, 'client', numeric)
+
+
+def parse_iperf_server(raw_output, numeric=False, compact=False):
     """
     Parse the iperf server output command raw output.
 
-    :param str raw_output: bash raw result string.
+    :param raw_output: bash raw result string, or an iterable of chunks as
+     accepted by :func:`iter_blocks`.
+    :param bool numeric: Parse traffic records as numbers, as described in
+     :func:`iter_iperf_server`.
+    :param bool compact: Return an :class:`IperfResult`, that stores the
+     numeric traffic records in arrays, instead of a dictionary.
     :rtype: dict
     :return: All iperf server connection and traffic parsed \
         in the form:
@@ -72,44 +1017,63 @@ def parse_iperf_server(raw_output):
                 'transfer':'2.87 GBytes',
                 'bandwidth':'24.6 Gbits/sec'
                 }
+            },
+            'summary': {
+                'transfer':'5.59 GBytes',
+                'bandwidth':'24.0 Gbits/sec'
             }
         }
-    """
-
-    result = {}
 
-    base_info_re = '\[\s*[0-9]+\] local (?P<server>.*) port ' \
-        '(?P<server_port>\d+) connected with (?P<client>.*) port ' \
-        '(?P<client_port>.*)'
+     The ``summary`` key is only present when iperf printed its final
+     summary, and ``server_report`` when a client received an UDP server
+     report. An ``out_of_order`` count is added to them when iperf reported
+     datagrams received out of order.
 
-    base_result = search(base_info_re, raw_output)
+     When the output has several streams, like with parallel clients, the
+     traffic and summary are the ones of the aggregate (``[SUM]``) lines and
+     the ``streams`` key holds the result of each stream by stream ID:
 
-    assert base_result
-
-    result.update(base_result.groupdict())
-
-    traffic_re = (
-        r'sec  (?P<transfer>[.\d]+ .*?)  (?P<bandwidth>[.\d]+ .+)'
-    )
-
-    cont = 0
+     ::
 
-    result['traffic'] = {}
-    for raw_line in raw_output.splitlines():
-        traffic_reg_result = search(traffic_re, raw_line)
-        if traffic_reg_result:
-            traffic_reg_result = traffic_reg_result.groupdict()
-            result['traffic'][str(cont)] = traffic_reg_result
-            cont += 1
+        {
+            'server':'127.0.0.1'
+            ...
+            'traffic': {...},
+            'summary': {...},
+            'streams': {
+                '4': {
+                    'server':'127.0.0.1'
+                    'server_port':'5100'
+                    'client':'127.0.0.1'
+                    'client_port':'37545'
+                    'traffic': {...},
+                    'summary': {...}
+                },
+                '5': {...}
+            }
+        }
+    """
+    if isinstance(raw_output, bytes):
+        raw_output = raw_output.decode('utf-8', 'replace')
 
-    return result
+    with measure(None, 'parse_iperf_server', 'parse') as phase:
+        phase.bytes = _size(raw_output)
+        return collect_records(
+            iter_iperf_server(raw_output, numeric=numeric or compact),
+            compact=compact
+        )
 
 
-def parse_iperf_client(raw_output):
+def parse_iperf_client(raw_output, numeric=False, compact=False):
     """
     Parse the iperf client output command raw output.
 
-    :param str raw_output: bash raw result string.
+    :param raw_output: bash raw result string, or an iterable of chunks as
+     accepted by :func:`iter_blocks`.
+    :param bool numeric: Parse traffic records as numbers, as described in
+     :func:`iter_iperf_server`.
+    :param bool compact: Return an :class:`IperfResult`, that stores the
+     numeric traffic records in arrays, instead of a dictionary.
     :rtype: dict
     :return: All iperf server connection and traffic parsed \
         in the form:
@@ -130,40 +1094,259 @@ def parse_iperf_client(raw_output):
                     'transfer':'2.87 GBytes',
                     'bandwidth':'24.6 Gbits/sec'
                 }
+            },
+            'summary': {
+                'transfer':'5.59 GBytes',
+                'bandwidth':'24.0 Gbits/sec'
             }
         }
+
+     See :func:`parse_iperf_server` for the optional keys.
     """
+    if isinstance(raw_output, bytes):
+        raw_output = raw_output.decode('utf-8', 'replace')
+
+    with measure(None, 'parse_iperf_client', 'parse') as phase:
+        phase.bytes = _size(raw_output)
+        return collect_records(
+            iter_iperf_client(raw_output, numeric=numeric or compact),
+            compact=compact
+        )
 
-    result = {}
 
-    base_info_re = '\[\s*[0-9]+\] local (?P<client>.*) port ' \
-        '(?P<client_port>\d+) connected with (?P<server>.*) port ' \
-        '(?P<server_port>.*)'
+IPERF3_FIELDS = (
+    ('retransmits', 'retransmits'),
+    ('snd_cwnd', 'snd_cwnd'),
+    ('rtt', 'rtt'),
+    ('jitter_ms', 'jitter'),
+    ('lost_packets', 'lost'),
+    ('packets', 'total'),
+    ('lost_percent', 'loss'),
+    ('out_of_order', 'out_of_order'),
+)
+"""
+Optional iperf3 JSON interval fields and their name in the traffic records.
+"""
 
-    base_result = search(base_info_re, raw_output)
+_json_decoder = JSONDecoder()
 
-    assert base_result
 
-    result.update(base_result.groupdict())
+def load_iperf3(raw_output):
+    """
+    Load the JSON documents written by iperf3 with the ``-J`` option.
 
-    traffic_re = (
-        r'sec  (?P<transfer>[.\d]+ .*?)  (?P<bandwidth>[.\d]+ .+)'
-    )
+    An iperf3 server writes one document for each test it serves, so the
+    output may have several documents one after the other. Any text before
+    the first document, like shell messages, is ignored.
+
+    :param raw_output: iperf3 raw output as a string, or an iterable of chunks
+     as accepted by :func:`iter_blocks`.
+    :return: A list of the decoded documents.
+    """
+    text = ''.join(iter_blocks(raw_output))
+    documents = []
+
+    index = text.find('{')
+    while index >= 0:
+        document, index = _json_decoder.raw_decode(text, index)
+        documents.append(document)
+        index = text.find('{', index)
+
+    return documents
+
+
+def _iperf3_record(data):
+    """
+    Build a numeric traffic record from an iperf3 JSON interval.
+    """
+    record = {
+        'start': float(data['start']),
+        'end': float(data['end']),
+        'bytes': int(data['bytes']),
+        'bps': float(data['bits_per_second']),
+    }
+    for field, name in IPERF3_FIELDS:
+        if field in data:
+            record[name] = data[field]
+    return record
+
+
+def _iter_iperf3(document, local, remote):
+    """
+    Yield the records of an iperf3 JSON document from the point of view of
+    ``local``, as :func:`iter_iperf_server` does for iperf.
+    """
+    start = document.get('start', {})
+    end = document.get('end', {})
+    udp = start.get('test_start', {}).get('protocol') == 'UDP'
+
+    # iperf3 reports the sender and receiver side of every stream. The
+    # local side of a client is the sender, the one of a server the receiver.
+    if local == 'client':
+        side, other, sum_side, sum_other = (
+            'sender', 'receiver', 'sum_sent', 'sum_received'
+        )
+    else:
+        side, other, sum_side, sum_other = (
+            'receiver', 'sender', 'sum_received', 'sum_sent'
+        )
+
+    connected = start.get('connected', [])
+    for connection in connected:
+        yield 'connection', str(connection['socket']), {
+            local: connection['local_host'],
+            '{}_port'.format(local): str(connection['local_port']),
+            remote: connection['remote_host'],
+            '{}_port'.format(remote): str(connection['remote_port']),
+        }
+
+    parallel = len(connected) > 1
+
+    for interval in document.get('intervals', []):
+        for stream in interval['streams']:
+            yield 'traffic', str(stream['socket']), _iperf3_record(stream)
+        if parallel:
+            yield 'traffic', 'SUM', _iperf3_record(interval['sum'])
+
+    for stream in end.get('streams', []):
+        if udp and 'udp' in stream:
+            udp_summary = stream['udp']
+            yield 'summary', str(udp_summary['socket']), _iperf3_record(
+                udp_summary
+            )
+            continue
+
+        if side in stream:
+            yield 'summary', str(stream[side]['socket']), _iperf3_record(
+                stream[side]
+            )
+        if local == 'client' and other in stream:
+            yield 'server_report', str(stream[other]['socket']), \
+                _iperf3_record(stream[other])
+
+    if parallel:
+        if udp and 'sum' in end:
+            yield 'summary', 'SUM', _iperf3_record(end['sum'])
+        else:
+            if sum_side in end:
+                yield 'summary', 'SUM', _iperf3_record(end[sum_side])
+            if local == 'client' and sum_other in end:
+                yield 'server_report', 'SUM', _iperf3_record(end[sum_other])
 
-    cont = 0
 
-    result['traffic'] = {}
-    for raw_line in raw_output.splitlines():
-        traffic_result = search(traffic_re, raw_line)
-        if traffic_result:
-            traffic_result = traffic_result.groupdict()
-            result['traffic'][str(cont)] = traffic_result
-            cont += 1
+def _parse_iperf3(raw_output, local, remote, compact):
+    """
+    Parse the first test of an iperf3 JSON output.
+    """
+    with measure(None, 'parse_iperf3_{}'.format(local), 'parse') as phase:
+        phase.bytes = _size(raw_output)
+
+        documents = load_iperf3(raw_output)
+        assert documents
+
+        document = documents[0]
+        if 'error' in document:
+            log.debug(
+                'iperf3 reported an error:\n{}'.format(document['error'])
+            )
+
+        result = collect_records(
+            _iter_iperf3(document, local, remote), compact=compact
+        )
+
+    cpu_utilization = document.get('end', {}).get('cpu_utilization_percent')
+    if cpu_utilization is not None:
+        if compact:
+            result.cpu_utilization = cpu_utilization
+        else:
+            result['cpu_utilization'] = cpu_utilization
 
     return result
 
 
+def parse_iperf3_server(raw_output, compact=False):
+    """
+    Parse the iperf3 server JSON output (``iperf3 -s -J``).
+
+    The JSON document is decoded with the standard library decoder, no
+    regular expression is involved.
+
+    :param raw_output: iperf3 raw output as a string, or an iterable of chunks
+     as accepted by :func:`iter_blocks`.
+    :param bool compact: Return an :class:`IperfResult` instead of a
+     dictionary.
+    :rtype: dict
+    :return: The result of the first test served, in the same form as
+     :func:`parse_iperf_server` in numeric mode. Traffic records also have
+     the iperf3 specific fields listed in :data:`IPERF3_FIELDS` when iperf3
+     reported them, and the result has a ``cpu_utilization`` key:
+
+     ::
+
+        {
+            'server': '127.0.0.1',
+            'server_port': '5201',
+            'client': '127.0.0.1',
+            'client_port': '51236',
+            'traffic': {
+                '0': {
+                    'start': 0.0,
+                    'end': 1.0,
+                    'bytes': 2920577761,
+                    'bps': 23364622088.0
+                },
+                ...
+            },
+            'summary': {...},
+            'cpu_utilization': {
+                'host_total': 21.3,
+                'host_user': 0.4,
+                'host_system': 20.9,
+                'remote_total': 43.1,
+                'remote_user': 1.1,
+                'remote_system': 42.0
+            }
+        }
+    """
+    return _parse_iperf3(raw_output, 'server', 'client', compact)
+
+
+def parse_iperf3_client(raw_output, compact=False):
+    """
+    Parse the iperf3 client JSON output (``iperf3 -c -J``).
+
+    :param raw_output: iperf3 raw output as a string, or an iterable of chunks
+     as accepted by :func:`iter_blocks`.
+    :param bool compact: Return an :class:`IperfResult` instead of a
+     dictionary.
+    :rtype: dict
+    :return: The result in the form described in :func:`parse_iperf3_server`.
+     The receiver side summary reported by the server is under the
+     ``server_report`` key, and TCP traffic records have the
+     ``retransmits`` and ``snd_cwnd`` fields.
+    """
+    return _parse_iperf3(raw_output, 'client', 'server', compact)
+
+
 __all__ = [
+    'BATCH_MARKER',
+    'parse_batch',
+    'IperfParser',
+    'IperfTraffic',
+    'IperfResult',
+    'collect_records',
+    'unit_factor',
+    'to_bytes',
+    'to_bps',
+    'iter_blocks',
+    'GzipDecoder',
+    'iter_gunzip',
+    'iter_lines',
+    'iter_iperf_server',
+    'iter_iperf_client',
     'parse_iperf_server',
-    'parse_iperf_client'
+    'parse_iperf_client',
+    'load_iperf3',
+    'parse_iperf3_server',
+    'parse_iperf3_client'
 ]
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2016 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Shell commands managing the iperf processes of a node.
+
+Processes are checked with ``kill -0``, which only tests that a signal could
+be delivered, instead of scraping ``ps``. They are stopped with ``SIGINT``
+first, so iperf prints its summary, and killed only if still running after a
+timeout. Each command handles any number of processes in a single shell
+invocation.
+"""
+
+from __future__ import unicode_literals, absolute_import
+from __future__ import print_function, division
+
+from re import compile
+
+
+STOP_TIMEOUT = 2
+"""
+Default seconds to wait for processes to exit after ``SIGINT`` before
+killing them.
+"""
+
+ALIVE_RE = compile(r'^alive (?P<pid>\d+)\r?$')
+
+KILLED_RE = compile(r'^killed (?P<pid>\d+)\r?$')
+
+
+def _pids(pids):
+    return ' '.join(str(pid) for pid in pids)
+
+
+def alive_command(pids):
+    """
+    Get the command printing ``alive <pid>`` for each running process.
+
+    :param pids: Iterable of PIDs.
+    :rtype: str
+    """
+    return (
+        'for pid in {}; do kill -0 $pid 2>/dev/null && echo alive $pid; '
+        'done; true'
+    ).format(_pids(pids))
+
+
+def terminate_command(pids, timeout=STOP_TIMEOUT):
+    """
+    Get the command stopping processes, gracefully first.
+
+    ``SIGINT`` is sent to every process, then they are checked every tenth
+    of a second until all exited or ``timeout`` expires. The ones still
+    running are killed, printing ``killed <pid>``.
+
+    :param pids: Iterable of PIDs.
+    :param float timeout: Seconds to wait before killing. With ``0`` the
+     processes are killed right away.
+    :rtype: str
+    """
+    pids = _pids(pids)
+    kill = (
+        'for pid in {pids}; do kill -0 $pid 2>/dev/null && '
+        'kill -9 $pid 2>/dev/null && echo killed $pid; done; true'
+    ).format(pids=pids)
+
+    if not timeout:
+        return kill
+
+    return (
+        'for pid in {pids}; do kill -INT $pid 2>/dev/null; done; '
+        'i=0; while [ $i -lt {tries} ]; do alive=; '
+        'for pid in {pids}; do kill -0 $pid 2>/dev/null && alive=1; done; '
+        '[ -z "$alive" ] && break; sleep 0.1; i=$((i + 1)); done; {kill}'
+    ).format(pids=pids, tries=int(timeout * 10), kill=kill)
+
+
+def parse_alive(output):
+    """
+    Get the running PIDs printed by :func:`alive_command`.
+
+    >>> sorted(parse_alive('alive 12\\nalive 34\\n'))
+    [12, 34]
+
+    :rtype: set
+    """
+    return {
+        int(match.group('pid'))
+        for match in map(ALIVE_RE.match, output.splitlines()) if match
+    }
+
+
+def parse_killed(output):
+    """
+    Get the PIDs that :func:`terminate_command` had to kill.
+
+    :rtype: set
+    """
+    return {
+        int(match.group('pid'))
+        for match in map(KILLED_RE.match, output.splitlines()) if match
+    }
+
+
+__all__ = [
+    'STOP_TIMEOUT',
+    'alive_command',
+    'terminate_command',
+    'parse_alive',
+    'parse_killed'
+]
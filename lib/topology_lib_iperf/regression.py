@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2016 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Performance regression detection against baseline results.
+
+The per interval samples of a new result are compared to the ones of
+baseline results with a one sided Mann-Whitney U test, which makes no
+assumption on the distribution of the samples. A regression is reported
+when the test is significant and the median moved by more than a minimum
+relative change, so tiny but consistent shifts over long runs do not fail a
+build.
+
+::
+
+    baseline = store.values('bps', store.runs(node='hs1', udp=False))
+    outcome = compare(client_stop(hs1), baseline)
+    assert outcome['passed'], outcome
+"""
+
+from __future__ import unicode_literals, absolute_import
+from __future__ import print_function, division
+
+from math import erfc, sqrt
+
+from .parser import IperfResult
+from .stats import bandwidth_samples
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+
+METRICS = {
+    'bps': -1,
+    'jitter': 1,
+    'loss': 1,
+}
+"""
+Supported metrics and the direction of a regression: ``-1`` when lower
+values are worse, ``1`` when higher values are.
+"""
+
+
+def interval_samples(result, metric='bps'):
+    """
+    Get the per interval values of a metric of a parsed result.
+
+    :param result: A result as returned by
+     :func:`topology_lib_iperf.parser.parse_iperf_server` or
+     :func:`topology_lib_iperf.parser.parse_iperf_client`, in any of its
+     forms.
+    :param str metric: One of :data:`METRICS`. Bandwidth is in bits per
+     second, jitter in milliseconds and loss in percent.
+    :rtype: list
+    """
+    assert metric in METRICS
+
+    if metric == 'bps':
+        return bandwidth_samples(result)
+
+    if isinstance(result, IperfResult):
+        if metric not in result.columns:
+            return []
+        return getattr(result, metric).tolist()
+
+    traffic = result['traffic']
+    samples = []
+    for key in sorted(traffic, key=int):
+        value = traffic[key].get(metric)
+        if value is None:
+            continue
+        if not isinstance(value, float):
+            value = float(value.split()[0].rstrip('%'))
+        samples.append(value)
+    return samples
+
+
+def _median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2
+
+
+def mann_whitney(current, baseline):
+    """
+    Mann-Whitney U test of two samples.
+
+    Ranks are averaged over ties, and the p-value uses the normal
+    approximation with tie and continuity corrections, accurate from about
+    ten samples on each side.
+
+    >>> result = mann_whitney([1, 2, 3, 4, 5], [6, 7, 8, 9, 10])
+    >>> result['u'], result['effect_size']
+    (0.0, -1.0)
+
+    :param list current: Samples to test.
+    :param list baseline: Reference samples.
+    :rtype: dict
+    :return: The U statistic of ``current``, the one sided p-values of
+     ``current`` being lower (``p_less``) and greater (``p_greater``) than
+     ``baseline``, and the effect size as Cliff's delta, from ``-1`` when
+     every current sample is lower to ``1`` when every one is greater.
+    """
+    n1, n2 = len(current), len(baseline)
+    assert n1 and n2
+
+    pooled = sorted(
+        [(value, 0) for value in current] + [(value, 1) for value in baseline]
+    )
+
+    rank_sum = 0.0
+    ties = 0.0
+    index = 0
+    total = len(pooled)
+    while index < total:
+        end = index
+        while end + 1 < total and pooled[end + 1][0] == pooled[index][0]:
+            end += 1
+
+        rank = (index + end) / 2 + 1
+        count = end - index + 1
+        rank_sum += rank * sum(
+            1 for _, side in pooled[index:end + 1] if side == 0
+        )
+        ties += count ** 3 - count
+        index = end + 1
+
+    u = rank_sum - n1 * (n1 + 1) / 2
+    mean = n1 * n2 / 2
+    variance = n1 * n2 / 12 * (
+        (total + 1) - ties / (total * (total - 1) if total > 1 else 1)
+    )
+
+    if variance > 0:
+        deviation = sqrt(variance)
+        z_less = (u - mean + 0.5) / deviation
+        z_greater = (u - mean - 0.5) / deviation
+        p_less = min(1.0, 0.5 * erfc(-z_less / sqrt(2)))
+        p_greater = min(1.0, 0.5 * erfc(z_greater / sqrt(2)))
+    else:
+        p_less = p_greater = 1.0
+
+    return {
+        'u': u,
+        'p_less': p_less,
+        'p_greater': p_greater,
+        'effect_size': 2 * u / (n1 * n2) - 1,
+    }
+
+
+def compare(result, baseline, metric='bps', alpha=0.01, min_change=0.05):
+    """
+    Check whether a result regressed against a baseline.
+
+    :param result: A parsed result, or a list of samples of the metric.
+    :param baseline: A list of parsed results or of samples, like the ones
+     returned by :meth:`topology_lib_iperf.store.ResultStore.values`.
+    :param str metric: One of :data:`METRICS`.
+    :param float alpha: Significance level of the one sided test.
+    :param float min_change: Minimum relative change of the median that
+     counts as a regression.
+    :rtype: dict
+    :return: The outcome of the comparison:
+
+     ::
+
+        {
+            'passed': False,
+            'metric': 'bps',
+            'p_value': 2.1e-05,
+            'effect_size': -0.94,
+            'change': -0.31,
+            'median': 10900000000.0,
+            'baseline_median': 15800000000.0,
+            'count': 10,
+            'baseline_count': 40
+        }
+
+     ``effect_size`` is Cliff's delta of the result against the baseline and
+     ``change`` the relative change of the median. A comparison with an
+     empty side passes, with ``None`` statistics.
+    """
+    assert metric in METRICS
+
+    if isinstance(result, Mapping):
+        current = interval_samples(result, metric)
+    else:
+        current = list(result)
+
+    reference = []
+    for item in baseline:
+        if isinstance(item, Mapping):
+            reference.extend(interval_samples(item, metric))
+        else:
+            reference.append(item)
+
+    outcome = {
+        'passed': True,
+        'metric': metric,
+        'p_value': None,
+        'effect_size': None,
+        'change': None,
+        'median': _median(current) if current else None,
+        'baseline_median': _median(reference) if reference else None,
+        'count': len(current),
+        'baseline_count': len(reference),
+    }
+    if not current or not reference:
+        return outcome
+
+    test = mann_whitney(current, reference)
+    direction = METRICS[metric]
+
+    outcome['p_value'] = test['p_less' if direction < 0 else 'p_greater']
+    outcome['effect_size'] = test['effect_size']
+
+    base = outcome['baseline_median']
+    if base:
+        outcome['change'] = (outcome['median'] - base) / abs(base)
+        worse = outcome['change'] * direction >= min_change
+    else:
+        worse = outcome['median'] * direction > 0
+
+    outcome['passed'] = not (outcome['p_value'] < alpha and worse)
+    return outcome
+
+
+__all__ = [
+    'METRICS',
+    'interval_samples',
+    'mann_whitney',
+    'compare'
+]
@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2016 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Search of the highest UDP rate a path carries without loss.
+
+The offered rate is doubled with short probe runs until one loses traffic,
+then the highest passing rate is searched by bisection between the last
+passing and the first failing probes. Every probe runs against the same
+pooled server, got with :func:`topology_lib_iperf.library.server_acquire`,
+and the loss is read from the traffic the server received::
+
+    rate = find_line_rate(hs1, hs2, '10.0.0.1', start=100e6, maximum=10e9)
+    assert rate['bandwidth'] >= 9e9, rate['probes']
+"""
+
+from __future__ import unicode_literals, absolute_import
+from __future__ import print_function, division
+
+from time import sleep
+
+from .library import (
+    client_start, client_stop, server_acquire, server_release
+)
+
+
+def _received(result):
+    """
+    Get the loss in percent and the received bits per second of a numeric
+    server result, from its summary or from its intervals when the server
+    did not print it yet.
+    """
+    if result is None:
+        return 100.0, 0.0
+
+    summary = result.get('summary')
+    if summary is not None and 'loss' in summary:
+        return summary['loss'], summary['bps']
+
+    intervals = list(result['traffic'].values())
+    total = sum(interval.get('total', 0) for interval in intervals)
+    if not total:
+        return 100.0, 0.0
+
+    lost = sum(interval['lost'] for interval in intervals)
+    return 100.0 * lost / total, sum(
+        interval['bps'] for interval in intervals
+    ) / len(intervals)
+
+
+def probe(
+        server_node,
+        client_node,
+        server_ip,
+        bandwidth,
+        time=2,
+        settle=1,
+        tuning=None,
+        shell=None
+):
+    """
+    Measure the loss of a short UDP run at a given rate.
+
+    :param server_node: Engine node running the iperf server.
+    :type server_node: topology.platforms.base.BaseNode
+    :param client_node: Engine node running the iperf client.
+    :type client_node: topology.platforms.base.BaseNode
+    :param str server_ip: Address of the server node the client connects to.
+    :param float bandwidth: Offered rate in bits per second.
+    :param int time: Seconds the probe runs.
+    :param float settle: Extra seconds to wait after ``time`` for the server
+     to report the traffic.
+    :param dict tuning: Tuning options of the client, see
+     :func:`topology_lib_iperf.library.client_start`.
+    :param str shell: Shell name to execute commands.
+     If ``None``, use the Engine Node default shell.
+    :rtype: dict
+    :return: The offered rate and the received traffic, in bits per second,
+     and its loss in percent:
+
+     ::
+
+        {
+            'bandwidth': 1000000000.0,
+            'throughput': 998000000.0,
+            'loss': 0.0
+        }
+    """
+    server = server_acquire(server_node, udp=True, shell=shell)
+    try:
+        instance_id = client_start(
+            client_node, server_ip, server['port'], time=time, udp=True,
+            bandwidth='{:.0f}'.format(bandwidth), tuning=tuning, shell=shell
+        )
+        sleep(time + settle)
+        client_stop(
+            client_node, instance_id=instance_id, batch=True, reduce=True,
+            shell=shell
+        )
+    finally:
+        result = server_release(
+            server_node, server['instance_id'], shell=shell
+        )
+
+    loss, throughput = _received(result)
+    return {
+        'bandwidth': float(bandwidth),
+        'throughput': throughput,
+        'loss': loss,
+    }
+
+
+def find_line_rate(
+        server_node,
+        client_node,
+        server_ip,
+        start=1e6,
+        maximum=None,
+        max_loss=0.0,
+        precision=0.05,
+        time=2,
+        settle=1,
+        max_probes=20,
+        tuning=None,
+        shell=None
+):
+    """
+    Find the highest UDP rate from a client to a server without loss.
+
+    A probe passes when its loss is at most ``max_loss`` and the server
+    received at least ``1 - precision`` of the offered rate, so a client
+    unable to send as fast as asked does not pass for a faster path. The
+    server is left in the pool of ``server_node`` for the next searches,
+    stop it with :func:`topology_lib_iperf.library.server_pool_stop`. Only
+    iperf is supported, as iperf3 servers report only when they stop.
+
+    :param server_node: Engine node running the iperf server.
+    :type server_node: topology.platforms.base.BaseNode
+    :param client_node: Engine node running the iperf client.
+    :type client_node: topology.platforms.base.BaseNode
+    :param str server_ip: Address of the server node the client connects to.
+    :param float start: First offered rate in bits per second. If it fails,
+     the rate is halved until a probe passes.
+    :param float maximum: Highest rate to offer in bits per second, like the
+     line rate of the path. If ``None``, the rate is doubled until a probe
+     fails.
+    :param float max_loss: Highest acceptable loss in percent.
+    :param float precision: Relative width of the final search interval.
+    :param int time: Seconds each probe runs.
+    :param float settle: Extra seconds to wait after each probe for the
+     server to report the traffic.
+    :param int max_probes: Maximum number of probes, the search stops with
+     the best rate so far when reached.
+    :param dict tuning: Tuning options of the client, see
+     :func:`topology_lib_iperf.library.client_start`.
+    :param str shell: Shell name to execute commands.
+     If ``None``, use the Engine Node default shell.
+    :rtype: dict
+    :return: The best probe, as returned by :func:`probe`, or ``None``
+     values if none passed, and every probe in order under ``probes``:
+
+     ::
+
+        {
+            'bandwidth': 945312500.0,
+            'throughput': 944100000.0,
+            'loss': 0.0,
+            'probes': [...]
+        }
+    """
+    assert start > 0
+    assert maximum is None or maximum >= start
+    assert 0 < precision < 1
+
+    probes = []
+    best = None
+
+    def run(bandwidth):
+        measure = probe(
+            server_node, client_node, server_ip, bandwidth, time=time,
+            settle=settle, tuning=tuning, shell=shell
+        )
+        measure['passed'] = (
+            measure['loss'] <= max_loss and
+            measure['throughput'] >= bandwidth * (1 - precision)
+        )
+        probes.append(measure)
+        return measure
+
+    # Ramp up until a probe fails or the maximum passes
+    low, high = 0.0, None
+    bandwidth = start
+    while len(probes) < max_probes:
+        measure = run(bandwidth)
+        if not measure['passed']:
+            high = bandwidth
+            break
+
+        best, low = measure, bandwidth
+        if maximum is not None and bandwidth >= maximum:
+            break
+        bandwidth = bandwidth * 2
+        if maximum is not None:
+            bandwidth = min(bandwidth, maximum)
+
+    # Bisect between the last passing and the first failing rates
+    while high is not None and len(probes) < max_probes and (
+            high - low > high * precision):
+        bandwidth = (low + high) / 2
+        measure = run(bandwidth)
+        if measure['passed']:
+            best, low = measure, bandwidth
+        else:
+            high = bandwidth
+
+    outcome = {'bandwidth': None, 'throughput': None, 'loss': None}
+    if best is not None:
+        outcome.update(
+            (key, best[key]) for key in ('bandwidth', 'throughput', 'loss')
+        )
+    outcome['probes'] = probes
+    return outcome
+
+
+__all__ = [
+    'probe',
+    'find_line_rate'
+]
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2016 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Statistics summary of parsed iperf results.
+
+NumPy is used to compute the summaries of many results in batch when it is
+installed. Otherwise a pure Python implementation with the same semantics is
+used: percentiles are linearly interpolated and the standard deviation is
+the population one.
+"""
+
+from __future__ import unicode_literals, absolute_import
+from __future__ import print_function, division
+
+from math import sqrt, floor
+
+from .parser import IperfResult, to_bps
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+PERCENTILES = (50, 95, 99)
+"""
+Percentiles included by default in a summary.
+"""
+
+
+def bandwidth_samples(result):
+    """
+    Get the per interval bandwidth of a parsed result in bits per second.
+
+    :param result: A result as returned by
+     :func:`topology_lib_iperf.parser.parse_iperf_server` or
+     :func:`topology_lib_iperf.parser.parse_iperf_client`, in any of its
+     forms (display strings, numeric or compact).
+    :rtype: list
+    """
+    if isinstance(result, IperfResult):
+        return result.bps.tolist()
+
+    traffic = result['traffic']
+    samples = []
+
+    for key in sorted(traffic, key=int):
+        record = traffic[key]
+        if 'bps' in record:
+            samples.append(record['bps'])
+            continue
+
+        value, unit = record['bandwidth'].split()[:2]
+        samples.append(to_bps(value, unit))
+
+    return samples
+
+
+def _empty_summary(percentiles):
+    summary = {
+        'count': 0,
+        'mean': None,
+        'min': None,
+        'max': None,
+        'stddev': None,
+        'cv': None,
+    }
+    for percentile in percentiles:
+        summary['p{}'.format(percentile)] = None
+    return summary
+
+
+def _summarize_python(samples, percentiles):
+    """
+    Pure Python implementation of :func:`summarize`.
+    """
+    summaries = []
+
+    for values in samples:
+        summary = _empty_summary(percentiles)
+        summaries.append(summary)
+
+        count = len(values)
+        if not count:
+            continue
+
+        ordered = sorted(values)
+        mean = sum(ordered) / count
+        stddev = sqrt(sum((value - mean) ** 2 for value in ordered) / count)
+
+        summary.update({
+            'count': count,
+            'mean': mean,
+            'min': ordered[0],
+            'max': ordered[-1],
+            'stddev': stddev,
+            'cv': stddev / mean if mean else None,
+        })
+
+        for percentile in percentiles:
+            position = percentile / 100 * (count - 1)
+            low = int(floor(position))
+            high = min(low + 1, count - 1)
+            summary['p{}'.format(percentile)] = (
+                ordered[low] +
+                (ordered[high] - ordered[low]) * (position - low)
+            )
+
+    return summaries
+
+
+def _summarize_numpy(samples, percentiles):
+    """
+    NumPy implementation of :func:`summarize`.
+
+    All samples are concatenated and sorted once per segment with a single
+    :func:`numpy.lexsort`, then every statistic is computed for all the
+    segments at once.
+    """
+    summaries = [_empty_summary(percentiles) for _ in samples]
+
+    lengths = numpy.array([len(values) for values in samples], dtype=int)
+    used = numpy.flatnonzero(lengths)
+    if not used.size:
+        return summaries
+
+    lengths = lengths[used]
+    values = numpy.concatenate(
+        [numpy.asarray(samples[index], dtype=float) for index in used]
+    )
+    segments = numpy.repeat(numpy.arange(used.size), lengths)
+    starts = numpy.concatenate(([0], numpy.cumsum(lengths)[:-1]))
+
+    ordered = values[numpy.lexsort((values, segments))]
+
+    means = numpy.add.reduceat(ordered, starts) / lengths
+    deviations = (ordered - means[segments]) ** 2
+    stddevs = numpy.sqrt(numpy.add.reduceat(deviations, starts) / lengths)
+
+    columns = {
+        'count': lengths,
+        'mean': means,
+        'min': ordered[starts],
+        'max': ordered[starts + lengths - 1],
+        'stddev': stddevs,
+    }
+
+    for percentile in percentiles:
+        positions = percentile / 100 * (lengths - 1)
+        low = numpy.floor(positions).astype(int)
+        high = numpy.minimum(low + 1, lengths - 1)
+        columns['p{}'.format(percentile)] = (
+            ordered[starts + low] +
+            (ordered[starts + high] - ordered[starts + low]) *
+            (positions - low)
+        )
+
+    for row, index in enumerate(used):
+        summary = summaries[index]
+        for name, column in columns.items():
+            summary[name] = column[row].item()
+        summary['cv'] = (
+            summary['stddev'] / summary['mean'] if summary['mean'] else None
+        )
+
+    return summaries
+
+
+def summarize(results, percentiles=PERCENTILES):
+    """
+    Compute statistics of the per interval bandwidth of parsed results.
+
+    ::
+
+        {
+            'count': 4,
+            'mean': 14350000000.0,
+            'min': 10000000000.0,
+            'max': 16000000000.0,
+            'p50': 15700000000.0,
+            'p95': 15970000000.0,
+            'p99': 15994000000.0,
+            'stddev': 2515452245.621053,
+            'cv': 0.17529283941610125
+        }
+
+    All bandwidth values are in bits per second. Statistics of a result
+    without traffic intervals are ``None``.
+
+    :param results: A result as returned by the parse functions, or a list of
+     them to summarize a whole test matrix in one call.
+    :param tuple percentiles: Percentiles to compute, from 0 to 100.
+    :return: A summary dictionary, or a list of them in the same order as
+     ``results`` when a list is given.
+    """
+    single = isinstance(results, Mapping)
+    if single:
+        results = [results]
+
+    samples = [bandwidth_samples(result) for result in results]
+
+    if numpy is not None:
+        summaries = _summarize_numpy(samples, percentiles)
+    else:
+        summaries = _summarize_python(samples, percentiles)
+
+    return summaries[0] if single else summaries
+
+
+__all__ = [
+    'PERCENTILES',
+    'bandwidth_samples',
+    'summarize'
+]
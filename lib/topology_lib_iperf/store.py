@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2016 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Append-only columnar store of parsed iperf results.
+
+A store is a directory holding one binary file per interval column, in the
+machine native layout of :class:`array.array`, and a ``runs.jsonl`` file with
+one JSON line per stored result: its run metadata, summary and the rows of
+its intervals in the columns.
+
+::
+
+    store = ResultStore('/var/lib/iperf-history')
+    store.append(client_stop(hs1), node='hs1', port=5001, udp=False,
+                 bandwidth=None, duration=10)
+
+    runs = store.runs(node='hs1', udp=False)
+    baseline = store.values('bps', runs)
+
+Columns are read through memory maps, so only the pages of the rows used are
+loaded. A run is committed by writing its ``runs.jsonl`` line after its
+columns, and rows past the last committed run are discarded by the next
+append, so an interrupted append leaves the store consistent. Appends lock
+``runs.jsonl``, where supported, and first read the runs committed by other
+stores of the same directory, so several processes can append to it.
+"""
+
+from __future__ import unicode_literals, absolute_import
+from __future__ import print_function, division
+
+from io import open
+from os import makedirs
+from os.path import exists, join
+from json import dumps, loads
+from time import time
+from array import array
+from mmap import mmap, ACCESS_READ
+
+from .parser import IperfResult, to_bps, to_bytes
+
+try:
+    from fcntl import flock, LOCK_EX
+except ImportError:
+    flock = None
+
+
+COLUMNS = IperfResult.COLUMNS + IperfResult.UDP_COLUMNS
+"""
+Stored columns and their :mod:`array` type codes. UDP columns of TCP
+intervals hold ``nan`` or ``0``.
+"""
+
+RUNS = 'runs.jsonl'
+"""
+File of the run metadata, in the store directory.
+"""
+
+_NAN = float('nan')
+
+
+def _intervals(result):
+    """
+    Get the columns of the intervals of a result in any of its forms.
+
+    :rtype: dict
+    :return: An :class:`array.array` of each column.
+    """
+    columns = {name: array(typecode) for name, typecode in COLUMNS}
+
+    if isinstance(result, IperfResult):
+        count = len(result.start)
+        for name, typecode in COLUMNS:
+            if name in result.columns:
+                columns[name] = getattr(result, name)
+            else:
+                columns[name].extend([
+                    _NAN if typecode == 'd' else 0
+                ] * count)
+        return columns
+
+    traffic = result['traffic']
+    for key in sorted(traffic, key=int):
+        record = traffic[key]
+
+        if 'bps' in record:
+            numeric = record
+        else:
+            numeric = {
+                'start': _NAN,
+                'end': _NAN,
+                'bytes': to_bytes(*record['transfer'].split()[:2]),
+                'bps': to_bps(*record['bandwidth'].split()[:2]),
+            }
+            if 'jitter' in record:
+                numeric.update({
+                    'jitter': float(record['jitter'].split()[0]),
+                    'lost': int(record['lost']),
+                    'total': int(record['total']),
+                    'loss': float(record['loss'].rstrip('%')),
+                })
+
+        for name, typecode in COLUMNS:
+            value = numeric.get(name)
+            if value is None:
+                value = _NAN if typecode == 'd' else 0
+            columns[name].append(value)
+
+    return columns
+
+
+class ResultStore(object):
+    """
+    Append-only columnar store of parsed iperf results.
+
+    :param str path: Directory of the store, created if missing.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        if not exists(path):
+            makedirs(path)
+
+        self._maps = {}
+        self._runs = []
+        self._rows = 0
+        self._committed = 0
+
+        runs = join(path, RUNS)
+        if exists(runs):
+            with open(runs, 'rb') as fd:
+                self._load(fd)
+
+    def _load(self, fd):
+        """
+        Read the runs committed to an open ``runs.jsonl`` file since the last
+        read.
+        """
+        fd.seek(self._committed)
+        for line in fd:
+            if not line.endswith(b'\n'):
+                # Interrupted while committing this run
+                break
+            run = loads(line.decode('utf-8'))
+            self._runs.append(run)
+            self._rows = run['offset'] + run['rows']
+            self._committed += len(line)
+
+    def _column_path(self, name):
+        return join(self.path, '{}.col'.format(name))
+
+    def __len__(self):
+        return len(self._runs)
+
+    def append(self, result, **metadata):
+        """
+        Append a parsed result.
+
+        :param result: A result as returned by
+         :func:`topology_lib_iperf.library.client_stop` or
+         :func:`topology_lib_iperf.library.server_stop`, in any of its forms
+         (display strings, numeric or compact).
+        :param metadata: JSON serializable run metadata, like ``node``,
+         ``port``, ``udp``, ``bandwidth`` and ``duration``. The time of the
+         append is added as ``time`` unless given.
+        :rtype: dict
+        :return: The stored run.
+        """
+        columns = _intervals(result)
+        rows = len(columns['start'])
+
+        with open(join(self.path, RUNS), 'a+b') as runs:
+            if flock is not None:
+                # Released when closed
+                flock(runs.fileno(), LOCK_EX)
+            self._load(runs)
+
+            for name, typecode in COLUMNS:
+                path = self._column_path(name)
+                size = self._rows * array(typecode).itemsize
+                with open(path, 'r+b' if exists(path) else 'wb') as fd:
+                    # Drop the rows of an interrupted append
+                    fd.truncate(size)
+                    fd.seek(size)
+                    columns[name].tofile(fd)
+
+            run = {
+                'run': len(self._runs),
+                'offset': self._rows,
+                'rows': rows,
+                'summary': result.get('summary'),
+                'connection': {
+                    key: result[key] for key in (
+                        'server', 'server_port', 'client', 'client_port'
+                    ) if key in result
+                },
+                'time': time(),
+            }
+            run.update(metadata)
+
+            line = (dumps(run, sort_keys=True) + '\n').encode('utf-8')
+            # Drop the line of an interrupted commit
+            runs.truncate(self._committed)
+            runs.write(line)
+
+        self._runs.append(run)
+        self._rows += rows
+        self._committed += len(line)
+        return run
+
+    def runs(self, **filters):
+        """
+        Get the stored runs, in order of append.
+
+        :param filters: Metadata values the runs must have.
+        :rtype: list
+        """
+        return [
+            run for run in self._runs
+            if all(run.get(key) == value for key, value in filters.items())
+        ]
+
+    def column(self, name):
+        """
+        Get a whole column, memory mapped.
+
+        :param str name: Column name, one of :data:`COLUMNS`.
+        :return: A read only sequence of the column values, a
+         :class:`memoryview` over a memory map when supported.
+        """
+        typecode = dict(COLUMNS)[name]
+        size = self._rows * array(typecode).itemsize
+
+        if not size:
+            return array(typecode)
+
+        mapped = self._maps.get(name)
+        if mapped is None or len(mapped) < size:
+            # A smaller map of the column is left to be closed when the views
+            # still using it are released
+            with open(self._column_path(name), 'rb') as fd:
+                mapped = self._maps[name] = mmap(
+                    fd.fileno(), 0, access=ACCESS_READ
+                )
+
+        try:
+            return memoryview(mapped)[:size].cast(str(typecode))
+        except AttributeError:
+            # Python 2 memoryviews cannot be cast
+            values = array(typecode)
+            values.fromstring(mapped[:size])
+            return values
+
+    def intervals(self, run, columns=None):
+        """
+        Get the intervals of a run.
+
+        :param dict run: Run as returned by :meth:`runs`.
+        :param columns: Names of the columns to get. Default is all of them.
+        :rtype: dict
+        :return: A read only sequence of each column values.
+        """
+        start = run['offset']
+        end = start + run['rows']
+        return {
+            name: self.column(name)[start:end]
+            for name in (columns or [name for name, _ in COLUMNS])
+        }
+
+    def values(self, name, runs=None):
+        """
+        Get the values of a column for several runs, as baseline samples.
+
+        :param str name: Column name.
+        :param list runs: Runs as returned by :meth:`runs`. Default is all of
+         them.
+        :rtype: list
+        """
+        column = self.column(name)
+        values = []
+        for run in (self._runs if runs is None else runs):
+            values.extend(column[run['offset']:run['offset'] + run['rows']])
+        return values
+
+    def close(self):
+        """
+        Release the memory maps of the columns. Maps still used by sequences
+        returned by :meth:`column` or :meth:`intervals` are closed when those
+        are garbage collected.
+        """
+        for mapped in self._maps.values():
+            try:
+                mapped.close()
+            except BufferError:
+                pass
+        self._maps.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+__all__ = [
+    'COLUMNS',
+    'ResultStore'
+]
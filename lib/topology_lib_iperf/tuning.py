@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2016 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Tuning options of the iperf command lines.
+
+Options are given as a dictionary, validated and turned into the arguments
+of the iperf binary in use:
+
+::
+
+    client_start(hs1, '10.0.0.2', 5001, tuning={
+        'window': '4M', 'length': '128K', 'nodelay': True
+    })
+"""
+
+from __future__ import unicode_literals, absolute_import
+from __future__ import print_function, division
+
+from re import compile
+from collections import namedtuple
+
+try:
+    string_types = (basestring,)  # noqa
+except NameError:
+    string_types = (str,)
+
+
+SIZE_RE = compile(r'^[0-9]+(\.[0-9]+)?[KMGkmg]?$')
+"""
+Regular expression matching the sizes accepted by iperf, in bytes or with a
+``K``, ``M`` or ``G`` suffix.
+"""
+
+Option = namedtuple('Option', ['flags', 'kind', 'sides', 'tcp'])
+"""
+Tuning option: its iperf and iperf3 flags, the kind of its value, the sides
+accepting it with iperf and with iperf3, and whether it only applies to TCP.
+"""
+
+_BOTH = ('server', 'client')
+_CLIENT = ('client',)
+
+OPTIONS = {
+    'window': Option(('-w', '-w'), 'size', (_BOTH, _CLIENT), False),
+    'length': Option(('-l', '-l'), 'size', (_BOTH, _CLIENT), False),
+    'mss': Option(('-M', '-M'), 'integer', (_BOTH, _CLIENT), True),
+    'nodelay': Option(('-N', '-N'), 'flag', (_CLIENT, _CLIENT), True),
+    'tos': Option(('-S', '-S'), 'byte', (_CLIENT, _CLIENT), False),
+    'bind': Option(('-B', '-B'), 'address', (_BOTH, _BOTH), False),
+    'num': Option(('-n', '-n'), 'size', (_CLIENT, _CLIENT), False),
+    'ipv6': Option(('-V', '-6'), 'flag', (_BOTH, _BOTH), False),
+}
+"""
+Supported tuning options:
+
+- ``window``: TCP window size, or UDP buffer size (``-w``).
+- ``length``: Length of the read and write buffers (``-l``).
+- ``mss``: TCP maximum segment size in bytes (``-M``).
+- ``nodelay``: Disable Nagle's algorithm (``-N``).
+- ``tos``: Type of service byte of the packets, like ``0x10`` (``-S``).
+- ``bind``: Address to bind to (``-B``).
+- ``num``: Bytes to transmit instead of running for a time (``-n``).
+- ``ipv6``: Use IPv6 (``-V``, or ``-6`` with iperf3).
+
+Sizes are in bytes, or strings with a ``K``, ``M`` or ``G`` suffix.
+
+iperf3 servers take the ``window``, ``length`` and ``mss`` of their clients,
+so these options are only accepted by iperf3 clients.
+"""
+
+
+def _check(name, kind, value):
+    """
+    Check the value of an option and get its argument, or ``None`` for an
+    unset flag.
+    """
+    if kind == 'flag':
+        assert isinstance(value, bool), \
+            'Tuning option {} must be a boolean'.format(name)
+        return '' if value else None
+
+    if kind == 'size':
+        assert SIZE_RE.match(str(value)) and float(
+            str(value).rstrip('KMGkmg')
+        ) > 0, 'Tuning option {} must be a positive size'.format(name)
+        return str(value)
+
+    if kind == 'integer':
+        assert not isinstance(value, bool) and isinstance(value, int) and \
+            value > 0, \
+            'Tuning option {} must be a positive integer'.format(name)
+        return str(value)
+
+    if kind == 'byte':
+        if not isinstance(value, int):
+            try:
+                value = int(value, 0)
+            except (TypeError, ValueError):
+                value = -1
+        assert 0 <= value <= 255, \
+            'Tuning option {} must be a byte'.format(name)
+        return '0x{:02x}'.format(value)
+
+    assert isinstance(value, string_types) and value and not any(
+        char.isspace() for char in value
+    ), \
+        'Tuning option {} must be an address'.format(name)
+    return value
+
+
+def tuning_arguments(tuning, side, backend='iperf', udp=False):
+    """
+    Validate tuning options and get their command line arguments.
+
+    >>> tuning_arguments({'window': '4M', 'nodelay': True}, 'client')
+    ['-N', '-w 4M']
+
+    :param dict tuning: Values of the options, by name in :data:`OPTIONS`.
+     Options set to ``None`` and flags set to ``False`` are ignored.
+    :param str side: ``'server'`` or ``'client'``.
+    :param str backend: ``'iperf'`` or ``'iperf3'``.
+    :param bool udp: Whether the test is UDP, which rejects the TCP only
+     options.
+    :rtype: list
+    :return: The arguments, sorted by option name.
+    """
+    assert side in ('server', 'client')
+
+    arguments = []
+    for name, value in sorted(tuning.items()):
+        assert name in OPTIONS, 'Unknown tuning option {}'.format(name)
+        if value is None:
+            continue
+
+        option = OPTIONS[name]
+        argument = _check(name, option.kind, value)
+        if argument is None:
+            continue
+
+        assert side in option.sides[backend == 'iperf3'], \
+            'Tuning option {} is not supported by the {} {}'.format(
+                name, backend, side
+            )
+        assert not (udp and option.tcp), \
+            'Tuning option {} only applies to TCP'.format(name)
+
+        flag = option.flags[backend == 'iperf3']
+        arguments.append(
+            '{} {}'.format(flag, argument) if argument else flag
+        )
+
+    return arguments
+
+
+__all__ = [
+    'OPTIONS',
+    'tuning_arguments'
+]
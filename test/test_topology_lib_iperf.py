@@ -24,6 +24,18 @@ See http://pythontesting.net/framework/pytest/pytest-introduction/#fixtures
 from __future__ import unicode_literals, absolute_import
 from __future__ import print_function, division
 
+from os import getpid
+from re import search
+from threading import Event
+from subprocess import Popen, check_output
+
+from pytest import importorskip, raises
+
+from topology_lib_iperf import aio, library
+from topology_lib_iperf.library import client_start, client_stop, IperfState
+from topology_lib_iperf.orchestration import run_traffic_matrix, PHASES
+from topology_lib_iperf.parser import BATCH_MARKER
+
 # Add your test cases here.
 
 
@@ -32,3 +44,681 @@ def test_your_test_case():
     Document your test case here.
     """
     pass
+
+
+class FakeEnode(object):
+    """
+    Engine node double that records commands and replies with canned output.
+
+    :param dict responses: Output for commands containing each key.
+    """
+
+    def __init__(self, responses=None):
+        self.commands = []
+        self.responses = responses or {}
+
+    def __call__(self, command, shell=None):
+        self.commands.append(command)
+        for key, response in self.responses.items():
+            if key in command:
+                return response
+        return '[1] 1234'
+
+
+def test_client_iperf3_parallel():
+    """
+    Check the iperf3 backend command line and that its JSON output is parsed
+    on stop.
+    """
+    enode = FakeEnode({
+        'cat ': (
+            '{"start": {"connected": [{"socket": 5, "local_host": "10.0.0.1",'
+            ' "local_port": 40000, "remote_host": "10.0.0.2",'
+            ' "remote_port": 5201}]}, "intervals": [{"streams": [{'
+            '"socket": 5, "start": 0, "end": 1, "bytes": 1000,'
+            ' "bits_per_second": 8000}]}], "end": {}}'
+        ),
+    })
+
+    client_start(
+        enode, '10.0.0.2', 5201, time=5, parallel=2, backend='iperf3'
+    )
+    assert enode.commands[0] == (
+        'iperf3 -c 10.0.0.2 -p 5201 -i 1 -t 5 -P 2 -J '
+        '2>&1 > /tmp/iperf_client-1.log &'
+    )
+
+    # The JSON output cannot be polled nor reduced, and the client is kept
+    # running
+    commands = len(enode.commands)
+    with raises(AssertionError):
+        library.client_poll(enode)
+    with raises(AssertionError):
+        client_stop(enode, reduce=True)
+    assert len(enode.commands) == commands
+    assert 1 in enode._lib_state_iperfstate.client_pids
+
+    result = client_stop(enode)
+    assert result['server_port'] == '5201'
+    assert result['traffic']['0']['bps'] == 8000.0
+
+
+def test_stop_all_iperf3_reduce():
+    """
+    Check that no instance is stopped when one of them cannot be reduced.
+    """
+    enode = FakeEnode()
+    library.server_start(enode, port=5001)
+    client_start(enode, '10.0.0.2', 5201, backend='iperf3')
+
+    commands = len(enode.commands)
+    with raises(AssertionError):
+        library.stop_all(enode, reduce=True)
+
+    state = enode._lib_state_iperfstate
+    assert len(enode.commands) == commands
+    assert list(state.server_pids) == [1]
+    assert list(state.client_pids) == [1]
+
+
+def test_run_traffic_matrix():
+    """
+    Check that a traffic matrix is started and stopped on every node and its
+    results are keyed by pair.
+    """
+    server_output = (
+        '[  4] local 10.0.0.1 port 5001 connected with 10.0.0.2 port 40000\n'
+        '[  4]  0.0- 1.0 sec  1.84 GBytes  15.8 Gbits/sec\n'
+    )
+    client_output = (
+        '[  3] local 10.0.0.2 port 40000 connected with 10.0.0.1 port 5001\n'
+        '[  3]  0.0- 1.0 sec  1.84 GBytes  15.8 Gbits/sec\n'
+    )
+
+    def node():
+        return FakeEnode({
+            'cat /tmp/iperf_server': server_output,
+            'cat /tmp/iperf_client': client_output,
+        })
+
+    hs1, hs2, hs3 = node(), node(), node()
+
+    result = run_traffic_matrix(
+        {(hs1, '10.0.0.1', 5001): [hs2, hs3]}, time=0, settle=0
+    )
+
+    assert sorted(result['timings']) == sorted(PHASES)
+    assert result['servers'][(hs1, 5001)]['server_port'] == '5001'
+    assert result['clients'][(hs1, 5001, hs3)]['traffic']['0'] == {
+        'transfer': '1.84 GBytes',
+        'bandwidth': '15.8 Gbits/sec'
+    }
+    assert hs2.commands[0].startswith('iperf -c 10.0.0.1 -p 5001 ')
+    assert hs1.commands[-1].endswith('cat /tmp/iperf_server-1.log')
+
+
+def test_run_traffic_matrix_failure():
+    """
+    Check that the instances started are stopped when a phase fails.
+    """
+    class FailingEnode(FakeEnode):
+        def __call__(self, command, shell=None):
+            if command.startswith('iperf -c'):
+                raise RuntimeError('client failed')
+            return super(FailingEnode, self).__call__(command, shell=shell)
+
+    hs1, hs2 = FakeEnode(), FailingEnode()
+    library.server_start(hs1, 6000)
+
+    try:
+        run_traffic_matrix(
+            {(hs1, '10.0.0.1', 5001): [hs2]}, time=0, settle=0
+        )
+    except RuntimeError as error:
+        assert 'client failed' in str(error)
+    else:
+        raise AssertionError('Failed phase not raised')
+
+    # The server started by hand is left running
+    assert hs1.commands[1].startswith('iperf -s -p 5001')
+    assert '/tmp/iperf_server-2.log' in hs1.commands[1]
+    assert 'kill' in hs1.commands[-1]
+    assert hs1._lib_state_iperfstate.server_pids == {1: 1234}
+
+
+def test_positional_arguments():
+    """
+    Check that the arguments of the first releases can still be given by
+    position.
+    """
+    enode = FakeEnode()
+
+    server = library.server_start(enode, 5001, 2, True, 3, 'bash')
+    client_start(enode, '10.0.0.2', 5001, 2, 5, True, '1M', 4, 'bash')
+
+    assert server == {'port': 5001, 'instance_id': 3}
+    assert enode.commands[0].startswith('iperf -s -p 5001 -i 2 -u ')
+    assert enode.commands[1].startswith(
+        'iperf -c 10.0.0.2 -p 5001 -i 2 -t 5 -u -b 1M '
+    )
+    assert enode._lib_state_iperfstate.client_pids == {4: 1234}
+
+
+def test_client_stop_batch():
+    """
+    Check that a batched stop makes a single round-trip and parses only the
+    log section of its output.
+    """
+    enode = FakeEnode()
+    client_start(enode, '10.0.0.2', 5001, instance_id=3)
+
+    enode.responses['kill -INT'] = (
+        'killed 1234\n'
+        '[1]+  Killed                  iperf -c 10.0.0.2\n'
+        '__topology_lib_iperf_batch__\n'
+        '[  3] local 10.0.0.1 port 40000 connected with 10.0.0.2 port 5001\n'
+        '[  3]  0.0- 1.0 sec  1.84 GBytes  15.8 Gbits/sec\n'
+    )
+    result = client_stop(enode, instance_id=3, batch=True)
+
+    assert len(enode.commands) == 2
+    assert enode.commands[1].startswith('for pid in 1234; do kill -INT')
+    assert enode.commands[1].endswith(
+        'echo __topology_lib_iperf_batch__; cat /tmp/iperf_client-3.log'
+    )
+    assert result['client_port'] == '40000'
+    assert len(result['traffic']) == 1
+
+
+class ShellEnode(object):
+    """
+    Engine node double that runs commands in a local shell, stripping their
+    output like topology shells do.
+    """
+
+    def __call__(self, command, shell=None):
+        return check_output(command, shell=True).decode('utf-8').strip()
+
+
+def test_client_poll(tmpdir, monkeypatch):
+    """
+    Check that polling a log only returns the lines completed since the
+    previous poll, including a line split between two polls.
+    """
+    log = tmpdir.join('iperf_client-1.log')
+    monkeypatch.setattr(library, 'CLIENT_LOG', str(tmpdir.join(
+        'iperf_client-{}.log'
+    )))
+
+    enode = ShellEnode()
+    enode._lib_state_iperfstate = state = IperfState()
+    state.client_pids[1] = 1234
+    state.client_backends[1] = 'iperf'
+
+    log.write(
+        '[  3] local 10.0.0.1 port 40000 connected with 10.0.0.2 port 5001\n'
+        '[  3]  0.0- 1.0 sec  1.84 GBytes  15.8 Gbits/sec\n'
+        '[  3]  1.0- 2.0 sec  1.82 GB'
+    )
+    records = library.client_poll(enode, numeric=True)
+    assert [kind for kind, _, _ in records] == ['connection', 'traffic']
+    assert state.client_tails[1]['offset'] == log.size()
+
+    log.write('ytes  15.6 Gbits/sec\n', mode='a')
+    records = library.client_poll(enode)
+    assert records == [('traffic', '3', {
+        'start': 1.0,
+        'end': 2.0,
+        'bytes': 1954210120,
+        'bps': 15.6e9,
+    })]
+
+    assert library.client_poll(enode) == []
+
+    log.write('[  3]  0.0- 2.0 sec  3.66 GBytes  15.7 Gbits/sec\n', mode='a')
+    records = library.client_poll(enode)
+    assert [kind for kind, _, _ in records] == ['summary']
+    assert state.client_tails[1]['offset'] == log.size()
+
+
+def test_client_watch_abort():
+    """
+    Check that the watchdog stops a client whose bandwidth stays below the
+    minimum and reports why.
+    """
+    output = (
+        '[  3] local 10.0.0.1 port 40000 connected with 10.0.0.2 port 5001\n'
+        '[  3]  0.0- 1.0 sec  1.84 GBytes  15.8 Gbits/sec\n'
+        '[  3]  1.0- 2.0 sec  12.0 KBytes  98.3 Kbits/sec\n'
+        '[  3]  2.0- 3.0 sec  0.00 Bytes  0.00 bits/sec\n'
+    )
+    enode = FakeEnode({
+        'wc -c': '{0}\n__topology_lib_iperf_batch__\n{1}\n'
+                 '__topology_lib_iperf_batch__'.format(len(output), output),
+        'cat ': output,
+    })
+    client_start(enode, '10.0.0.2', 5001)
+
+    outcome = library.client_watch(
+        enode, min_bandwidth=1e9, intervals=2, poll_interval=0
+    )
+
+    assert outcome['aborted']
+    assert outcome['reason'] == (
+        'bandwidth below 1000000000.0 bps for 2 intervals'
+    )
+    assert enode.commands[-2].startswith('for pid in 1234; do kill -INT')
+    assert len(outcome['result']['traffic']) == 3
+
+
+def test_client_watch_exit(tmpdir, monkeypatch):
+    """
+    Check that the watchdog ends once the client exits, with or without its
+    summary.
+    """
+    monkeypatch.setattr(library, 'CLIENT_LOG', str(tmpdir.join(
+        'iperf_client-{}.log'
+    )))
+    log = tmpdir.join('iperf_client-1.log')
+    intervals = (
+        '[  3] local 10.0.0.1 port 40000 connected with 10.0.0.2 port 5001\n'
+        '[  3]  0.0- 1.0 sec  1.84 GBytes  15.8 Gbits/sec\n'
+    )
+
+    exited = Popen('true', shell=True)
+    exited.wait()
+
+    enode = ShellEnode()
+    enode._lib_state_iperfstate = state = IperfState()
+
+    for output, reason in (
+            (intervals + '[  3]  0.0- 1.0 sec  1.84 GBytes  15.8 Gbits/sec\n',
+             None),
+            (intervals, 'exited without a summary')):
+        log.write(output)
+        state.client_pids[1] = exited.pid
+        state.client_backends[1] = 'iperf'
+
+        outcome = library.client_watch(enode, poll_interval=0)
+
+        assert outcome['aborted'] == (reason is not None)
+        assert outcome['reason'] == reason
+        assert len(outcome['result']['traffic']) == 1
+
+
+class LogEnode(FakeEnode):
+    """
+    Engine node double serving a log the way a shell would: polls get the
+    bytes after their offset, and the output is stripped like topology
+    shells do.
+    """
+
+    def __init__(self, responses=None):
+        FakeEnode.__init__(self, responses)
+        self.log = ''
+
+    def __call__(self, command, shell=None):
+        start = search(r'tail -c \+(\d+) ', command)
+        if start is not None:
+            self.commands.append(command)
+            return '{size}\n{marker}\n{data}\n{marker}\nalive 1234'.format(
+                size=len(self.log), marker=BATCH_MARKER,
+                data=self.log[int(start.group(1)) - 1:]
+            ).strip()
+        if 'cat ' in command:
+            self.commands.append(command)
+            return self.log.strip()
+        return FakeEnode.__call__(self, command, shell)
+
+
+def test_server_pool():
+    """
+    Check that servers get free ports and instance IDs, that conflicts are
+    refused and that an idle pooled server is reused by the next client,
+    returning only the traffic of that client.
+    """
+    enode = LogEnode()
+
+    first = library.server_acquire(enode)
+    second = library.server_acquire(enode)
+    assert first == {'port': 5001, 'instance_id': 1, 'reused': False}
+    assert second == {'port': 5002, 'instance_id': 2, 'reused': False}
+
+    try:
+        library.server_start(enode, port=5002)
+    except AssertionError as error:
+        assert 'Port 5002' in str(error)
+    else:
+        raise AssertionError('Port conflict not detected')
+
+    enode.log += (
+        '[  4] local 10.0.0.2 port 5001 connected with 10.0.0.1 port 40000\n'
+        '[  4]  0.0- 1.0 sec  1.84 GBytes  15.8 Gbits/sec\n'
+        '[  4]  1.0- 2.0 sec  1.84 GBytes  15.8 Gbits/sec\n'
+        '[  4]  0.0- 2.0 sec  3.68 GBytes  15.8 Gbits/sec\n'
+    )
+    result = library.server_release(enode, 1)
+    assert result['client_port'] == '40000'
+    assert len(result['traffic']) == 2
+    assert result['summary']['bytes'] == 2 * 1975684956
+
+    assert library.server_acquire(enode) == {
+        'port': 5001, 'instance_id': 1, 'reused': True
+    }
+    enode.log += (
+        '[  5] local 10.0.0.2 port 5001 connected with 10.0.0.1 port 40002\n'
+        '[  5]  0.0- 1.0 sec  1.82 GBytes  15.6 Gbits/sec\n'
+        '[  5]  0.0- 1.0 sec  1.82 GBytes  15.6 Gbits/sec\n'
+    )
+    result = library.server_release(enode, 1)
+    assert result['client_port'] == '40002'
+    assert len(result['traffic']) == 1
+    assert result['summary']['bps'] == 15.6e9
+
+    assert library.server_acquire(enode, udp=True)['instance_id'] == 3
+
+    assert sorted(library.server_pool_stop(enode)) == [1, 2, 3]
+    state = enode._lib_state_iperfstate
+    assert not state.server_pids and not state.server_pool
+    assert state.allocate_port() == 5001
+
+
+def test_server_wait(tmpdir, monkeypatch):
+    """
+    Check that the readiness wait returns once the server log shows it
+    listening, and fails fast when the server exited.
+    """
+    log = tmpdir.join('iperf_server-1.log')
+    monkeypatch.setattr(library, 'SERVER_LOG', str(tmpdir.join(
+        'iperf_server-{}.log'
+    )))
+    log.write('')
+
+    enode = ShellEnode()
+    enode._lib_state_iperfstate = state = IperfState()
+    state.server_pids[1] = getpid()
+    state.server_ports[1] = 1
+
+    try:
+        library.server_wait(enode, timeout=0.05)
+    except RuntimeError as error:
+        assert 'not listening after 0.05 seconds' in str(error)
+    else:
+        raise AssertionError('Timeout not detected')
+
+    log.write('Server listening on TCP port 1\n')
+    assert library.server_wait(enode) >= 0
+
+    exited = Popen('true', shell=True)
+    exited.wait()
+    state.server_pids[1] = exited.pid
+    log.write('bind failed: Address in use\n')
+
+    try:
+        library.server_wait(enode)
+    except RuntimeError as error:
+        assert 'bind failed' in str(error)
+    else:
+        raise AssertionError('Exited server not detected')
+
+
+def test_server_wait_status():
+    """
+    Check that the readiness wait only reads its own status lines.
+    """
+    enode = FakeEnode({
+        'kill -0': '[1]+  Done  iperf -s already exited\nexited already'
+    })
+    library.server_start(enode, port=5001)
+
+    try:
+        library.server_wait(enode, timeout=0.05)
+    except RuntimeError as error:
+        assert 'not listening after 0.05 seconds' in str(error)
+    else:
+        raise AssertionError('Status read from a job message')
+
+    enode.responses['kill -0'] = '[1]+  Done  iperf -c\r\nready\r\n'
+    assert library.server_wait(enode) >= 0
+
+
+def test_aio_sessions():
+    """
+    Check that asyncio sessions on many nodes run concurrently, in order for
+    each node, and share the node state with the blocking API.
+    """
+    asyncio = importorskip('asyncio')
+    loop = asyncio.new_event_loop()
+
+    output = (
+        '[  3] local 10.0.0.1 port 40000 connected with 10.0.0.2 port 5001\n'
+        '[  3]  0.0- 1.0 sec  1.84 GBytes  15.8 Gbits/sec\n'
+    )
+    enodes = [FakeEnode({'cat ': output}) for _ in range(20)]
+
+    def session(enode):
+        return aio.server_start(enode), aio.client_start(
+            enode, '10.0.0.2', 5001
+        ), aio.client_stop(enode)
+
+    try:
+        asyncio.set_event_loop(loop)
+        futures = [future for enode in enodes for future in session(enode)]
+        results = loop.run_until_complete(asyncio.gather(*futures))
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+    assert results[:2] == [{'port': 5001, 'instance_id': 1}, 1]
+    assert results[2]['client_port'] == '40000'
+    for enode in enodes:
+        assert enode.commands[0].startswith('iperf -s -p 5001')
+        assert enode.commands[1].startswith('iperf -c 10.0.0.2')
+        assert enode._lib_state_iperfstate.server_pids == {1: 1234}
+
+
+def test_aio_cancel():
+    """
+    Check that a call cancelled while its thread runs keeps the node until
+    the thread returns.
+    """
+    asyncio = importorskip('asyncio')
+    loop = asyncio.new_event_loop()
+
+    enode = FakeEnode({})
+    started = Event()
+    release = Event()
+    calls = []
+
+    def call(enode, name):
+        calls.append((name, release.is_set()))
+        if name == 'first':
+            started.set()
+            release.wait(5)
+        return name
+
+    try:
+        asyncio.set_event_loop(loop)
+        first = aio._submit(call, enode, 'first')
+        loop.run_until_complete(loop.run_in_executor(None, started.wait, 5))
+        first.cancel()
+
+        second = aio._submit(call, enode, 'second')
+        loop.call_later(0.1, release.set)
+        assert loop.run_until_complete(second) == 'second'
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+    assert calls == [('first', False), ('second', True)]
+
+
+def test_client_stop_reduced(tmpdir, monkeypatch):
+    """
+    Check that logs reduced on the node keep the connection and summaries,
+    and only the requested intervals.
+    """
+    monkeypatch.setattr(library, 'CLIENT_LOG', str(tmpdir.join(
+        'iperf_client-{}.log'
+    )))
+    tmpdir.join('iperf_client-1.log').write(
+        '------------------------------------------------------------\n'
+        'Client connecting to 10.0.0.2, UDP port 5001\n'
+        '------------------------------------------------------------\n'
+        '[  3] local 10.0.0.1 port 40000 connected with 10.0.0.2 port 5001\n'
+        '[ ID] Interval       Transfer     Bandwidth\n'
+        '[  3]  0.0- 1.0 sec   128 KBytes  1.05 Mbits/sec\n'
+        '[  3]  1.0- 2.0 sec   128 KBytes  1.05 Mbits/sec\n'
+        '[  3]  2.0- 3.0 sec   129 KBytes  1.06 Mbits/sec\n'
+        '[  3]  0.0- 3.0 sec   385 KBytes  1.05 Mbits/sec\n'
+        '[  3] Sent 268 datagrams\n'
+        '[  3] Server Report:\n'
+        '[  3]  0.0- 3.0 sec   385 KBytes  1.05 Mbits/sec   0.011 ms'
+        '    0/  268 (0%)\n'
+    )
+
+    exited = Popen('true', shell=True)
+    exited.wait()
+
+    enode = ShellEnode()
+    enode._lib_state_iperfstate = state = IperfState()
+
+    results = {}
+    for name, options in (
+            ('full', {}),
+            ('reduced', {'reduce': True}),
+            ('last', {'last': 1}),
+            ('last_two', {'last': 2})):
+        state.client_pids[1] = exited.pid
+        results[name] = client_stop(enode, batch=True, **options)
+
+    full = results['full']
+    assert results['reduced'] == full
+    for name, intervals in (('last', 1), ('last_two', 2)):
+        assert results[name]['client_port'] == '40000'
+        assert results[name]['summary'] == full['summary']
+        assert results[name]['server_report'] == full['server_report']
+        assert list(results[name]['traffic'].values()) == [
+            full['traffic'][str(index)]
+            for index in range(3 - intervals, 3)
+        ]
+
+
+def test_client_dualtest(tmpdir, monkeypatch):
+    """
+    Check the dual test options, and that reduced logs keep the headers
+    telling the forward and reverse traffic apart.
+    """
+    enode = FakeEnode()
+    client_start(enode, '10.0.0.2', 5001, dualtest=True, listen_port=5002)
+    assert ' -d -L 5002 ' in enode.commands[0]
+
+    monkeypatch.setattr(library, 'CLIENT_LOG', str(tmpdir.join(
+        'iperf_client-{}.log'
+    )))
+    tmpdir.join('iperf_client-1.log').write(
+        '------------------------------------------------------------\n'
+        'Server listening on TCP port 5001\n'
+        '------------------------------------------------------------\n'
+        '------------------------------------------------------------\n'
+        'Client connecting to 10.0.0.2, TCP port 5001\n'
+        '------------------------------------------------------------\n'
+        '[  3] local 10.0.0.1 port 50420 connected with 10.0.0.2 port 5001\n'
+        '[  5] local 10.0.0.1 port 5001 connected with 10.0.0.2 port 48610\n'
+        '[  3]  0.0- 1.0 sec  1.10 GBytes  9.45 Gbits/sec\n'
+        '[  5]  0.0- 1.0 sec  1.05 GBytes  9.02 Gbits/sec\n'
+        '[  3]  1.0- 2.0 sec  1.09 GBytes  9.36 Gbits/sec\n'
+        '[  5]  1.0- 2.0 sec  1.04 GBytes  8.93 Gbits/sec\n'
+        '[  3]  0.0- 2.0 sec  2.19 GBytes  9.40 Gbits/sec\n'
+        '[  5]  0.0- 2.0 sec  2.09 GBytes  8.97 Gbits/sec\n'
+    )
+
+    exited = Popen('true', shell=True)
+    exited.wait()
+
+    enode = ShellEnode()
+    enode._lib_state_iperfstate = state = IperfState()
+    state.client_pids[1] = exited.pid
+    result = client_stop(enode, batch=True, last=1)
+
+    assert result['client_port'] == '50420'
+    assert list(result['traffic'].values()) == [
+        {'transfer': '1.09 GBytes', 'bandwidth': '9.36 Gbits/sec'}
+    ]
+    assert result['reverse']['client_port'] == '48610'
+    assert result['reverse']['summary']['bandwidth'] == '8.97 Gbits/sec'
+
+
+def test_client_compressed_log(tmpdir, monkeypatch):
+    """
+    Check that a compressed log is written through the FIFO on the node,
+    and is fetched and decompressed as a stream by poll and stop.
+    """
+    log = str(tmpdir.join('iperf_client-1.log.gz'))
+    output = (
+        '[  3] local 10.0.0.1 port 40000 connected with 10.0.0.2 port 5001\n'
+        '[  3]  0.0- 1.0 sec  1.84 GBytes  15.8 Gbits/sec\n'
+        '[  3]  1.0- 2.0 sec  1.82 GBytes  15.6 Gbits/sec\n'
+        '[  3]  0.0- 2.0 sec  3.66 GBytes  15.7 Gbits/sec\n'
+    )
+
+    plain = tmpdir.join('output')
+    plain.write(output)
+
+    enode = ShellEnode()
+    enode(library._capture('cat {}'.format(plain), log, True))
+    enode(library._log_command(log, True, False, None))
+    assert not tmpdir.join('iperf_client-1.log.gz.fifo').check()
+
+    enode._lib_state_iperfstate = state = IperfState()
+    state.client_pids[1] = 1234
+    state.client_backends[1] = 'iperf'
+    state.client_logs[1] = (log, True)
+
+    records = library.client_poll(enode)
+    assert [kind for kind, _, _ in records] == [
+        'connection', 'traffic', 'traffic', 'summary'
+    ]
+
+    exited = Popen('true', shell=True)
+    exited.wait()
+    state.client_pids[1] = exited.pid
+    result = client_stop(enode, batch=True)
+    assert len(result['traffic']) == 2
+    assert result['summary']['transfer'] == '3.66 GBytes'
+
+
+def test_stop_all(tmpdir, monkeypatch):
+    """
+    Check that all the instances of a node are interrupted, escalating to
+    SIGKILL, and their logs fetched in a single shell invocation.
+    """
+    monkeypatch.setattr(library, 'SERVER_LOG', str(tmpdir.join(
+        'iperf_server-{}.log'
+    )))
+    for instance_id in (1, 2):
+        tmpdir.join('iperf_server-{}.log'.format(instance_id)).write(
+            '[  4] local 10.0.0.2 port 5001 connected with 10.0.0.1 port '
+            '4000{}\n'.format(instance_id)
+        )
+
+    graceful = Popen(['sh', '-c', 'trap "exit 0" INT; sleep 0.1; wait'])
+    stubborn = Popen(['sh', '-c', 'trap "" INT; sleep 30'])
+
+    enode = ShellEnode()
+    enode._lib_state_iperfstate = state = IperfState()
+    state.server_pids.update({1: graceful.pid, 2: stubborn.pid})
+
+    assert library.instances_running(enode) == {
+        'servers': {1: True, 2: True}, 'clients': {}
+    }
+
+    try:
+        results = library.stop_all(enode, timeout=0.5)
+    finally:
+        stubborn.kill()
+
+    assert graceful.wait() == 0
+    assert stubborn.wait() == -9
+    assert results['servers'][2]['client_port'] == '40002'
+    assert not state.server_pids
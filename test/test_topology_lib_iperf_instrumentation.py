@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2016 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Test the iperf instrumentation module.
+"""
+
+from __future__ import unicode_literals, absolute_import
+from __future__ import print_function, division
+
+from topology_lib_iperf.instrumentation import Histogram, Metrics, _hooks
+from topology_lib_iperf.library import (
+    client_start, client_stop, instances_running, server_start, server_wait
+)
+from topology_lib_iperf.parser import IperfParser, parse_iperf_client
+
+
+OUTPUT = (
+    '[  3] local 10.0.0.1 port 40000 connected with 10.0.0.2 port 5001\n'
+    '[  3]  0.0- 1.0 sec  1.84 GBytes  15.8 Gbits/sec\n'
+)
+
+
+class Enode(object):
+
+    def __init__(self, identifier):
+        self.identifier = identifier
+
+    def __call__(self, command, shell=None):
+        if command.startswith('cat '):
+            return OUTPUT
+        if 'echo ready' in command:
+            return 'ready'
+        return '[1] 1234' if command.startswith('iperf') else ''
+
+
+def test_histogram():
+    """
+    Check the histogram counts and percentile estimates.
+    """
+    histogram = Histogram()
+    for seconds in (0.001, 0.002, 0.003, 0.5):
+        histogram.add(seconds, 10)
+
+    summary = histogram.as_dict()
+    assert summary['count'] == 4
+    assert summary['bytes'] == 40
+    assert summary['max'] == 0.5
+    assert 0.002 <= summary['p50'] <= 0.004
+    assert summary['p99'] == 0.5
+
+
+def test_metrics():
+    """
+    Check that the library calls report their phases to the hooks, and
+    only while they are registered.
+    """
+    with Metrics() as metrics:
+        for identifier in ('hs1', 'hs2'):
+            enode = Enode(identifier)
+            client_start(enode, '10.0.0.2', 5001)
+            client_stop(enode)
+
+    assert not _hooks
+
+    summary = metrics.summary()
+    assert sorted(summary) == [
+        ('client_start', 'build'),
+        ('client_start', 'enode'),
+        ('client_start', 'pid'),
+        ('client_stop', 'enode'),
+        ('client_stop', 'fetch'),
+        ('client_stop', 'parse'),
+    ]
+    assert summary[('client_stop', 'fetch')]['count'] == 2
+    assert summary[('client_stop', 'fetch')]['bytes'] == 2 * len(OUTPUT)
+
+    assert [node for node, _ in metrics.slowest_nodes()] in (
+        ['hs1', 'hs2'], ['hs2', 'hs1']
+    )
+    assert metrics.histogram(node='hs1', phase='parse').count == 1
+
+
+def test_metrics_parser():
+    """
+    Check that the parsers report their parse phase once, and that the
+    readiness and running checks report their engine node calls.
+    """
+    with Metrics() as metrics:
+        parse_iperf_client(OUTPUT)
+        IperfParser('client').feed(OUTPUT)
+
+        enode = Enode('hs1')
+        server_start(enode, port=5001)
+        server_wait(enode)
+        instances_running(enode)
+        client_start(enode, '10.0.0.2', 5001)
+        client_stop(enode)
+
+    assert metrics.histogram(call='parse_iperf_client').bytes == len(OUTPUT)
+    assert metrics.histogram(call='IperfParser.feed').count == 1
+    assert metrics.summary(by=('node',))[(None,)]['count'] == 2
+
+    assert metrics.histogram(node='hs1', phase='parse').count == 1
+    assert metrics.histogram(node='hs1', call='server_wait').count == 1
+    assert metrics.histogram(node='hs1', call='instances_running').count == 1
@@ -22,7 +22,10 @@ Test the iperf parsing module.
 from __future__ import unicode_literals, absolute_import
 from __future__ import print_function, division
 
-from topology_lib_iperf.parser import (parse_iperf_server, parse_iperf_client)
+from topology_lib_iperf.parser import (
+    parse_iperf_server, parse_iperf_client, iter_iperf_client, IperfResult,
+    parse_iperf3_client
+)
 
 from deepdiff import DeepDiff
 
@@ -95,3 +98,389 @@ TCP window size: 2.50 MByte (default)
 
     dic_diff = DeepDiff(result, expected)
     assert not dic_diff
+
+
+def test_client_stream():
+
+    raw = """\
+------------------------------------------------------------
+Client connecting to 127.0.0.1, TCP port 5100
+TCP window size: 2.50 MByte (default)
+------------------------------------------------------------
+[  3] local 127.0.0.1 port 38040 connected with 127.0.0.1 port 5100
+[ ID] Interval       Transfer     Bandwidth
+[  3]  0.0- 1.0 sec  1.84 GBytes  15.8 Gbits/sec
+[  3]  1.0- 2.0 sec  1.82 GBytes  15.6 Gbits/sec"""
+
+    # Feed the output in small chunks that split lines at arbitrary points
+    chunks = (raw[i:i + 7] for i in range(0, len(raw), 7))
+    records = list(iter_iperf_client(chunks))
+
+    assert records == [
+        ('connection', '3', {
+            'client': '127.0.0.1',
+            'client_port': '38040',
+            'server': '127.0.0.1',
+            'server_port': '5100'
+        }),
+        ('traffic', '3', {
+            'transfer': '1.84 GBytes',
+            'bandwidth': '15.8 Gbits/sec'
+        }),
+        ('traffic', '3', {
+            'transfer': '1.82 GBytes',
+            'bandwidth': '15.6 Gbits/sec'
+        }),
+    ]
+
+    # Dictionary parsing accepts the same chunked input
+    result = parse_iperf_client(raw.splitlines(True))
+    assert result['server_port'] == '5100'
+    assert len(result['traffic']) == 2
+
+
+def test_server_text():
+
+    header = """\
+------------------------------------------------------------
+Server listening on TCP port 5100
+TCP window size: 85.3 KByte (default)
+------------------------------------------------------------
+[  4] local 127.0.0.1 port 5100 connected with 127.0.0.1 port 38040
+[ ID] Interval       Transfer     Bandwidth
+"""
+    lines = [
+        '[  4]  0.0- 1.0 sec  1.84 GBytes  15.8 Gbits/sec',
+        '[  4]  1.0- 2.0 sec  1.82 GBytes  15.6 Gbits/sec',
+        '[  4]  2.0- 3.0 sec  1.86 GBytes  16.0 Gbits/sec',
+        '[  4]  0.0- 3.0 sec  5.52 GBytes  15.8 Gbits/sec',
+    ]
+
+    # Whole outputs take a faster path than chunks, with the same results
+    outputs = [
+        header + '\n'.join(lines),
+        header + '\n'.join(lines[:3]) + '\n',
+        header + lines[0],
+        header + '\r\n'.join(lines) + '\r\nDone\r\n',
+        header + '\n'.join([lines[0], lines[3]]),
+        header + '\n'.join([lines[1], lines[0], lines[2], lines[3]]),
+        header + '\n'.join([lines[0], lines[2], lines[3]]),
+        header + '\n'.join(lines[:3] + [lines[0], lines[3]]),
+        header + '\n'.join(lines + [lines[2].replace('4]', '5]')]),
+        header.replace('[  4]', '[  5]') + '\n'.join(lines),
+        header,
+    ]
+    for raw in outputs:
+        result = parse_iperf_server(raw)
+        assert result == parse_iperf_server(raw.splitlines(True)), raw
+
+    result = parse_iperf_server(outputs[0])
+    assert len(result['traffic']) == 3
+    assert result['summary']['transfer'] == '5.52 GBytes'
+
+
+def test_server_numeric():
+
+    raw = """\
+------------------------------------------------------------
+Server listening on TCP port 5100
+TCP window size: 85.3 KByte (default)
+------------------------------------------------------------
+[  4] local 127.0.0.1 port 5100 connected with 127.0.0.1 port 38040
+[ ID] Interval       Transfer     Bandwidth
+[  4]  0.0- 1.0 sec  1.84 GBytes  15.8 Gbits/sec
+[  4]  1.0- 2.0 sec   512 KBytes  4.19 Mbits/sec
+    """
+    result = parse_iperf_server(raw, numeric=True)
+
+    expected = {
+        'server': '127.0.0.1',
+        'server_port': '5100',
+        'client': '127.0.0.1',
+        'client_port': '38040',
+        'traffic': {
+            '0': {
+                'start': 0.0,
+                'end': 1.0,
+                'bytes': 1975684956,
+                'bps': 15.8e9
+            },
+            '1': {
+                'start': 1.0,
+                'end': 2.0,
+                'bytes': 524288,
+                'bps': 4.19e6
+            }
+        }
+    }
+
+    dic_diff = DeepDiff(result, expected, significant_digits=6)
+    assert not dic_diff
+
+    # The compact result holds the same intervals in array columns
+    compact = parse_iperf_server(raw, compact=True)
+
+    assert isinstance(compact, IperfResult)
+    assert compact == result
+    assert list(compact['traffic']) == ['0', '1']
+    assert compact['traffic']['1'] == result['traffic']['1']
+    assert list(compact.bytes) == [1975684956, 524288]
+
+
+def test_server_udp_summary():
+
+    raw = """\
+------------------------------------------------------------
+Server listening on UDP port 5001
+Receiving 1470 byte datagrams
+UDP buffer size:  208 KByte (default)
+------------------------------------------------------------
+[  3] local 10.0.0.2 port 5001 connected with 10.0.0.1 port 45869
+[ ID] Interval       Transfer     Bandwidth       Jitter   Lost/Total Datagrams
+[  3]  0.0- 1.0 sec   128 KBytes  1.05 Mbits/sec   0.011 ms    0/   89 (0%)
+[  3]  1.0- 2.0 sec   128 KBytes  1.05 Mbits/sec   0.016 ms    2/   89 (2.2%)
+[  3]  0.0- 2.0 sec   256 KBytes  1.05 Mbits/sec   0.018 ms    2/  178 (1.1%)
+[  3]  0.0- 2.0 sec  1 datagrams received out-of-order
+"""
+    result = parse_iperf_server(raw)
+
+    expected = {
+        'server': '10.0.0.2',
+        'server_port': '5001',
+        'client': '10.0.0.1',
+        'client_port': '45869',
+        'traffic': {
+            '0': {
+                'transfer': '128 KBytes',
+                'bandwidth': '1.05 Mbits/sec',
+                'jitter': '0.011 ms',
+                'lost': '0',
+                'total': '89',
+                'loss': '0%'
+            },
+            '1': {
+                'transfer': '128 KBytes',
+                'bandwidth': '1.05 Mbits/sec',
+                'jitter': '0.016 ms',
+                'lost': '2',
+                'total': '89',
+                'loss': '2.2%'
+            }
+        },
+        'summary': {
+            'transfer': '256 KBytes',
+            'bandwidth': '1.05 Mbits/sec',
+            'jitter': '0.018 ms',
+            'lost': '2',
+            'total': '178',
+            'loss': '1.1%',
+            'out_of_order': '1'
+        }
+    }
+
+    dic_diff = DeepDiff(result, expected)
+    assert not dic_diff
+
+    compact = parse_iperf_server(raw, compact=True)
+    assert list(compact.loss) == [0.0, 2.2]
+    assert compact['summary']['out_of_order'] == 1
+    assert compact['summary']['total'] == 178
+    assert compact == parse_iperf_server(raw, numeric=True)
+
+
+def test_client_udp_server_report():
+
+    raw = """\
+------------------------------------------------------------
+Client connecting to 10.0.0.2, UDP port 5001
+Sending 1470 byte datagrams
+UDP buffer size:  208 KByte (default)
+------------------------------------------------------------
+[  3] local 10.0.0.1 port 45869 connected with 10.0.0.2 port 5001
+[ ID] Interval       Transfer     Bandwidth
+[  3]  0.0- 1.0 sec   129 KBytes  1.06 Mbits/sec
+[  3]  1.0- 2.0 sec   128 KBytes  1.05 Mbits/sec
+[  3]  0.0- 2.0 sec   257 KBytes  1.05 Mbits/sec
+[  3] Sent 179 datagrams
+[  3] Server Report:
+[  3]  0.0- 2.0 sec   256 KBytes  1.05 Mbits/sec   0.018 ms    1/  179 (0.56%)
+"""
+    result = parse_iperf_client(raw, numeric=True)
+
+    assert len(result['traffic']) == 2
+    assert result['summary']['bytes'] == 257 * 1024
+    assert result['server_report']['lost'] == 1
+    assert result['server_report']['loss'] == 0.56
+
+
+def test_client_parallel():
+
+    raw = """\
+------------------------------------------------------------
+Client connecting to 10.0.0.2, TCP port 5001
+TCP window size: 85.0 KByte (default)
+------------------------------------------------------------
+[  4] local 10.0.0.1 port 50422 connected with 10.0.0.2 port 5001
+[  3] local 10.0.0.1 port 50421 connected with 10.0.0.2 port 5001
+[ ID] Interval       Transfer     Bandwidth
+[  4]  0.0- 1.0 sec   560 MBytes  4.70 Gbits/sec
+[  3]  0.0- 1.0 sec   540 MBytes  4.53 Gbits/sec
+[SUM]  0.0- 1.0 sec  1.07 GBytes  9.23 Gbits/sec
+[  4]  1.0- 2.0 sec   558 MBytes  4.68 Gbits/sec
+[  3]  1.0- 2.0 sec   542 MBytes  4.55 Gbits/sec
+[SUM]  1.0- 2.0 sec  1.07 GBytes  9.23 Gbits/sec
+[  4]  0.0- 2.0 sec  1.09 GBytes  4.69 Gbits/sec
+[  3]  0.0- 2.0 sec  1.06 GBytes  4.54 Gbits/sec
+[SUM]  0.0- 2.0 sec  2.15 GBytes  9.23 Gbits/sec
+"""
+    result = parse_iperf_client(raw)
+
+    assert result['client_port'] == '50422'
+    assert result['traffic'] == {
+        '0': {'transfer': '1.07 GBytes', 'bandwidth': '9.23 Gbits/sec'},
+        '1': {'transfer': '1.07 GBytes', 'bandwidth': '9.23 Gbits/sec'},
+    }
+    assert result['summary']['transfer'] == '2.15 GBytes'
+
+    streams = result['streams']
+    assert sorted(streams) == ['3', '4']
+    assert streams['3']['client_port'] == '50421'
+    assert streams['3']['traffic']['1']['bandwidth'] == '4.55 Gbits/sec'
+    assert streams['4']['summary']['bandwidth'] == '4.69 Gbits/sec'
+
+    compact = parse_iperf_client(raw, compact=True)
+    assert compact == parse_iperf_client(raw, numeric=True)
+    assert list(compact.streams['3'].bps) == [4.53e9, 4.55e9]
+
+
+def test_client_dualtest():
+
+    raw = """\
+------------------------------------------------------------
+Server listening on TCP port 5001
+TCP window size: 85.3 KByte (default)
+------------------------------------------------------------
+------------------------------------------------------------
+Client connecting to 10.0.0.2, TCP port 5001
+TCP window size: 85.0 KByte (default)
+------------------------------------------------------------
+[  3] local 10.0.0.1 port 50420 connected with 10.0.0.2 port 5001
+[  5] local 10.0.0.1 port 5001 connected with 10.0.0.2 port 48610
+[ ID] Interval       Transfer     Bandwidth
+[  3]  0.0- 1.0 sec  1.10 GBytes  9.45 Gbits/sec
+[  5]  0.0- 1.0 sec  1.05 GBytes  9.02 Gbits/sec
+[  3]  1.0- 2.0 sec  1.09 GBytes  9.36 Gbits/sec
+[  5]  1.0- 2.0 sec  1.04 GBytes  8.93 Gbits/sec
+[  3]  0.0- 2.0 sec  2.19 GBytes  9.40 Gbits/sec
+[  5]  0.0- 2.0 sec  2.09 GBytes  8.97 Gbits/sec
+"""
+    result = parse_iperf_client(raw)
+
+    assert result['client_port'] == '50420'
+    assert result['direction'] == 'forward'
+    assert result['traffic']['1']['bandwidth'] == '9.36 Gbits/sec'
+    assert result['summary']['transfer'] == '2.19 GBytes'
+    assert 'streams' not in result
+
+    reverse = result['reverse']
+    assert reverse['direction'] == 'reverse'
+    assert reverse['server'] == '10.0.0.1'
+    assert reverse['client_port'] == '48610'
+    assert reverse['traffic']['1']['bandwidth'] == '8.93 Gbits/sec'
+    assert reverse['summary']['transfer'] == '2.09 GBytes'
+
+    compact = parse_iperf_client(raw, compact=True)
+    assert list(compact.bps) == [9.45e9, 9.36e9]
+    assert list(compact.reverse.bps) == [9.02e9, 8.93e9]
+
+
+def test_iperf3_client():
+
+    raw = """\
+{
+    "start": {
+        "connected": [{
+            "socket": 5,
+            "local_host": "127.0.0.1",
+            "local_port": 51236,
+            "remote_host": "127.0.0.1",
+            "remote_port": 5201
+        }],
+        "version": "iperf 3.9",
+        "test_start": {"protocol": "TCP", "num_streams": 1}
+    },
+    "intervals": [{
+        "streams": [{
+            "socket": 5, "start": 0, "end": 1.000121, "seconds": 1.000121,
+            "bytes": 2920577761, "bits_per_second": 23361793780.9,
+            "retransmits": 0, "snd_cwnd": 3195660, "omitted": false,
+            "sender": true
+        }],
+        "sum": {
+            "start": 0, "end": 1.000121, "seconds": 1.000121,
+            "bytes": 2920577761, "bits_per_second": 23361793780.9,
+            "retransmits": 0, "omitted": false, "sender": true
+        }
+    }, {
+        "streams": [{
+            "socket": 5, "start": 1.000121, "end": 2.000155,
+            "seconds": 1.000034, "bytes": 3081764864,
+            "bits_per_second": 24653280536.2, "retransmits": 2,
+            "snd_cwnd": 3195660, "omitted": false, "sender": true
+        }],
+        "sum": {
+            "start": 1.000121, "end": 2.000155, "seconds": 1.000034,
+            "bytes": 3081764864, "bits_per_second": 24653280536.2,
+            "retransmits": 2, "omitted": false, "sender": true
+        }
+    }],
+    "end": {
+        "streams": [{
+            "sender": {
+                "socket": 5, "start": 0, "end": 2.000155,
+                "seconds": 2.000155, "bytes": 6002342625,
+                "bits_per_second": 24007507060.1, "retransmits": 2,
+                "sender": true
+            },
+            "receiver": {
+                "socket": 5, "start": 0, "end": 2.000402,
+                "seconds": 2.000155, "bytes": 6001293312,
+                "bits_per_second": 24000343013.9, "sender": true
+            }
+        }],
+        "sum_sent": {
+            "start": 0, "end": 2.000155, "seconds": 2.000155,
+            "bytes": 6002342625, "bits_per_second": 24007507060.1,
+            "retransmits": 2, "sender": true
+        },
+        "sum_received": {
+            "start": 0, "end": 2.000402, "seconds": 2.000402,
+            "bytes": 6001293312, "bits_per_second": 24000343013.9,
+            "sender": true
+        },
+        "cpu_utilization_percent": {
+            "host_total": 21.3, "host_user": 0.4, "host_system": 20.9,
+            "remote_total": 43.1, "remote_user": 1.1, "remote_system": 42.0
+        }
+    }
+}
+"""
+    result = parse_iperf3_client(raw)
+
+    assert result['client_port'] == '51236'
+    assert result['server_port'] == '5201'
+    assert result['traffic']['1'] == {
+        'start': 1.000121,
+        'end': 2.000155,
+        'bytes': 3081764864,
+        'bps': 24653280536.2,
+        'retransmits': 2,
+        'snd_cwnd': 3195660
+    }
+    assert result['summary']['bytes'] == 6002342625
+    assert result['server_report']['bytes'] == 6001293312
+    assert result['cpu_utilization']['remote_total'] == 43.1
+
+    compact = parse_iperf3_client(raw, compact=True)
+    assert list(compact.bytes) == [2920577761, 3081764864]
+    assert compact['cpu_utilization'] == result['cpu_utilization']
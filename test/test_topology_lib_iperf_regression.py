@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2016 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Test the iperf regression detection module.
+"""
+
+from __future__ import unicode_literals, absolute_import
+from __future__ import print_function, division
+
+from random import Random
+
+from pytest import approx
+
+from topology_lib_iperf.parser import parse_iperf_server
+from topology_lib_iperf.regression import compare, mann_whitney
+
+
+def udp_log(jitters):
+    lines = [
+        '[  3] local 10.0.0.2 port 5001 connected with 10.0.0.1 port 40000'
+    ]
+    for second, jitter in enumerate(jitters):
+        lines.append(
+            '[  3] {:4.1f}-{:4.1f} sec   128 KBytes  1.05 Mbits/sec  '
+            '{:.3f} ms    0/   89 (0%)'.format(second, second + 1, jitter)
+        )
+    return '\n'.join(lines) + '\n'
+
+
+def test_mann_whitney():
+    """
+    Check the U test against known values, with ties.
+    """
+    test = mann_whitney([1, 2, 2, 3], [2, 3, 4, 5, 6])
+    assert test['u'] == 2.5
+    assert test['effect_size'] == approx(-0.75)
+    # z = (2.5 - 10 + 0.5) / sqrt(20 / 12 * (10 - 30 / 72)) = -1.7515
+    assert test['p_less'] == approx(0.0399, abs=1e-4)
+    assert test['p_greater'] > 0.9
+
+
+def test_compare():
+    """
+    Check that a bandwidth drop and a jitter increase are detected, while
+    noise around the baseline passes.
+    """
+    random = Random(42)
+    baseline = [random.gauss(15.8e9, 0.3e9) for _ in range(60)]
+
+    same = [random.gauss(15.8e9, 0.3e9) for _ in range(20)]
+    outcome = compare(same, baseline)
+    assert outcome['passed']
+
+    slower = [random.gauss(12.0e9, 0.3e9) for _ in range(20)]
+    outcome = compare(slower, baseline)
+    assert not outcome['passed']
+    assert outcome['effect_size'] == approx(-1.0)
+    assert outcome['change'] == approx(-0.24, abs=0.02)
+
+    # Faster is not a regression
+    assert compare([value * 1.3 for value in same], baseline)['passed']
+
+    base = [parse_iperf_server(udp_log(
+        [random.uniform(0.01, 0.02) for _ in range(10)]
+    ), numeric=True) for _ in range(3)]
+    noisy = parse_iperf_server(udp_log(
+        [random.uniform(0.05, 0.08) for _ in range(10)]
+    ), compact=True, numeric=True)
+    outcome = compare(noisy, base, metric='jitter')
+    assert not outcome['passed']
+    assert outcome['count'] == 10
+    assert outcome['baseline_count'] == 30
+
+    assert compare([], baseline)['passed']
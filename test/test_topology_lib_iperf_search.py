@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2016 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Test the UDP line rate search module.
+"""
+
+from __future__ import unicode_literals, absolute_import
+from __future__ import print_function, division
+
+from re import search
+
+from topology_lib_iperf import search as line_rate
+from topology_lib_iperf.parser import BATCH_MARKER
+
+
+CLIENT_LOG = (
+    '[  3] local 10.0.0.1 port 40000 connected with 10.0.0.2 port 5001\n'
+    '[  3]  0.0- 2.0 sec   256 KBytes  1.05 Mbits/sec\n'
+)
+
+
+class Node(object):
+    """
+    Engine node double answering with a function of the command.
+    """
+
+    def __init__(self, answer):
+        self.answer = answer
+
+    def __call__(self, command, shell=None):
+        return self.answer(command)
+
+
+class Link(object):
+    """
+    Simulated path dropping the traffic offered above its capacity.
+
+    :param float capacity: Rate carried without loss in bits per second.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.log = ''
+        self.probes = 0
+        self.server_commands = []
+        self.client_node = Node(self.client)
+        self.server_node = Node(self.server)
+
+    def client(self, command):
+        offered = search(r' -b (\d+)', command)
+        if offered:
+            self.probes += 1
+            self.transmit(float(offered.group(1)))
+            return '[1] 1234'
+        if 'cat ' in command:
+            return '{}\n{}'.format(BATCH_MARKER, CLIENT_LOG)
+        return ''
+
+    def server(self, command):
+        # Polls get the bytes after their offset, stripped like topology
+        # shells do
+        self.server_commands.append(command)
+        start = search(r'tail -c \+(\d+) ', command)
+        if start is not None:
+            return '{0}\n{1}\n{2}\n{1}\nalive 4321'.format(
+                len(self.log), BATCH_MARKER,
+                self.log[int(start.group(1)) - 1:]
+            ).strip()
+        return '[1] 4321'
+
+    def transmit(self, offered):
+        total = 1000
+        received = min(offered, self.capacity)
+        lost = int(round(total * (1 - received / offered)))
+        line = (
+            '[  3] {} {:.0f} bits/sec  0.010 ms  {:4d}/{:5d} ({:g}%)\n'
+        )
+        self.log += (
+            '[  3] local 10.0.0.2 port 5001 connected with 10.0.0.1 port '
+            '{}\n'.format(40000 + self.probes)
+        )
+        self.log += line.format(
+            ' 0.0- 1.0 sec   128 KBytes', received, lost, total,
+            100 * lost / total
+        )
+        self.log += line.format(
+            ' 0.0- 2.0 sec   256 KBytes', received, lost, total,
+            100 * lost / total
+        )
+
+
+def test_find_line_rate(monkeypatch):
+    """
+    Check that the search converges under the capacity of the path, with a
+    single server polled for the loss of every probe.
+    """
+    monkeypatch.setattr(line_rate, 'sleep', lambda seconds: None)
+
+    link = Link(capacity=700e6)
+    rate = line_rate.find_line_rate(
+        link.server_node, link.client_node, '10.0.0.2', start=100e6,
+        precision=0.02
+    )
+
+    assert 700e6 * 0.98 <= rate['bandwidth'] <= 700e6
+    assert rate['loss'] == 0
+    assert [probe['bandwidth'] for probe in rate['probes'][:4]] == [
+        100e6, 200e6, 400e6, 800e6
+    ]
+    assert not rate['probes'][3]['passed']
+    assert rate['probes'][3]['loss'] == 12.5
+    assert rate['probes'][3]['throughput'] == 700e6
+    assert len(rate['probes']) == link.probes
+
+    starts = [
+        command for command in link.server_commands
+        if command.startswith('iperf -s')
+    ]
+    assert len(starts) == 1
+    assert ' -u' in starts[0]
+
+
+def test_find_line_rate_maximum(monkeypatch):
+    """
+    Check that the ramp stops at the maximum rate when it passes.
+    """
+    monkeypatch.setattr(line_rate, 'sleep', lambda seconds: None)
+
+    link = Link(capacity=10e9)
+    rate = line_rate.find_line_rate(
+        link.server_node, link.client_node, '10.0.0.2', start=400e6,
+        maximum=1e9
+    )
+
+    assert [probe['bandwidth'] for probe in rate['probes']] == [
+        400e6, 800e6, 1e9
+    ]
+    assert rate['bandwidth'] == 1e9
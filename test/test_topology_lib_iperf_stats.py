@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2016 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Test the iperf statistics module.
+"""
+
+from __future__ import unicode_literals, absolute_import
+from __future__ import print_function, division
+
+from pytest import approx, importorskip
+
+from topology_lib_iperf import stats
+from topology_lib_iperf.parser import parse_iperf_client
+
+
+RAW = """\
+------------------------------------------------------------
+Client connecting to 127.0.0.1, TCP port 5100
+TCP window size: 2.50 MByte (default)
+------------------------------------------------------------
+[  3] local 127.0.0.1 port 38040 connected with 127.0.0.1 port 5100
+[ ID] Interval       Transfer     Bandwidth
+[  3]  0.0- 1.0 sec  1.84 GBytes  15.8 Gbits/sec
+[  3]  1.0- 2.0 sec  1.82 GBytes  15.6 Gbits/sec
+[  3]  2.0- 3.0 sec  1.17 GBytes  10.0 Gbits/sec
+[  3]  3.0- 4.0 sec  1.86 GBytes  16.0 Gbits/sec
+"""
+
+EMPTY = """\
+[  3] local 127.0.0.1 port 38040 connected with 127.0.0.1 port 5100
+"""
+
+
+def check_summaries(summaries):
+    text, compact, empty = summaries
+
+    assert text == compact
+    assert text['count'] == 4
+    assert text['mean'] == approx(14.35e9)
+    assert text['min'] == approx(10.0e9)
+    assert text['max'] == approx(16.0e9)
+    assert text['p50'] == approx(15.7e9)
+    assert text['p95'] == approx(15.97e9)
+    assert text['stddev'] == approx(2.51545e9, rel=1e-5)
+    assert text['cv'] == approx(text['stddev'] / text['mean'])
+
+    assert empty['count'] == 0
+    assert empty['p99'] is None
+
+
+def test_summarize_python(monkeypatch):
+    monkeypatch.setattr(stats, 'numpy', None)
+
+    check_summaries(stats.summarize([
+        parse_iperf_client(RAW),
+        parse_iperf_client(RAW, compact=True),
+        parse_iperf_client(EMPTY),
+    ]))
+
+    single = stats.summarize(parse_iperf_client(RAW, numeric=True))
+    assert single['count'] == 4
+
+
+def test_summarize_numpy():
+    importorskip('numpy')
+
+    check_summaries(stats.summarize([
+        parse_iperf_client(RAW),
+        parse_iperf_client(RAW, compact=True),
+        parse_iperf_client(EMPTY),
+    ]))
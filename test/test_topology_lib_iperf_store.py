@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2016 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Test the iperf result store module.
+"""
+
+from __future__ import unicode_literals, absolute_import
+from __future__ import print_function, division
+
+from math import isnan
+
+from topology_lib_iperf.parser import parse_iperf_client
+from topology_lib_iperf.store import ResultStore
+
+
+TCP = """\
+[  3] local 10.0.0.1 port 40000 connected with 10.0.0.2 port 5001
+[  3]  0.0- 1.0 sec  1.84 GBytes  15.8 Gbits/sec
+[  3]  1.0- 2.0 sec  1.82 GBytes  15.6 Gbits/sec
+[  3]  0.0- 2.0 sec  3.66 GBytes  15.7 Gbits/sec
+"""
+
+UDP = """\
+[  3] local 10.0.0.1 port 40001 connected with 10.0.0.2 port 5001
+[  3]  0.0- 1.0 sec   128 KBytes  1.05 Mbits/sec   0.011 ms    0/   89 (0%)
+"""
+
+
+def test_store(tmpdir):
+    """
+    Check that results in any form are appended with their metadata, read
+    back memory mapped, and survive an interrupted append.
+    """
+    path = str(tmpdir.join('history'))
+
+    with ResultStore(path) as store:
+        store.append(
+            parse_iperf_client(TCP, numeric=True), node='hs1', port=5001,
+            udp=False, bandwidth=None, duration=2
+        )
+        store.append(
+            parse_iperf_client(UDP, compact=True, numeric=True), node='hs1',
+            port=5001, udp=True, bandwidth='1M', duration=1
+        )
+        store.append(parse_iperf_client(TCP), node='hs2', udp=False)
+
+    # Columns written by an append interrupted before its commit
+    with tmpdir.join('history', 'bps.col').open('ab') as fd:
+        fd.write(b'\0' * 16)
+
+    with ResultStore(path) as store:
+        assert len(store) == 3
+
+        tcp = store.runs(udp=False)
+        assert [run['node'] for run in tcp] == ['hs1', 'hs2']
+        assert tcp[0]['connection']['client_port'] == '40000'
+        assert tcp[0]['summary']['bytes'] == 3929895076
+
+        assert store.values('bps', tcp) == [15.8e9, 15.6e9] * 2
+        assert isnan(store.values('start', tcp)[2])
+
+        udp = store.intervals(store.runs(udp=True)[0])
+        assert list(udp['lost']) == [0]
+        assert list(udp['total']) == [89]
+        assert isnan(store.intervals(tcp[0])['jitter'][0])
+
+        store.append(parse_iperf_client(UDP), node='hs3', udp=True)
+        assert len(store.column('bps')) == 6
+        assert store.values('total', store.runs(node='hs3')) == [89]
+
+
+def test_store_shared(tmpdir):
+    """
+    Check that stores of the same directory append after each other's runs.
+    """
+    path = str(tmpdir.join('history'))
+
+    with ResultStore(path) as first, ResultStore(path) as second:
+        first.append(parse_iperf_client(TCP), node='hs1')
+        second.append(parse_iperf_client(UDP), node='hs2')
+        first.append(parse_iperf_client(TCP), node='hs3')
+
+        assert [run['offset'] for run in first.runs()] == [0, 2, 3]
+        assert len(second) == 2
+
+    with ResultStore(path) as store:
+        assert [run['node'] for run in store.runs()] == ['hs1', 'hs2', 'hs3']
+        assert store.values('total', store.runs(node='hs2')) == [89]
+        assert store.values('bps', store.runs(node='hs3')) == [15.8e9, 15.6e9]
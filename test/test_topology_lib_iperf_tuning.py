@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2016 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Test the iperf tuning options module.
+"""
+
+from __future__ import unicode_literals, absolute_import
+from __future__ import print_function, division
+
+from pytest import raises
+
+from topology_lib_iperf.library import client_start, server_start
+from topology_lib_iperf.tuning import tuning_arguments
+
+
+class Enode(object):
+
+    def __init__(self):
+        self.commands = []
+
+    def __call__(self, command, shell=None):
+        self.commands.append(command)
+        return '[1] 1234'
+
+
+def test_tuning_arguments():
+    """
+    Check the arguments built for each backend and side.
+    """
+    tuning = {
+        'window': '4M', 'length': 131072, 'mss': 1460, 'nodelay': True,
+        'tos': '0x10', 'bind': '10.0.0.1', 'num': '1G', 'ipv6': True,
+    }
+    assert tuning_arguments(tuning, 'client') == [
+        '-B 10.0.0.1', '-V', '-l 131072', '-M 1460', '-N', '-n 1G',
+        '-S 0x10', '-w 4M',
+    ]
+    assert tuning_arguments(tuning, 'client', backend='iperf3')[1] == '-6'
+    assert tuning_arguments(
+        {'window': '256K', 'nodelay': False, 'tos': None}, 'server'
+    ) == ['-w 256K']
+
+    for tuning, side, udp in (
+            ({'window': '4X'}, 'client', False),
+            ({'window': 0}, 'client', False),
+            ({'mss': True}, 'client', False),
+            ({'tos': 256}, 'client', False),
+            ({'tos': 'high'}, 'client', False),
+            ({'bind': '10.0.0.1 -d'}, 'client', False),
+            ({'nodelay': 'yes'}, 'client', False),
+            ({'congestion': 'bbr'}, 'client', False),
+            ({'num': '1G'}, 'server', False),
+            ({'bind': 1}, 'client', False),
+            ({'mss': 1460}, 'client', True)):
+        with raises(AssertionError):
+            tuning_arguments(tuning, side, udp=udp)
+
+    # iperf3 servers take these from their clients
+    assert tuning_arguments({'bind': '::1'}, 'server', backend='iperf3') == [
+        '-B ::1'
+    ]
+    for name, value in (('window', '4M'), ('length', '128K'), ('mss', 1460)):
+        with raises(AssertionError):
+            tuning_arguments({name: value}, 'server', backend='iperf3')
+
+
+def test_tuned_commands():
+    """
+    Check that the tuning options are part of the started commands, and
+    that a byte count replaces the duration of the client.
+    """
+    enode = Enode()
+    server_start(enode, port=5001, tuning={'window': '4M', 'bind': '::1'})
+    client_start(
+        enode, '10.0.0.2', 5001, bandwidth='1G',
+        tuning={'num': '100M', 'length': '1470'}
+    )
+
+    assert enode.commands[0].startswith(
+        'iperf -s -p 5001 -i 1 -B ::1 -w 4M '
+    )
+    assert enode.commands[1].startswith(
+        'iperf -c 10.0.0.2 -p 5001 -i 1 -b 1G -l 1470 -n 100M '
+    )
+
+    with raises(AssertionError):
+        client_start(enode, '10.0.0.2', 5001, bandwidth='1G',
+                     tuning={'nodelay': True})